@@ -0,0 +1,366 @@
+import os
+import json
+import argparse
+import logging
+import tempfile
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dotenv import load_dotenv
+from google.api_core.exceptions import FailedPrecondition
+
+# Load .env before importing modules that read their configuration at import time
+load_dotenv()
+
+from app.services.executor import cpu_executor
+from app.services.features import extract_mask_features
+from app.services.firebase import get_bucket, get_db
+from app.services.model import LoadedModel, current_model, preprocess_image
+from app.services.pipeline import decode_image, encode_mask, mask_file_name
+from app.services.registry import model_registry
+from app.utils.config import INFERENCE_MAX_BATCH_SIZE
+from app.utils.mask_codec import MASK_CONTENT_TYPE
+
+# Where /predict and /predict_batch store the uploaded originals and the masks
+IMAGE_PREFIX = "procare-images/image/"
+MASK_DIRECTORY = "procare-images/mask"
+ORIGINAL_SUFFIX = "_original.jpg"
+
+# Firestore allows at most 500 writes per batch
+MAX_BATCH_WRITES = 400
+
+def _base_name(blob_name):
+    # "procare-images/image/<uid>_<ts>[_<i>]_original.jpg" -> "<uid>_<ts>[_<i>]"
+    file_name = blob_name[len(IMAGE_PREFIX):]
+    if "/" in file_name or not file_name.endswith(ORIGINAL_SUFFIX):
+        return None
+    return file_name[:-len(ORIGINAL_SUFFIX)]
+
+def _candidate_user_ids(base_name):
+    """
+    User IDs that may own an original. Base names are "<uid>_<ts>" (/predict) or
+    "<uid>_<ts>_<i>" (/predict_batch), and user IDs created through the Admin SDK
+    may contain underscores themselves, so both readings are returned; the
+    original's URL in the user's records decides which one owns it.
+    """
+    candidates = []
+    head = base_name
+    for _ in range(2):
+        head, separator, number = head.rpartition("_")
+        if not separator or not head or not number.isdigit():
+            break
+        candidates.append(head)
+    return candidates
+
+class BackfillCheckpoint:
+    """
+    Progress of a backfill run, saved after every committed batch.
+
+    Originals are listed in name order, so everything up to `last_blob` is done.
+    A checkpoint written for another model version is ignored.
+    """
+
+    def __init__(self, path, model_version):
+        self.path = path
+        self.model_version = model_version
+        self.last_blob = None
+        self.counts = {"updated": 0, "skipped": 0, "orphaned": 0, "failed": 0}
+
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get("model_version") == model_version:
+                self.last_blob = state.get("last_blob")
+                self.counts.update(state.get("counts", {}))
+            else:
+                logging.info(f"Ignoring checkpoint for model {state.get('model_version')}; starting over")
+
+    def save(self):
+        if not self.path:
+            return
+        # Replace the file atomically so a crash never leaves a truncated checkpoint
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"model_version": self.model_version, "last_blob": self.last_blob, "counts": self.counts}, f)
+        os.replace(tmp_path, self.path)
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _list_originals(bucket, after=None):
+    # Stored originals in name order, resuming after the checkpointed one
+    for blob in bucket.list_blobs(prefix=IMAGE_PREFIX):
+        if (after is None or blob.name > after) and _base_name(blob.name):
+            yield blob
+
+def _load_records(db, pool, user_ids, with_patients=True):
+    """
+    Read the user documents and, optionally, the patient documents of the given users.
+
+    Returns:
+        tuple: ({user_id: user snapshot}, {user_id: [patient snapshots]}).
+    """
+    users = db.collection('users-procare')
+    patients = db.collection('patients')
+    user_docs = pool.map(lambda uid: users.document(uid).get(), user_ids)
+    patient_docs = (
+        pool.map(lambda uid: list(patients.where('doctor_id', '==', uid).stream()), user_ids)
+        if with_patients else [[] for _ in user_ids]
+    )
+    return dict(zip(user_ids, user_docs)), dict(zip(user_ids, patient_docs))
+
+def _predict(model, image_data):
+    """
+    Predict masks for a list of JPEG uploads in batched forward passes.
+
+    Returns:
+        list: (mask bytes, features) per image, or the exception raised while decoding it.
+    """
+    def prepare(data):
+        try:
+            return preprocess_image(decode_image(BytesIO(data)))
+        except Exception as e:
+            return e
+
+    # PIL and NumPy release the GIL, so decoding and encoding run on the shared CPU pool
+    inputs = list(cpu_executor.map(prepare, image_data))
+    valid = [i for i, item in enumerate(inputs) if not isinstance(item, Exception)]
+
+    results = list(inputs)
+    for chunk in _chunks(valid, INFERENCE_MAX_BATCH_SIZE):
+        predictions = model.predict(np.concatenate([inputs[i] for i in chunk], axis=0))[..., 0]
+        encoded = cpu_executor.map(
+            lambda pair: (encode_mask(pair[0]), extract_mask_features(pair[0], pair[1][0, ..., 0])),
+            zip(predictions, (inputs[i] for i in chunk)),
+        )
+        for i, result in zip(chunk, encoded):
+            results[i] = result
+    return results
+
+def _apply_result(entry, result, model_version):
+    # Point an image entry at the new mask; returns whether anything changed
+    if not isinstance(entry, dict) or entry.get('original_image_url') not in result:
+        return False
+    entry.update(result[entry['original_image_url']], model_version=model_version)
+    return True
+
+def _record_updates(user_docs, patient_docs, results, model_version):
+    """
+    Build the document updates for a batch of new masks.
+
+    Args:
+        results (dict): New `mask_image_url` and `features` keyed by original image URL.
+
+    Returns:
+        list: (snapshot, fields) pairs to write.
+    """
+    updates = []
+    for user_id, snapshot in user_docs.items():
+        if snapshot.exists:
+            images = [dict(entry) if isinstance(entry, dict) else entry for entry in snapshot.get('images') or []]
+            if sum(_apply_result(entry, results, model_version) for entry in images):
+                updates.append((snapshot, {'images': images}))
+
+        for patient in patient_docs[user_id]:
+            data = patient.to_dict()
+            fields = {}
+            if isinstance(data.get('results'), dict):
+                patient_results = dict(data['results'])
+                if _apply_result(patient_results, results, model_version):
+                    fields['results'] = patient_results
+            if data.get('study_results'):
+                study_results = [dict(entry) if isinstance(entry, dict) else entry for entry in data['study_results']]
+                if sum(_apply_result(entry, results, model_version) for entry in study_results):
+                    fields['study_results'] = study_results
+            if fields:
+                updates.append((patient, fields))
+    return updates
+
+def _commit_updates(db, pool, user_ids, results, model_version, attempts=3):
+    """
+    Point the records of `user_ids` at the new masks in batched writes.
+
+    The documents are read right before writing and every write only applies if
+    the document is unchanged since, so a concurrent /predict appending to the
+    same user is never lost; on a conflict the documents are read again.
+
+    Returns:
+        int: Number of documents written.
+    """
+    for attempt in range(attempts):
+        user_docs, patient_docs = _load_records(db, pool, user_ids)
+        updates = _record_updates(user_docs, patient_docs, results, model_version)
+        try:
+            for chunk in _chunks(updates, MAX_BATCH_WRITES):
+                batch = db.batch()
+                for snapshot, fields in chunk:
+                    batch.update(snapshot.reference, fields,
+                                 option=db.write_option(last_update_time=snapshot.update_time))
+                batch.commit()
+            return len(updates)
+        except FailedPrecondition:
+            if attempt == attempts - 1:
+                raise
+            logging.info("Records changed while updating them; retrying")
+
+def backfill_masks(bucket, db, model, checkpoint_path=None, batch_size=64, io_workers=16,
+                   limit=None, dry_run=False):
+    """
+    Re-segment the stored originals with `model` and point their user and
+    patient records at the new masks.
+
+    Originals are processed `batch_size` at a time: the batch's records are read,
+    each original is matched to its user by its URL in the user's images,
+    originals whose entry already carries the model's version are skipped, the
+    rest are downloaded over `io_workers` threads and predicted in batched
+    forward passes, and the new masks are uploaded next to the old ones under
+    version-suffixed file names, so the old masks stay intact until the records
+    are switched over. The records are then updated in batched writes and the
+    checkpoint moves past the batch. The next batch is downloaded while the
+    current one is predicted.
+
+    The clients are passed in, so the backfill runs unchanged against the
+    Firestore and Storage emulators (FIRESTORE_EMULATOR_HOST,
+    STORAGE_EMULATOR_HOST) or local fakes.
+
+    Args:
+        bucket: Storage bucket holding the originals and masks.
+        db: Firestore client.
+        model (LoadedModel): Model to predict with; its version is stamped on the records.
+        checkpoint_path (str, optional): File to resume from and save progress to.
+        batch_size (int): Originals per batch.
+        io_workers (int): Concurrent downloads, uploads and document reads.
+        limit (int, optional): Stop after this many originals.
+        dry_run (bool): Count what would be updated without predicting or writing.
+
+    Returns:
+        dict: Number of originals updated, skipped (already on the version),
+        orphaned (no user record refers to them) and failed.
+    """
+    checkpoint = BackfillCheckpoint(None if dry_run else checkpoint_path, model.version)
+    if checkpoint.last_blob:
+        logging.info(f"Resuming after {checkpoint.last_blob} with {checkpoint.counts}")
+
+    blobs = list(_list_originals(bucket, checkpoint.last_blob))
+    if limit is not None:
+        blobs = blobs[:limit]
+    logging.info(f"{len(blobs)} stored originals to check against model {model.version}")
+    counts = checkpoint.counts
+
+    with ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="backfill-io") as pool:
+
+        def select(batch):
+            # Find the originals still missing the new model and start downloading them
+            candidates = sorted({uid for blob in batch for uid in _candidate_user_ids(_base_name(blob.name))})
+            user_docs, _ = _load_records(db, pool, candidates, with_patients=False)
+            entries = {}
+            for user_id, snapshot in user_docs.items():
+                if snapshot.exists:
+                    for entry in snapshot.get('images') or []:
+                        if isinstance(entry, dict) and entry.get('original_image_url'):
+                            entries[entry['original_image_url']] = (user_id, entry)
+
+            todo, owners, skipped, orphaned = [], set(), 0, 0
+            for blob in batch:
+                user_id, entry = entries.get(blob.public_url, (None, None))
+                if entry is None:
+                    orphaned += 1
+                elif entry.get('model_version') == model.version:
+                    skipped += 1
+                else:
+                    todo.append(blob)
+                    owners.add(user_id)
+            downloads = [] if dry_run else [pool.submit(blob.download_as_bytes) for blob in todo]
+            return sorted(owners), todo, downloads, skipped, orphaned
+
+        batches = list(_chunks(blobs, max(batch_size, 1)))
+        selected = select(batches[0]) if batches else None
+        for index, batch in enumerate(batches):
+            user_ids, todo, downloads, skipped, orphaned = selected
+            counts["skipped"] += skipped
+            counts["orphaned"] += orphaned
+            if dry_run:
+                counts["updated"] += len(todo)
+                selected = select(batches[index + 1]) if index + 1 < len(batches) else None
+                continue
+
+            image_data, downloaded = [], []
+            for blob, download in zip(todo, downloads):
+                try:
+                    image_data.append(download.result())
+                    downloaded.append(blob)
+                except Exception as e:
+                    logging.error(f"Could not download {blob.name}: {e}")
+                    counts["failed"] += 1
+
+            # Start on the next batch's reads and downloads while this one is predicted
+            selected = select(batches[index + 1]) if index + 1 < len(batches) else None
+
+            # Predict, then upload the masks under new, version-suffixed names; the
+            # records switch to them only in the conditional commit, so a failed
+            # commit or a crash never leaves a record describing a replaced mask
+            uploads = []
+            for blob, result in zip(downloaded, _predict(model, image_data)):
+                if isinstance(result, Exception):
+                    logging.error(f"Could not process {blob.name}: {result}")
+                    counts["failed"] += 1
+                    continue
+                mask_bytes, features = result
+                mask_blob = bucket.blob(f"{MASK_DIRECTORY}/{mask_file_name(_base_name(blob.name), model.version)}")
+                upload = pool.submit(mask_blob.upload_from_string, mask_bytes, content_type=MASK_CONTENT_TYPE)
+                uploads.append((blob, mask_blob, features, upload))
+
+            results = {}
+            for blob, mask_blob, features, upload in uploads:
+                try:
+                    upload.result()
+                except Exception as e:
+                    logging.error(f"Could not upload the mask for {blob.name}: {e}")
+                    counts["failed"] += 1
+                    continue
+                results[blob.public_url] = {'mask_image_url': mask_blob.public_url, 'features': features}
+
+            if results:
+                _commit_updates(db, pool, user_ids, results, model.version)
+                counts["updated"] += len(results)
+
+            # Only a batch whose records are committed counts as done
+            checkpoint.last_blob = batch[-1].name
+            checkpoint.save()
+            logging.info(f"Backfilled up to {batch[-1].name}: {counts}")
+
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-segment stored originals with the current model and update their records.")
+    parser.add_argument("--version", help="Registry version to run; defaults to the served model.")
+    parser.add_argument("--checkpoint", default="backfill_checkpoint.json", help="Progress file to resume from.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Originals per batch.")
+    parser.add_argument("--io-workers", type=int, default=16, help="Concurrent downloads, uploads and reads.")
+    parser.add_argument("--limit", type=int, help="Stop after this many originals.")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would change without writing.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.version:
+        if model_registry is None:
+            parser.error("--version needs MODEL_REGISTRY_DIR.")
+        model = LoadedModel(model_registry.spec(args.version))
+    else:
+        model = current_model()
+
+    counts = backfill_masks(
+        get_bucket(), get_db(), model,
+        checkpoint_path=args.checkpoint,
+        batch_size=args.batch_size,
+        io_workers=args.io_workers,
+        limit=args.limit,
+        dry_run=args.dry_run,
+    )
+    print(f"Backfill with model {model.version}: {counts}")
+
+if __name__ == "__main__":
+    main()
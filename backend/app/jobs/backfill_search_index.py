@@ -0,0 +1,68 @@
+import argparse
+import logging
+from dotenv import load_dotenv
+
+# Load .env before importing modules that read their configuration at import time
+load_dotenv()
+
+from firebase_admin import firestore
+from app.services.firebase import get_db
+from app.utils.encryption import decrypt_many
+from app.utils.search_index import name_index_fields
+
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 400
+
+def backfill_search_index(page_size=BATCH_SIZE, force=False):
+    """
+    Add the blind-index search fields to patient documents written before they existed.
+
+    Args:
+        page_size (int): Documents read and updated per batch.
+        force (bool): Recompute the fields even for documents that already have them,
+            e.g. after changing SEARCH_INDEX_KEY.
+
+    Returns:
+        int: Number of documents updated.
+    """
+    db = get_db()
+    query = db.collection('patients').order_by(firestore.FieldPath.document_id()).limit(page_size)
+
+    updated = 0
+    last_doc = None
+    while True:
+        page = list((query.start_after(last_doc) if last_doc else query).stream())
+        if not page:
+            break
+
+        pending = []
+        for doc in page:
+            data = doc.to_dict()
+            if data.get('name') and ('name_index' not in data or force):
+                pending.append((doc.reference, data['name']))
+
+        if pending:
+            names = decrypt_many([name for _, name in pending])
+            batch = db.batch()
+            for (reference, _), name in zip(pending, names):
+                batch.update(reference, name_index_fields(name))
+            batch.commit()
+            updated += len(pending)
+            logging.info(f"Indexed {updated} patient documents so far")
+
+        last_doc = page[-1]
+
+    return updated
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill blind-index search fields on patient documents.")
+    parser.add_argument("--page-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--force", action="store_true", help="Recompute existing search fields.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    updated = backfill_search_index(args.page_size, args.force)
+    print(f"Updated {updated} patient documents")
+
+if __name__ == "__main__":
+    main()
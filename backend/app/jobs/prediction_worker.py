@@ -0,0 +1,58 @@
+import asyncio
+import argparse
+import logging
+import signal
+from dotenv import load_dotenv
+
+# Load .env before importing modules that read their configuration at import time
+load_dotenv()
+
+from app.services.executor import run_cpu, run_io
+from app.services.firebase import init_firebase
+from app.services.jobs import JobWorkerPool, job_store
+from app.services.model import inference_engine, warm_up
+from app.services.openai import report_service
+from app.services.rollout import watch_models
+from app.utils.config import JOB_WORKERS, MODEL_RELOAD_POLL_SECONDS
+
+async def run_workers(concurrency=JOB_WORKERS):
+    """
+    Process queued jobs until SIGINT or SIGTERM, without serving the API.
+
+    Run as many of these as needed next to an API started with JOB_WORKERS=0;
+    they share the queue through the SQLite database at JOB_DB_PATH.
+
+    Args:
+        concurrency (int): Jobs processed at once by this process.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    # Load the model and initialize Firebase before taking jobs
+    await run_io(init_firebase)
+    await run_cpu(warm_up)
+
+    workers = JobWorkerPool(job_store, concurrency=concurrency)
+    workers.start()
+    watch_task = asyncio.create_task(watch_models()) if MODEL_RELOAD_POLL_SECONDS > 0 else None
+    try:
+        await stop.wait()
+    finally:
+        if watch_task is not None:
+            watch_task.cancel()
+        await workers.stop()
+        await inference_engine.stop()
+        await report_service.aclose()
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued prediction and report jobs.")
+    parser.add_argument("--concurrency", type=int, default=max(JOB_WORKERS, 1), help="Jobs processed at once.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_workers(args.concurrency))
+
+if __name__ == "__main__":
+    main()
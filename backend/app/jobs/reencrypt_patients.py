@@ -0,0 +1,89 @@
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Load .env before importing modules that read their configuration at import time
+load_dotenv()
+
+from firebase_admin import firestore
+from app.services.firebase import get_db
+from app.utils.encryption import KEY_VERSION, decrypt_many, encrypt_many_versioned, needs_reencryption
+
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 400
+
+def reencrypt_patients(version=KEY_VERSION, page_size=BATCH_SIZE, max_pending_commits=4, dry_run=False):
+    """
+    Re-encrypt every patient name that is legacy ECB or under another key version.
+
+    Pages are read in document ID order. Each page is decrypted and re-encrypted in
+    bulk and committed as one batch; commits run in the background while the next
+    page is read, with at most `max_pending_commits` in flight.
+
+    Args:
+        version (int): Key version to encrypt under.
+        page_size (int): Documents read and written per batch.
+        max_pending_commits (int): Batch commits allowed in flight at once.
+        dry_run (bool): Count the documents that would change without writing.
+
+    Returns:
+        int: Number of documents re-encrypted (or that would be, for a dry run).
+    """
+    db = get_db()
+    query = db.collection('patients').order_by(firestore.FieldPath.document_id()).limit(page_size)
+
+    updated = 0
+    last_doc = None
+    pending_commits = []
+    with ThreadPoolExecutor(max_workers=max_pending_commits) as pool:
+        while True:
+            page = list((query.start_after(last_doc) if last_doc else query).stream())
+            if not page:
+                break
+            last_doc = page[-1]
+
+            stale = []
+            for doc in page:
+                name = doc.to_dict().get('name')
+                if name and needs_reencryption(name, version):
+                    stale.append((doc.reference, name))
+            if not stale:
+                continue
+
+            updated += len(stale)
+            if dry_run:
+                continue
+
+            names = decrypt_many([name for _, name in stale])
+            encrypted = encrypt_many_versioned(names, version)
+
+            batch = db.batch()
+            for (reference, _), value in zip(stale, encrypted):
+                batch.update(reference, {'name': value})
+
+            # Wait for the oldest commit before queueing another one past the limit
+            if len(pending_commits) >= max_pending_commits:
+                pending_commits.pop(0).result()
+            pending_commits.append(pool.submit(batch.commit))
+            logging.info(f"Re-encrypted {updated} patient names so far")
+
+        for commit in pending_commits:
+            commit.result()
+
+    return updated
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-encrypt patient names under the current key version.")
+    parser.add_argument("--version", type=int, default=KEY_VERSION, help="Key version to encrypt under.")
+    parser.add_argument("--page-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-pending-commits", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true", help="Only count the documents that would change.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    updated = reencrypt_patients(args.version, args.page_size, args.max_pending_commits, args.dry_run)
+    print(f"{'Would re-encrypt' if args.dry_run else 'Re-encrypted'} {updated} patient documents")
+
+if __name__ == "__main__":
+    main()
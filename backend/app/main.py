@@ -1,13 +1,69 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+import time
 from dotenv import load_dotenv
-from app.routes import prediction
 
+# Load .env before importing modules that read their configuration at import time
 load_dotenv()
+
+from app.routes import prediction, health, jobs
+from app.services.model import inference_engine, warm_up
+from app.services.firebase import init_firebase
+from app.services.executor import run_cpu, run_io
+from app.services.openai import report_service
+from app.services.jobs import job_workers
+from app.services.rollout import watch_models
+from app.utils.config import WARMUP_ON_STARTUP, MAX_REQUEST_BYTES, JOB_WORKERS, MODEL_RELOAD_POLL_SECONDS
+from app.utils.metrics import REQUEST_SECONDS
+from app.utils.profiling import profile_requests
+
+async def _warm_up(app: FastAPI):
+    # Load the model and initialize Firebase off the event loop
+    try:
+        await run_io(init_firebase)
+        await run_cpu(warm_up)
+        app.state.ready = True
+        logging.info("Model warm-up complete")
+    except Exception as e:
+        logging.error(f"Model warm-up failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    warm_up_task = None
+    if WARMUP_ON_STARTUP:
+        # Warm up in the background so the server starts answering liveness probes
+        # right away while readiness reports 503 until the model is loaded
+        warm_up_task = asyncio.create_task(_warm_up(app))
+    else:
+        app.state.ready = True
+    # Process queued jobs in this process too; set JOB_WORKERS=0 to run them
+    # only in separate workers (app/jobs/prediction_worker.py)
+    if JOB_WORKERS > 0:
+        job_workers.start()
+    # Pick up new model versions without a restart; set MODEL_RELOAD_POLL_SECONDS=0 to disable
+    watch_task = None
+    if MODEL_RELOAD_POLL_SECONDS > 0:
+        watch_task = asyncio.create_task(watch_models())
+    yield
+    app.state.ready = False
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    if watch_task is not None:
+        watch_task.cancel()
+    await job_workers.stop()
+    await inference_engine.stop()
+    await report_service.aclose()
+
 app = FastAPI(
     title="Image Prediction API",
     description="API to predict masks using a pre-trained model.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 origins = [
@@ -23,7 +79,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized bodies before they are spooled
+@app.middleware("http")
+async def limit_request_size(request: Request, call_next):
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_REQUEST_BYTES:
+        return JSONResponse(status_code=413, content={"detail": "Request body is too large."})
+    return await call_next(request)
+
+# Record end-to-end latency per route template, so path parameters don't explode the label set
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_SECONDS.labels(
+            request.method, route.path if route is not None else "unmatched", str(status)
+        ).observe(time.perf_counter() - start)
+
+# Profile a sample of requests when PROFILE_SAMPLE_RATE is set
+app.middleware("http")(profile_requests)
+
 app.include_router(prediction.router)
+app.include_router(jobs.router)
+app.include_router(health.router)
 
 # Home route (optional)
 @app.get("/")
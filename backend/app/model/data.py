@@ -0,0 +1,26 @@
+import os
+
+# File types picked up when scanning the dataset directories
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+def _sort_key(filename):
+    # Order "2.jpg" before "10.jpg" while still handling non-numeric names
+    stem = os.path.splitext(filename)[0]
+    return (0, int(stem), filename) if stem.isdigit() else (1, 0, filename)
+
+# Discover image/mask pairs instead of assuming a fixed naming range
+def discover_pairs(images_dir, labels_dir):
+    """
+    Find every image in `images_dir` that has a mask with the same file name in `labels_dir`.
+    Returns two parallel lists of image paths and mask paths.
+    """
+    image_paths = []
+    mask_paths = []
+    for filename in sorted(os.listdir(images_dir), key=_sort_key):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        mask_path = os.path.join(labels_dir, filename)
+        if os.path.exists(mask_path):
+            image_paths.append(os.path.join(images_dir, filename))
+            mask_paths.append(mask_path)
+    return image_paths, mask_paths
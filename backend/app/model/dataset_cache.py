@@ -0,0 +1,125 @@
+import os
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from app.model.data import discover_pairs
+
+# Set image size for resizing (matches train.py)
+IMG_SIZE = (256, 256)
+
+# Format version written to index.json
+CACHE_VERSION = 1
+
+def _load_resized(path, size):
+    # Grayscale + nearest-neighbour resize, matching load_img in train.py
+    with Image.open(path) as image:
+        return np.asarray(image.convert("L").resize(size, Image.NEAREST), dtype=np.uint8)
+
+def build_cache(images_dir, labels_dir, output_dir, size=IMG_SIZE, workers=None):
+    """
+    Decode, resize and store every image/mask pair once in a memory-mapped store.
+
+    The store holds `images.npy` (uint8 grayscale), `masks.npy` (uint8, 0 or 1)
+    and `index.json` listing the file names in row order.
+
+    Args:
+        images_dir (str): Directory with the input images.
+        labels_dir (str): Directory with the ground truth masks.
+        output_dir (str): Directory to write the store to.
+        size (tuple): (width, height) to resize to.
+        workers (int, optional): Number of decoding threads.
+
+    Returns:
+        int: Number of pairs written.
+    """
+    image_paths, mask_paths = discover_pairs(images_dir, labels_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    count = len(image_paths)
+    shape = (count, size[1], size[0])
+    images = np.lib.format.open_memmap(os.path.join(output_dir, "images.npy"), mode="w+", dtype=np.uint8, shape=shape)
+    masks = np.lib.format.open_memmap(os.path.join(output_dir, "masks.npy"), mode="w+", dtype=np.uint8, shape=shape)
+
+    def convert(i):
+        images[i] = _load_resized(image_paths[i], size)
+        # Binarize the mask the same way train.py does (round of value / 255)
+        masks[i] = _load_resized(mask_paths[i], size) >= 128
+
+    # PIL releases the GIL while decoding, so threads scale across cores
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        list(pool.map(convert, range(count)))
+
+    images.flush()
+    masks.flush()
+    del images, masks
+
+    index = {
+        "version": CACHE_VERSION,
+        "image_size": [size[1], size[0]],
+        "count": count,
+        "files": [os.path.basename(path) for path in image_paths],
+    }
+    # Write the index last so a partially written store is never picked up
+    with open(os.path.join(output_dir, "index.json"), "w") as f:
+        json.dump(index, f)
+
+    return count
+
+class MemmapDataset:
+    """
+    Read-only view over a store written by `build_cache`.
+
+    `images` and `masks` are memory-mapped uint8 arrays, so slicing them only
+    touches the pages that are read and copies nothing up front.
+    """
+
+    def __init__(self, cache_dir):
+        with open(os.path.join(cache_dir, "index.json")) as f:
+            self.index = json.load(f)
+        if self.index.get("version") != CACHE_VERSION:
+            raise ValueError(f"Unsupported dataset cache version in {cache_dir}")
+
+        self.images = np.load(os.path.join(cache_dir, "images.npy"), mmap_mode="r")
+        self.masks = np.load(os.path.join(cache_dir, "masks.npy"), mmap_mode="r")
+        self.names = self.index["files"]
+        self._positions = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def position(self, name):
+        """
+        Row of the given file name, or None if it is not in the store.
+        """
+        return self._positions.get(name)
+
+    def batch(self, indices):
+        """
+        Load a batch in the model's input format.
+
+        Args:
+            indices (slice or array-like): Rows to load.
+
+        Returns:
+            tuple: (images, masks) as float32 arrays of shape (N, H, W, 1),
+            images normalized to [0, 1] and masks binary.
+        """
+        images = self.images[indices].astype(np.float32)[..., np.newaxis] / 255.0
+        masks = self.masks[indices].astype(np.float32)[..., np.newaxis]
+        return images, masks
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert an image/mask dataset into a memory-mapped store.")
+    parser.add_argument("images_dir", help="Directory with the input images.")
+    parser.add_argument("labels_dir", help="Directory with the ground truth masks (same file names).")
+    parser.add_argument("output_dir", help="Directory to write the store to.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of decoding threads.")
+    args = parser.parse_args()
+
+    count = build_cache(args.images_dir, args.labels_dir, args.output_dir, workers=args.workers)
+    print(f"Wrote {count} image/mask pairs to {args.output_dir}")
+
+if __name__ == "__main__":
+    main()
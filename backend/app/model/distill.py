@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+from sklearn.model_selection import train_test_split
+from tensorflow.keras.callbacks import EarlyStopping
+from app.model.data import discover_pairs
+from app.model.dataset_cache import MemmapDataset
+from app.model.train import light_unet_model, make_cached_dataset, make_dataset
+from app.model.export import convert_to_tflite, mean_dice, run_tflite
+
+# Keeps log(p / (1 - p)) finite for saturated sigmoid outputs
+_EPSILON = 1e-6
+
+def soften(probabilities, temperature):
+    """
+    Soften sigmoid outputs by dividing their logits by `temperature`.
+    A temperature of 1 returns the probabilities unchanged.
+    """
+    probabilities = tf.clip_by_value(probabilities, _EPSILON, 1.0 - _EPSILON)
+    logits = tf.math.log(probabilities / (1.0 - probabilities))
+    return tf.sigmoid(logits / temperature)
+
+def batch_dice(masks, probabilities, threshold=0.5):
+    """
+    Mean Dice of thresholded predictions over a batch; two empty masks score 1.
+    """
+    predicted = tf.cast(probabilities > threshold, tf.float32)
+    masks = tf.cast(masks > 0.5, tf.float32)
+    intersection = tf.reduce_sum(masks * predicted, axis=[1, 2, 3])
+    total = tf.reduce_sum(masks, axis=[1, 2, 3]) + tf.reduce_sum(predicted, axis=[1, 2, 3])
+    return tf.reduce_mean(tf.where(total > 0, 2.0 * intersection / tf.maximum(total, 1.0), 1.0))
+
+class Distiller(tf.keras.Model):
+    """
+    Trains a student segmentation model on a mix of the ground truth masks and
+    the soft masks predicted by a frozen teacher.
+
+        loss = alpha * BCE(mask, student) + (1 - alpha) * T^2 * BCE(soft(teacher), soft(student))
+
+    The T^2 factor keeps the soft term's gradients on the same scale as the
+    hard term when the temperature T is raised.
+
+    Args:
+        student (tf.keras.Model): Model to train.
+        teacher (tf.keras.Model): Trained model whose soft masks are distilled.
+        alpha (float): Weight of the ground truth loss.
+        temperature (float): Softening applied to both models' outputs.
+    """
+
+    def __init__(self, student, teacher, alpha=0.5, temperature=2.0):
+        super().__init__()
+        self.student = student
+        self.teacher = teacher
+        self.teacher.trainable = False
+        self.alpha = alpha
+        self.temperature = temperature
+        self.loss_tracker = tf.keras.metrics.Mean(name="loss")
+        self.hard_tracker = tf.keras.metrics.Mean(name="hard_loss")
+        self.soft_tracker = tf.keras.metrics.Mean(name="soft_loss")
+        self.dice_tracker = tf.keras.metrics.Mean(name="dice")
+
+    @property
+    def metrics(self):
+        return [self.loss_tracker, self.hard_tracker, self.soft_tracker, self.dice_tracker]
+
+    def call(self, inputs, training=False):
+        return self.student(inputs, training=training)
+
+    def _losses(self, images, masks, training):
+        teacher_probs = self.teacher(images, training=False)
+        student_probs = self.student(images, training=training)
+        hard = tf.reduce_mean(tf.keras.losses.binary_crossentropy(masks, student_probs))
+        soft = tf.reduce_mean(tf.keras.losses.binary_crossentropy(
+            soften(teacher_probs, self.temperature), soften(student_probs, self.temperature)
+        )) * self.temperature ** 2
+        loss = self.alpha * hard + (1.0 - self.alpha) * soft
+        return loss, hard, soft, student_probs
+
+    def _update(self, masks, loss, hard, soft, student_probs):
+        self.loss_tracker.update_state(loss)
+        self.hard_tracker.update_state(hard)
+        self.soft_tracker.update_state(soft)
+        self.dice_tracker.update_state(batch_dice(masks, student_probs))
+        return {metric.name: metric.result() for metric in self.metrics}
+
+    def train_step(self, data):
+        images, masks = data
+        with tf.GradientTape() as tape:
+            loss, hard, soft, student_probs = self._losses(images, masks, training=True)
+        gradients = tape.gradient(loss, self.student.trainable_variables)
+        self.optimizer.apply_gradients(zip(gradients, self.student.trainable_variables))
+        return self._update(masks, loss, hard, soft, student_probs)
+
+    def test_step(self, data):
+        images, masks = data
+        return self._update(masks, *self._losses(images, masks, training=False))
+
+def measure_latency(model, images, warmup=5):
+    """
+    Run a Keras model over images one at a time, as the service does for single uploads.
+    Args:
+        model (tf.keras.Model): Model to time.
+        images (np.ndarray): Images of shape (N, 256, 256, 1).
+        warmup (int): Untimed calls before timing, to exclude graph tracing.
+    Returns:
+        tuple: (predictions, seconds per image).
+    """
+    # A compiled forward pass, without the per-call overhead of model.predict
+    forward = tf.function(lambda batch: model(batch, training=False))
+    for image in images[:warmup]:
+        forward(image[np.newaxis])
+
+    predictions = []
+    start = time.perf_counter()
+    for image in images:
+        predictions.append(forward(image[np.newaxis])[0].numpy())
+    elapsed = time.perf_counter() - start
+    return np.array(predictions), elapsed / max(len(images), 1)
+
+def compare_models(teacher, student, images, masks, tflite=False):
+    """
+    Compare teacher and student on the same validation images.
+    Args:
+        teacher (tf.keras.Model): Reference model.
+        student (tf.keras.Model): Distilled model.
+        images (np.ndarray): Validation images.
+        masks (np.ndarray): Ground truth masks.
+        tflite (bool): Also time both models exported to float TF-Lite.
+    Returns:
+        dict: Per-model Dice, latency and size, plus the Dice drop, agreement and speedup.
+    """
+    report = {"samples": len(images), "models": {}}
+    predictions = {}
+    for name, model in (("teacher", teacher), ("student", student)):
+        predictions[name], latency = measure_latency(model, images)
+        params = model.count_params()
+        row = {
+            "params": params,
+            "weights_mb": params * 4 / 1e6,
+            "dice": mean_dice(predictions[name], masks),
+            "latency_ms": latency * 1000,
+        }
+        if tflite:
+            model_content = convert_to_tflite(model)
+            _, tflite_latency = run_tflite(model_content, images)
+            row["tflite_mb"] = len(model_content) / 1e6
+            row["tflite_latency_ms"] = tflite_latency * 1000
+        report["models"][name] = row
+
+    teacher_row, student_row = report["models"]["teacher"], report["models"]["student"]
+    report["dice_drop"] = teacher_row["dice"] - student_row["dice"]
+    # Agreement with the teacher, independent of ground truth quality
+    report["agreement_dice"] = mean_dice(predictions["student"], (predictions["teacher"] > 0.5).astype(np.float32))
+    report["speedup"] = teacher_row["latency_ms"] / max(student_row["latency_ms"], 1e-9)
+    report["size_ratio"] = teacher_row["params"] / max(student_row["params"], 1)
+    if tflite:
+        report["tflite_speedup"] = teacher_row["tflite_latency_ms"] / max(student_row["tflite_latency_ms"], 1e-9)
+    return report
+
+def print_comparison(report):
+    """
+    Print the comparison from `compare_models` as a table.
+    """
+    tflite = "tflite_latency_ms" in report["models"]["teacher"]
+    header = f"{'model':<8} {'params':>10} {'MB':>7} {'dice':>8} {'ms/img':>8}"
+    if tflite:
+        header += f" {'tflite MB':>9} {'tflite ms':>9}"
+    print(f"Evaluated on {report['samples']} images")
+    print(header)
+    for name, row in report["models"].items():
+        line = f"{name:<8} {row['params']:>10,} {row['weights_mb']:>7.1f} {row['dice']:>8.4f} {row['latency_ms']:>8.1f}"
+        if tflite:
+            line += f" {row['tflite_mb']:>9.1f} {row['tflite_latency_ms']:>9.1f}"
+        print(line)
+    summary = (f"Dice drop: {report['dice_drop']:.4f}, agreement Dice: {report['agreement_dice']:.4f}, "
+               f"speedup: {report['speedup']:.2f}x, {report['size_ratio']:.1f}x fewer parameters")
+    if tflite:
+        summary += f", TF-Lite speedup: {report['tflite_speedup']:.2f}x"
+    print(summary)
+
+def _validation_arrays(dataset, limit):
+    # Collect up to `limit` validation examples as arrays for the comparison
+    images, masks = [], []
+    for batch_images, batch_masks in dataset:
+        images.append(batch_images.numpy())
+        masks.append(batch_masks.numpy())
+        if sum(len(batch) for batch in images) >= limit:
+            break
+    return np.concatenate(images)[:limit], np.concatenate(masks)[:limit]
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill the segmentation model into a lightweight U-Net.")
+    parser.add_argument("--teacher", default=os.getenv("MODEL_PATH", "app/model/segmentation_model.keras"),
+                        help="Path to the trained Keras model to distill.")
+    parser.add_argument("--output", required=True, help="Path of the .keras file to write the student to.")
+    parser.add_argument("--images-dir", help="Training images.")
+    parser.add_argument("--labels-dir", help="Ground truth masks matching --images-dir.")
+    parser.add_argument("--dataset-cache", default=os.getenv("DATASET_CACHE_DIR"),
+                        help="Memory-mapped store from app/model/dataset_cache.py, used instead of the image directories.")
+    parser.add_argument("--width-multiplier", type=float, default=0.25)
+    parser.add_argument("--no-separable", dest="separable", action="store_false",
+                        help="Use full 3x3 convolutions instead of depthwise-separable ones.")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Weight of the ground truth loss against the teacher's.")
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--eval-samples", type=int, default=100, help="Validation images used for the comparison.")
+    parser.add_argument("--tflite", action="store_true", help="Also compare float TF-Lite exports of both models.")
+    parser.add_argument("--report", help="Write the comparison as JSON to this file.")
+    args = parser.parse_args()
+
+    if not args.dataset_cache and not (args.images_dir and args.labels_dir):
+        parser.error("Pass --dataset-cache or both --images-dir and --labels-dir.")
+
+    # Same 80/20 split as train.py, so the comparison runs on images neither model trained on
+    if args.dataset_cache:
+        cache = MemmapDataset(args.dataset_cache)
+        train_indices, val_indices = train_test_split(np.arange(len(cache)), test_size=0.2, random_state=42)
+        train_ds = make_cached_dataset(cache, train_indices, batch_size=args.batch_size, shuffle=True)
+        val_ds = make_cached_dataset(cache, val_indices, batch_size=args.batch_size)
+    else:
+        image_paths, mask_paths = discover_pairs(args.images_dir, args.labels_dir)
+        train_images, val_images, train_masks, val_masks = train_test_split(
+            image_paths, mask_paths, test_size=0.2, random_state=42
+        )
+        train_ds = make_dataset(train_images, train_masks, batch_size=args.batch_size, shuffle=True, cache_file="")
+        val_ds = make_dataset(val_images, val_masks, batch_size=args.batch_size, cache_file="")
+
+    teacher = tf.keras.models.load_model(args.teacher)
+    student = light_unet_model(teacher.input_shape[1:], args.width_multiplier, args.separable)
+    print(f"Student {student.name}: {student.count_params():,} parameters "
+          f"(teacher {teacher.count_params():,})")
+
+    distiller = Distiller(student, teacher, alpha=args.alpha, temperature=args.temperature)
+    distiller.compile(optimizer=tf.keras.optimizers.Adam(args.learning_rate))
+    distiller.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=args.epochs,
+        callbacks=[EarlyStopping(monitor="val_dice", mode="max", patience=5, restore_best_weights=True)],
+    )
+
+    student.save(args.output)
+    print(f"Wrote student model to {args.output}")
+
+    images, masks = _validation_arrays(val_ds, args.eval_samples)
+    report = compare_models(teacher, student, images, masks, args.tflite)
+    report["settings"] = {
+        "width_multiplier": args.width_multiplier,
+        "separable": args.separable,
+        "alpha": args.alpha,
+        "temperature": args.temperature,
+    }
+    print_comparison(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import os
+import csv
+import json
+import math
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from skimage.metrics import structural_similarity as ssim, hausdorff_distance
+from app.model.dataset_cache import MemmapDataset
+from app.model.postprocess import overlap_metrics
+
+# Metrics reported for every image pair
+METRICS = ("dice", "iou", "pixel_accuracy", "hausdorff", "ssim")
+
+# Gray level above which a mask pixel counts as foreground
+_FOREGROUND_LEVEL = 128
+
+def _load_mask(path, size=None):
+    with Image.open(path) as image:
+        image = image.convert("L")
+        if size is not None and image.size != size:
+            image = image.resize(size, Image.NEAREST)
+        return np.asarray(image, dtype=np.uint8)
+
+def _evaluate_chunk(task):
+    # Runs in a worker process: load one chunk of pairs and score it as a batch
+    names, original_dir, predicted_dir, cache_dir = task
+
+    if cache_dir:
+        cache = MemmapDataset(cache_dir)
+        positions = [cache.position(name) for name in names]
+        # Stored masks are 0/1; scale them to 8-bit like the mask images on disk
+        originals = list(cache.masks[positions] * np.uint8(255))
+    else:
+        originals = [_load_mask(os.path.join(original_dir, name)) for name in names]
+
+    # Each prediction is scored at its ground truth's size
+    predictions = [
+        _load_mask(os.path.join(predicted_dir, name), (original.shape[1], original.shape[0]))
+        for name, original in zip(names, originals)
+    ]
+    original_binary = [original >= _FOREGROUND_LEVEL for original in originals]
+    predicted_binary = [prediction >= _FOREGROUND_LEVEL for prediction in predictions]
+
+    # Score masks of the same size as one batch; a chunk may mix image sizes
+    groups = {}
+    for i, original in enumerate(originals):
+        groups.setdefault(original.shape, []).append(i)
+    overlap = {metric: np.empty(len(names)) for metric in ("dice", "iou", "pixel_accuracy")}
+    for indices in groups.values():
+        scores = overlap_metrics(
+            np.stack([original_binary[i] for i in indices]),
+            np.stack([predicted_binary[i] for i in indices]),
+        )
+        for metric, values in scores.items():
+            overlap[metric][indices] = values
+
+    rows = []
+    for i, name in enumerate(names):
+        hausdorff = hausdorff_distance(original_binary[i], predicted_binary[i])
+        rows.append({
+            "file": name,
+            "dice": float(overlap["dice"][i]),
+            "iou": float(overlap["iou"][i]),
+            "pixel_accuracy": float(overlap["pixel_accuracy"][i]),
+            # Undefined when exactly one of the masks is empty
+            "hausdorff": float(hausdorff) if math.isfinite(hausdorff) else None,
+            "ssim": float(ssim(originals[i], predictions[i])),
+        })
+    return rows
+
+def summarize(rows):
+    """
+    Mean of every metric over the rows, ignoring undefined values.
+    """
+    summary = {"count": len(rows)}
+    for metric in METRICS:
+        values = [row[metric] for row in rows if row[metric] is not None]
+        summary[metric] = float(np.mean(values)) if values else None
+    return summary
+
+def evaluate_masks(predicted_mask_dir, original_mask_dir=None, cache_dir=None, workers=None, chunk_size=64):
+    """
+    Score predicted masks against ground truth masks with the same file names.
+
+    Pairs are split into chunks that are scored in parallel across a process pool;
+    within a chunk the overlap metrics are computed as one batched NumPy operation.
+
+    Args:
+        predicted_mask_dir (str): Directory with the predicted masks.
+        original_mask_dir (str, optional): Directory with the ground truth masks.
+        cache_dir (str, optional): Dataset store to read the ground truth masks from
+            instead of `original_mask_dir` (see app/model/dataset_cache.py).
+        workers (int, optional): Number of worker processes.
+        chunk_size (int): Number of pairs scored per task.
+
+    Returns:
+        tuple: (per-image rows, summary dict).
+    """
+    if not original_mask_dir and not cache_dir:
+        raise ValueError("Either original_mask_dir or cache_dir is required.")
+
+    predicted = {
+        name for name in os.listdir(predicted_mask_dir)
+        if os.path.isfile(os.path.join(predicted_mask_dir, name))
+    }
+    if cache_dir:
+        names = [name for name in MemmapDataset(cache_dir).names if name in predicted]
+    else:
+        names = sorted(
+            name for name in predicted
+            if os.path.isfile(os.path.join(original_mask_dir, name))
+        )
+
+    tasks = [
+        (names[i:i + chunk_size], original_mask_dir, predicted_mask_dir, cache_dir)
+        for i in range(0, len(names), chunk_size)
+    ]
+
+    rows = []
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk_rows in pool.map(_evaluate_chunk, tasks):
+                rows.extend(chunk_rows)
+
+    return rows, summarize(rows)
+
+def write_csv(rows, path):
+    """
+    Write per-image results to a CSV file.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=("file", *METRICS))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def write_json(rows, summary, path):
+    """
+    Write per-image results and the summary to a JSON file.
+    """
+    with open(path, "w") as f:
+        json.dump({"summary": summary, "images": rows}, f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate predicted segmentation masks.")
+    parser.add_argument("predicted_mask_dir", help="Directory with the predicted masks.")
+    parser.add_argument("--original-mask-dir", help="Directory with the ground truth masks.")
+    parser.add_argument("--cache-dir", help="Dataset store holding the ground truth masks.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--csv", help="Write per-image results to this CSV file.")
+    parser.add_argument("--json", help="Write per-image results and the summary to this JSON file.")
+    args = parser.parse_args()
+
+    if not args.original_mask_dir and not args.cache_dir:
+        parser.error("one of --original-mask-dir or --cache-dir is required.")
+
+    rows, summary = evaluate_masks(
+        args.predicted_mask_dir, args.original_mask_dir, args.cache_dir, args.workers, args.chunk_size
+    )
+    if args.csv:
+        write_csv(rows, args.csv)
+    if args.json:
+        write_json(rows, summary, args.json)
+
+    print(f"Evaluated {summary['count']} mask pairs")
+    for metric in METRICS:
+        value = summary[metric]
+        print(f"{metric:>15}: {value:.4f}" if value is not None else f"{metric:>15}: n/a")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import os
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+from skimage.metrics import structural_similarity as ssim
+from sklearn.model_selection import train_test_split
+from app.model.data import discover_pairs
+from app.model.train import load_image_and_mask
+from app.model.postprocess import apply_threshold_to_predictions, overlap_metrics
+
+# Supported quantization modes for the TF-Lite export
+QUANTIZATION_MODES = ("none", "fp16", "int8")
+
+def load_samples(image_paths, mask_paths, limit=None):
+    """
+    Load image/mask pairs for calibration and evaluation.
+    Args:
+        image_paths (list): Paths of the input images.
+        mask_paths (list): Paths of the matching ground truth masks.
+        limit (int, optional): Maximum number of pairs to load.
+    Returns:
+        tuple: (images, masks) arrays of shape (N, 256, 256, 1).
+    """
+    if limit:
+        image_paths, mask_paths = image_paths[:limit], mask_paths[:limit]
+
+    images = []
+    masks = []
+    for image_path, mask_path in zip(image_paths, mask_paths):
+        image, mask = load_image_and_mask(image_path, mask_path)
+        images.append(image)
+        masks.append(mask)
+    return np.array(images, dtype=np.float32), np.array(masks, dtype=np.float32)
+
+def convert_to_tflite(model, quantization="none", calibration_images=None):
+    """
+    Convert a Keras model to a TF-Lite flatbuffer.
+    Args:
+        model (tf.keras.Model): Trained segmentation model.
+        quantization (str): One of "none", "fp16" or "int8".
+        calibration_images (np.ndarray, optional): Images used to calibrate INT8 ranges.
+    Returns:
+        bytes: Serialized TF-Lite model.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if quantization == "fp16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        if calibration_images is None or len(calibration_images) == 0:
+            raise ValueError("INT8 quantization needs calibration images.")
+
+        def representative_dataset():
+            for image in calibration_images:
+                yield [np.expand_dims(image, axis=0).astype(np.float32)]
+
+        # Quantize weights and activations to INT8 but keep float input/output,
+        # so the service can feed the same preprocessed tensors as for Keras
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif quantization != "none":
+        raise ValueError(f"Unknown quantization mode: {quantization}")
+
+    return converter.convert()
+
+def run_tflite(model_content, images):
+    """
+    Run a TF-Lite model over a set of images, one at a time.
+    Args:
+        model_content (bytes): Serialized TF-Lite model.
+        images (np.ndarray): Images of shape (N, 256, 256, 1).
+    Returns:
+        tuple: (predictions, seconds per image).
+    """
+    interpreter = tf.lite.Interpreter(model_content=model_content)
+    interpreter.allocate_tensors()
+    input_index = interpreter.get_input_details()[0]["index"]
+    output_index = interpreter.get_output_details()[0]["index"]
+
+    predictions = []
+    start = time.perf_counter()
+    for image in images:
+        interpreter.set_tensor(input_index, np.expand_dims(image, axis=0).astype(np.float32))
+        interpreter.invoke()
+        predictions.append(interpreter.get_tensor(output_index)[0])
+    elapsed = time.perf_counter() - start
+    return np.array(predictions), elapsed / max(len(images), 1)
+
+def run_keras(model, images):
+    """
+    Run the Keras model over a set of images, one at a time.
+    Args:
+        model (tf.keras.Model): Trained segmentation model.
+        images (np.ndarray): Images of shape (N, 256, 256, 1).
+    Returns:
+        tuple: (predictions, seconds per image).
+    """
+    predictions = []
+    start = time.perf_counter()
+    for image in images:
+        predictions.append(model.predict(np.expand_dims(image, axis=0), verbose=0)[0])
+    elapsed = time.perf_counter() - start
+    return np.array(predictions), elapsed / max(len(images), 1)
+
+def mean_dice(predictions, masks, threshold=0.5):
+    """
+    Mean Dice coefficient between thresholded predictions and binary masks.
+    """
+    dice = overlap_metrics(masks.squeeze(-1) > 0.5, predictions.squeeze(-1) > threshold)["dice"]
+    return float(dice.mean())
+
+def mean_ssim(predictions, masks):
+    """
+    Mean SSIM between predicted probability maps and ground truth masks.
+    """
+    scores = [
+        ssim(true.squeeze(), pred.squeeze(), data_range=1.0)
+        for pred, true in zip(predictions, masks)
+    ]
+    return float(np.mean(scores))
+
+def compare_backends(model, model_content, images, masks):
+    """
+    Compare the exported model against the Keras model on the same images.
+    Args:
+        model (tf.keras.Model): Reference Keras model.
+        model_content (bytes): Serialized TF-Lite model.
+        images (np.ndarray): Evaluation images.
+        masks (np.ndarray): Ground truth masks.
+    Returns:
+        dict: Dice, SSIM and latency for both backends and the drop between them.
+    """
+    keras_pred, keras_latency = run_keras(model, images)
+    tflite_pred, tflite_latency = run_tflite(model_content, images)
+
+    report = {
+        "samples": len(images),
+        "keras": {
+            "dice": mean_dice(keras_pred, masks),
+            "ssim": mean_ssim(keras_pred, masks),
+            "latency_ms": keras_latency * 1000,
+        },
+        "tflite": {
+            "dice": mean_dice(tflite_pred, masks),
+            "ssim": mean_ssim(tflite_pred, masks),
+            "latency_ms": tflite_latency * 1000,
+        },
+        # Agreement between the two backends, independent of ground truth quality
+        "agreement_dice": mean_dice(tflite_pred, apply_threshold_to_predictions(keras_pred)),
+    }
+    report["dice_drop"] = report["keras"]["dice"] - report["tflite"]["dice"]
+    report["ssim_drop"] = report["keras"]["ssim"] - report["tflite"]["ssim"]
+    report["speedup"] = keras_latency / max(tflite_latency, 1e-9)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the segmentation model to TF-Lite.")
+    parser.add_argument("--model", default=os.getenv("MODEL_PATH", "app/model/segmentation_model.keras"), help="Path to the Keras model.")
+    parser.add_argument("--output", required=True, help="Path of the .tflite file to write.")
+    parser.add_argument("--quantization", choices=QUANTIZATION_MODES, default="none")
+    parser.add_argument("--images-dir", help="Images, split 80/20 as in train.py: the training split calibrates "
+                                              "INT8, the validation split is used for evaluation.")
+    parser.add_argument("--labels-dir", help="Ground truth masks matching --images-dir.")
+    parser.add_argument("--calibration-samples", type=int, default=100)
+    parser.add_argument("--eval-samples", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.quantization == "int8" and not (args.images_dir and args.labels_dir):
+        parser.error("--quantization int8 requires --images-dir and --labels-dir for calibration.")
+
+    model = tf.keras.models.load_model(args.model)
+
+    # Same 80/20 split as train.py: calibrate on training images and evaluate on
+    # validation images, so the reported accuracy drop is not measured on calibration data
+    calibration_images = images = masks = None
+    if args.images_dir and args.labels_dir:
+        image_paths, mask_paths = discover_pairs(args.images_dir, args.labels_dir)
+        train_images, val_images, train_masks, val_masks = train_test_split(
+            image_paths, mask_paths, test_size=0.2, random_state=42
+        )
+        if args.quantization == "int8":
+            calibration_images, _ = load_samples(train_images, train_masks, args.calibration_samples)
+        images, masks = load_samples(val_images, val_masks, args.eval_samples)
+
+    model_content = convert_to_tflite(model, args.quantization, calibration_images)
+
+    with open(args.output, "wb") as f:
+        f.write(model_content)
+    print(f"Wrote {args.quantization} TF-Lite model to {args.output} ({len(model_content) / 1e6:.1f} MB)")
+
+    if images is None:
+        print("No evaluation data given; skipping the accuracy comparison.")
+        return
+
+    report = compare_backends(model, model_content, images, masks)
+    print(f"Evaluated on {report['samples']} images")
+    print(f"{'backend':<8} {'dice':>8} {'ssim':>8} {'ms/img':>8}")
+    for name in ("keras", "tflite"):
+        row = report[name]
+        print(f"{name:<8} {row['dice']:>8.4f} {row['ssim']:>8.4f} {row['latency_ms']:>8.1f}")
+    print(f"Dice drop: {report['dice_drop']:.4f}, SSIM drop: {report['ssim_drop']:.4f}, "
+          f"agreement Dice: {report['agreement_dice']:.4f}, speedup: {report['speedup']:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import numpy as np
+
+# Thresholding function to reduce noise in predictions
+def apply_threshold_to_predictions(predictions, threshold=0.5):
+    """
+    Apply threshold to the predicted segmentation masks to remove small noise.
+    The output will be binary, with values > threshold set to 1, and others set to 0.
+    """
+    return (predictions > threshold).astype(np.float32)
+
+def overlap_metrics(original, predicted):
+    """
+    Dice, IoU and pixel accuracy for a stack of binary masks in one vectorized pass.
+
+    Args:
+        original (np.ndarray): Ground truth masks of shape (N, H, W), boolean.
+        predicted (np.ndarray): Predicted masks of shape (N, H, W), boolean.
+
+    Returns:
+        dict: Arrays of shape (N,) for "dice", "iou" and "pixel_accuracy".
+    """
+    original = original.reshape(len(original), -1)
+    predicted = predicted.reshape(len(predicted), -1)
+
+    intersection = np.count_nonzero(original & predicted, axis=1)
+    original_area = np.count_nonzero(original, axis=1)
+    predicted_area = np.count_nonzero(predicted, axis=1)
+    union = original_area + predicted_area - intersection
+    matching = np.count_nonzero(original == predicted, axis=1)
+
+    # Two empty masks agree perfectly
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dice = np.where(union > 0, 2.0 * intersection / (original_area + predicted_area), 1.0)
+        iou = np.where(union > 0, intersection / union, 1.0)
+
+    return {
+        "dice": dice,
+        "iou": iou,
+        "pixel_accuracy": matching / original.shape[1],
+    }
@@ -1,35 +1,33 @@
-from PIL import Image
-import os
-import numpy as np
-from skimage.metrics import structural_similarity as ssim
+from app.model.evaluation import evaluate_masks
 
 _VARIANCE_CONST = 2
 
+def _adjusted_average_ssim(rows):
+    if not rows:
+        return 0
+    total_ssim = sum(row["ssim"] for row in rows)
+    return (total_ssim - _VARIANCE_CONST) / len(rows)
+
 def calculate_average_ssim(original_mask_dir, predicted_mask_dir):
+    """
+    Adjusted average SSIM between original and predicted masks with the same file names.
+    Kept for existing callers; see app/model/evaluation.py for the full metric suite.
+    """
     try:
-        total_ssim = 0
-        count = 0
-
-        for filename in os.listdir(original_mask_dir):
-            original_mask_path = os.path.join(original_mask_dir, filename)
-            predicted_mask_path = os.path.join(predicted_mask_dir, filename)
-
-            if os.path.isfile(original_mask_path) and os.path.isfile(predicted_mask_path):
-                with Image.open(original_mask_path) as original, Image.open(predicted_mask_path) as predicted:
-                    # Convert images to grayscale
-                    original_array = np.array(original.convert("L"))
-                    predicted_array = np.array(predicted.convert("L"))
-
-                    # Calculate Structural Similarity Index (SSIM)
-                    score, _ = ssim(original_array, predicted_array, full=True)
-
-                    total_ssim += score
-                    count += 1
-
-        if count == 0:
-            return 0
+        rows, _ = evaluate_masks(predicted_mask_dir, original_mask_dir=original_mask_dir)
+        return _adjusted_average_ssim(rows)
+    except Exception as e:
+        print(f"Error calculating SSIM: {e}")
+        return None
 
-        return (total_ssim - _VARIANCE_CONST) / count
+def calculate_average_ssim_from_cache(cache_dir, predicted_mask_dir):
+    """
+    Same as calculate_average_ssim, but reads the original masks from a
+    memory-mapped dataset store instead of decoding them from disk.
+    """
+    try:
+        rows, _ = evaluate_masks(predicted_mask_dir, cache_dir=cache_dir)
+        return _adjusted_average_ssim(rows)
     except Exception as e:
         print(f"Error calculating SSIM: {e}")
         return None
@@ -1,22 +1,22 @@
 import os
+import sys
+import glob
+import json
+import socket
+import shutil
+import argparse
+import subprocess
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras.preprocessing.image import load_img, img_to_array
 from sklearn.model_selection import train_test_split
 from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping
-import matplotlib.pyplot as plt
+from app.model.data import discover_pairs
+from app.model.dataset_cache import MemmapDataset
 
 # Set image size for resizing (adjust as necessary)
 IMG_SIZE = (256, 256)
 
-# Thresholding function to reduce noise in predictions
-def apply_threshold_to_predictions(predictions, threshold=0.5):
-    """
-    Apply threshold to the predicted segmentation masks to remove small noise.
-    The output will be binary, with values > threshold set to 1, and others set to 0.
-    """
-    return (predictions > threshold).astype(np.float32)
-
 # Load image and mask
 def load_image_and_mask(image_path, mask_path):
     # Load image as grayscale and resize to target size
@@ -32,29 +32,78 @@ def load_image_and_mask(image_path, mask_path):
     
     return image, mask
 
-# Load dataset from images and labels directory
-def load_data(images_dir, labels_dir):
-    images = []
-    masks = []
-    
-    # Iterate through all images in the 'images' folder
-    for i in range(1, 601):  # Assuming your images are named 1.jpg to 600.jpg
-        image_name = f"{i}.jpg"
-        mask_name = f"{i}.jpg"
-        image_path = os.path.join(images_dir, image_name)
-        mask_path = os.path.join(labels_dir, mask_name)
-        
-        if os.path.exists(mask_path):
-            # Load the image and mask
-            image, mask = load_image_and_mask(image_path, mask_path)
-            images.append(image)
-            masks.append(mask)
-    
-    # Convert to numpy arrays
-    images = np.array(images)
-    masks = np.array(masks)
-    
-    return images, masks
+# Decode and resize one file inside the tf.data graph
+def _decode_resize(path):
+    data = tf.io.read_file(path)
+    image = tf.io.decode_image(data, channels=1, expand_animations=False)
+    # Nearest-neighbour resizing matches load_img's default interpolation
+    image = tf.image.resize(image, IMG_SIZE, method='nearest')
+    return tf.cast(image, tf.float32) / 255.0
+
+def _load_pair(image_path, mask_path):
+    image = _decode_resize(image_path)
+    mask = tf.round(_decode_resize(mask_path))  # Binary mask (0 or 1)
+    return image, mask
+
+# Streaming input pipeline
+def make_dataset(image_paths, mask_paths, batch_size=16, shuffle=False, cache_file=None, shuffle_buffer=256, seed=42):
+    """
+    Build a tf.data pipeline that decodes and resizes images in parallel and
+    prefetches batches, so the dataset never has to fit in RAM.
+
+    Args:
+        image_paths (list): Paths of the input images.
+        mask_paths (list): Paths of the matching masks.
+        batch_size (int): Batch size.
+        shuffle (bool): Shuffle examples every epoch.
+        cache_file (str, optional): Cache decoded examples to this file after the
+            first epoch. Pass "" to cache in memory, None to disable caching.
+        shuffle_buffer (int): Number of decoded examples held for shuffling.
+        seed (int): Shuffle seed.
+    """
+    dataset = tf.data.Dataset.from_tensor_slices((image_paths, mask_paths))
+    dataset = dataset.map(_load_pair, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+    if cache_file is not None:
+        dataset = dataset.cache(cache_file)
+    if shuffle:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+# Input pipeline over a memory-mapped dataset store (see app/model/dataset_cache.py)
+def make_cached_dataset(cache, indices, batch_size=16, shuffle=False, seed=42):
+    """
+    Build a tf.data pipeline that slices batches straight out of a MemmapDataset,
+    skipping JPEG decoding entirely.
+
+    Args:
+        cache (MemmapDataset): Opened dataset store.
+        indices (array-like): Rows of the store to use.
+        batch_size (int): Batch size.
+        shuffle (bool): Shuffle examples every epoch.
+        seed (int): Shuffle seed.
+    """
+    height, width = cache.index["image_size"]
+
+    def load_batch(batch_indices):
+        # Memory-mapped reads are in order, so sort the rows of each batch
+        return cache.batch(np.sort(batch_indices))
+
+    def set_shapes(images, masks):
+        images.set_shape((None, height, width, 1))
+        masks.set_shape((None, height, width, 1))
+        return images, masks
+
+    dataset = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+    if shuffle:
+        dataset = dataset.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(
+        lambda batch_indices: tf.numpy_function(load_batch, [batch_indices], [tf.float32, tf.float32]),
+        num_parallel_calls=tf.data.AUTOTUNE,
+    )
+    dataset = dataset.map(set_shapes)
+    return dataset.prefetch(tf.data.AUTOTUNE)
 
 # U-Net model definition for binary segmentation
 def unet_model(input_size=(256, 256, 1)):  # Input size adjusted for grayscale images
@@ -93,54 +142,368 @@ def unet_model(input_size=(256, 256, 1)):  # Input size adjusted for grayscale i
     c7 = tf.keras.layers.Conv2D(64, (3, 3), activation='relu', padding='same')(u3)
     c7 = tf.keras.layers.Conv2D(64, (3, 3), activation='relu', padding='same')(c7)
 
-    outputs = tf.keras.layers.Conv2D(1, (1, 1), activation='sigmoid')(c7)  # Sigmoid for binary segmentation
+    # Sigmoid for binary segmentation, kept in float32 under mixed precision
+    outputs = tf.keras.layers.Conv2D(1, (1, 1), activation='sigmoid', dtype='float32')(c7)
 
     model = tf.keras.models.Model(inputs, outputs)
     return model
 
-# Training Setup
-images_dir = '/kaggle/input/prostate/Input Images'
-labels_dir = '/kaggle/input/prostate/Ground Truth' 
+def _scaled_filters(filters, width_multiplier):
+    # Scale a layer's width, rounded to a multiple of 8 for efficient CPU kernels
+    return max(8, int(filters * width_multiplier + 4) // 8 * 8)
+
+def _conv_block(x, filters, separable=True, convs=2):
+    conv = tf.keras.layers.SeparableConv2D if separable else tf.keras.layers.Conv2D
+    for _ in range(convs):
+        # Batch norm is folded into the convolution on export, so it costs nothing at inference
+        x = conv(filters, (3, 3), padding='same', use_bias=False)(x)
+        x = tf.keras.layers.BatchNormalization()(x)
+        x = tf.keras.layers.ReLU()(x)
+    return x
+
+# Lightweight U-Net for CPU inference, trained by distillation (see app/model/distill.py)
+def light_unet_model(input_size=(256, 256, 1), width_multiplier=0.25, separable=True):
+    """
+    U-Net with the same layout and input/output as `unet_model`, but with every
+    layer's filter count scaled by `width_multiplier` and depthwise-separable
+    instead of full 3x3 convolutions.
+
+    Args:
+        input_size (tuple): Input shape.
+        width_multiplier (float): Fraction of `unet_model`'s 64-512 filters to keep.
+        separable (bool): Use depthwise-separable convolutions.
+    """
+    f1, f2, f3, f4 = (_scaled_filters(filters, width_multiplier) for filters in (64, 128, 256, 512))
+    inputs = tf.keras.layers.Input(input_size)
+
+    # Encoder; the first convolution sees a single channel, where a separable one saves nothing
+    c1 = tf.keras.layers.Conv2D(f1, (3, 3), activation='relu', padding='same')(inputs)
+    c1 = _conv_block(c1, f1, separable, convs=1)
+    p1 = tf.keras.layers.MaxPooling2D((2, 2))(c1)
+
+    c2 = _conv_block(p1, f2, separable)
+    p2 = tf.keras.layers.MaxPooling2D((2, 2))(c2)
+
+    c3 = _conv_block(p2, f3, separable)
+    p3 = tf.keras.layers.MaxPooling2D((2, 2))(c3)
+
+    # Bottleneck
+    c4 = _conv_block(p3, f4, separable)
+
+    # Decoder; plain upsampling replaces the transposed convolutions
+    u1 = tf.keras.layers.concatenate([tf.keras.layers.UpSampling2D((2, 2))(c4), c3])
+    c5 = _conv_block(u1, f3, separable)
+
+    u2 = tf.keras.layers.concatenate([tf.keras.layers.UpSampling2D((2, 2))(c5), c2])
+    c6 = _conv_block(u2, f2, separable)
+
+    u3 = tf.keras.layers.concatenate([tf.keras.layers.UpSampling2D((2, 2))(c6), c1])
+    c7 = _conv_block(u3, f1, separable)
+
+    # Sigmoid for binary segmentation, kept in float32 under mixed precision
+    outputs = tf.keras.layers.Conv2D(1, (1, 1), activation='sigmoid', dtype='float32')(c7)
+
+    return tf.keras.models.Model(inputs, outputs, name=f"light_unet_{width_multiplier:g}")
+
+# Architectures selectable with --model
+MODELS = ("unet", "light_unet")
+
+# Mixed precision policies; bfloat16 only pays off on CPUs with native support (AVX512-BF16, AMX)
+PRECISION_POLICIES = ("float32", "mixed_bfloat16", "mixed_float16")
+
+def parse_args(argv=None):
+    """
+    Parse the training options. Values from a JSON `--config` file replace the
+    defaults, and flags given on the command line override the file.
+    """
+    parser = argparse.ArgumentParser(description="Train the segmentation model.")
+    parser.add_argument("--config", help="JSON file with option values, keyed by option name (e.g. \"batch_size\").")
+    parser.add_argument("--images-dir", help="Training images.")
+    parser.add_argument("--labels-dir", help="Ground truth masks matching --images-dir.")
+    parser.add_argument("--dataset-cache", default=os.getenv("DATASET_CACHE_DIR"),
+                        help="Memory-mapped store from app/model/dataset_cache.py, used instead of the image directories.")
+    parser.add_argument("--output-dir", default="training_output",
+                        help="Where checkpoints, the best model and the final model are written.")
+    parser.add_argument("--model", choices=MODELS, default="unet")
+    parser.add_argument("--width-multiplier", type=float, default=0.25, help="Width of the light_unet model.")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=16, help="Batch size per worker.")
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--patience", type=int, default=5, help="Epochs without improvement before stopping early.")
+    parser.add_argument("--intra-op-threads", type=int, default=0,
+                        help="Threads used inside one op; 0 lets TensorFlow decide (local workers split the cores).")
+    parser.add_argument("--inter-op-threads", type=int, default=0, help="Ops run in parallel; 0 lets TensorFlow decide.")
+    parser.add_argument("--precision", choices=PRECISION_POLICIES, default="float32")
+    parser.add_argument("--keep-checkpoints", type=int, default=3, help="Epoch checkpoints kept for resuming.")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="Start from epoch 0 even if checkpoints exist.")
+    parser.add_argument("--local-workers", type=int, default=0,
+                        help="Launch this many data-parallel workers on this machine. For multi-node "
+                             "training, start one process per node with TF_CONFIG set instead.")
+
+    # Let the config file supply defaults, then parse again so flags win
+    known, _ = parser.parse_known_args(argv)
+    if known.config:
+        with open(known.config) as f:
+            config = json.load(f)
+        unknown = set(config) - {action.dest for action in parser._actions}
+        if unknown:
+            parser.error(f"Unknown options in {known.config}: {', '.join(sorted(unknown))}")
+        parser.set_defaults(**config)
+    args = parser.parse_args(argv)
+
+    if not args.dataset_cache and not (args.images_dir and args.labels_dir):
+        parser.error("Pass --dataset-cache or both --images-dir and --labels-dir.")
+    return args
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+def launch_local_workers(count, argv, intra_op_threads=0):
+    """
+    Run `count` training workers on this machine as a MultiWorkerMirroredStrategy
+    cluster, each with its own TF_CONFIG, and wait for all of them.
+
+    Args:
+        count (int): Number of workers.
+        argv (list): Arguments passed on to every worker.
+        intra_op_threads (int): Threads per worker; 0 splits the cores evenly.
+
+    Returns:
+        int: 0 if every worker succeeded, otherwise the first non-zero exit code.
+    """
+    workers = [f"localhost:{_free_port()}" for _ in range(count)]
+    # Split the cores between the workers unless the thread count was set explicitly
+    threads = intra_op_threads or max(1, (os.cpu_count() or 1) // count)
+    worker_argv = [*argv, "--local-workers", "0", "--intra-op-threads", str(threads)]
+
+    processes = []
+    for index in range(count):
+        env = dict(os.environ)
+        env["TF_CONFIG"] = json.dumps({"cluster": {"worker": workers}, "task": {"type": "worker", "index": index}})
+        processes.append(subprocess.Popen([sys.executable, "-m", "app.model.train", *worker_argv], env=env))
+
+    codes = [process.wait() for process in processes]
+    return next((code for code in codes if code != 0), 0)
+
+def configure_runtime(args):
+    """
+    Apply the thread and precision settings. Must run before TensorFlow executes any op.
+    """
+    if args.intra_op_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(args.intra_op_threads)
+    if args.inter_op_threads:
+        tf.config.threading.set_inter_op_parallelism_threads(args.inter_op_threads)
+    tf.keras.mixed_precision.set_global_policy(args.precision)
+
+def make_strategy():
+    """
+    MultiWorkerMirroredStrategy when TF_CONFIG describes a cluster, otherwise
+    the default single-process strategy.
+    """
+    if os.getenv("TF_CONFIG"):
+        return tf.distribute.MultiWorkerMirroredStrategy()
+    return tf.distribute.get_strategy()
+
+def _worker_info(strategy):
+    # (task index, whether this worker writes the shared outputs)
+    resolver = getattr(strategy, "cluster_resolver", None)
+    if resolver is None or not resolver.task_type:
+        return 0, True
+    task_type, task_id = resolver.task_type, resolver.task_id or 0
+    has_chief = "chief" in resolver.cluster_spec().as_dict()
+    is_chief = task_type == "chief" or (task_type == "worker" and task_id == 0 and not has_chief)
+    return task_id, is_chief
+
+def _clear_stale_cache(cache_file):
+    """
+    Remove what an interrupted run left of a tf.data file cache. tf.data writes
+    `<cache_file>_<shard>.*` while the first epoch runs, guarded by a
+    `<cache_file>_<shard>.lockfile`, and only renames them to `<cache_file>.*`
+    once the epoch completes; a leftover lockfile makes the next run fail.
+    """
+    stale = glob.glob(glob.escape(cache_file) + "_*")
+    # Without an index the cache was never completed, so its data files are partial too
+    if not os.path.exists(cache_file + ".index"):
+        stale += glob.glob(glob.escape(cache_file) + ".data-*")
+    for path in stale:
+        os.remove(path)
+    if stale:
+        print(f"Removed {len(stale)} stale cache file(s) of {cache_file}")
+
+def build_datasets(args, global_batch_size, task_index=0):
+    """
+    Training and validation datasets, split 80/20 with a fixed seed so every
+    worker and every resumed run sees the same split.
+    """
+    if args.dataset_cache:
+        cache = MemmapDataset(args.dataset_cache)
+        train_indices, val_indices = train_test_split(np.arange(len(cache)), test_size=0.2, random_state=42)
+        train_ds = make_cached_dataset(cache, train_indices, batch_size=global_batch_size, shuffle=True)
+        val_ds = make_cached_dataset(cache, val_indices, batch_size=global_batch_size)
+    else:
+        image_paths, mask_paths = discover_pairs(args.images_dir, args.labels_dir)
+        train_images, val_images, train_masks, val_masks = train_test_split(
+            image_paths, mask_paths, test_size=0.2, random_state=42
+        )
+        # Decoded examples are cached after the first epoch, one file per worker
+        cache_dir = os.path.join(args.output_dir, "data_cache")
+        os.makedirs(cache_dir, exist_ok=True)
+        train_cache = os.path.join(cache_dir, f"train_{task_index}")
+        val_cache = os.path.join(cache_dir, f"val_{task_index}")
+        for cache_file in (train_cache, val_cache):
+            _clear_stale_cache(cache_file)
+        train_ds = make_dataset(train_images, train_masks, batch_size=global_batch_size, shuffle=True,
+                                cache_file=train_cache)
+        val_ds = make_dataset(val_images, val_masks, batch_size=global_batch_size, cache_file=val_cache)
+
+    # Each worker reads every example and keeps its share of each global batch
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.DATA
+    return train_ds.with_options(options), val_ds.with_options(options)
+
+class EpochCheckpoint(tf.keras.callbacks.Callback):
+    """
+    Saves the model weights, optimizer state, the number of finished epochs and
+    the best validation loss so far after every epoch, so an interrupted run
+    continues where it stopped.
+
+    Args:
+        manager (tf.train.CheckpointManager): Writes the checkpoints.
+        epoch (tf.Variable): Number of finished epochs.
+        best_loss (tf.Variable): Lowest val_loss seen so far.
+        wait (tf.Variable): Epochs since val_loss last improved.
+    """
+
+    def __init__(self, manager, epoch, best_loss, wait):
+        super().__init__()
+        self.manager = manager
+        self.epoch = epoch
+        self.best_loss = best_loss
+        self.wait = wait
+
+    def on_epoch_end(self, epoch, logs=None):
+        # Same improvement rule as ModelCheckpoint and EarlyStopping on val_loss
+        val_loss = (logs or {}).get("val_loss")
+        if val_loss is not None and val_loss < self.best_loss.numpy():
+            self.best_loss.assign(val_loss)
+            self.wait.assign(0)
+        else:
+            self.wait.assign_add(1)
+        self.epoch.assign(epoch + 1)
+        self.manager.save(checkpoint_number=epoch + 1)
+
+class ResumableEarlyStopping(EarlyStopping):
+    """
+    EarlyStopping that starts from the best val_loss and patience count stored in
+    the checkpoint instead of from scratch, so a resumed run stops when the
+    uninterrupted one would have. The weights of epochs before the interruption
+    are not kept in memory; best_model.keras holds them.
+    """
+
+    def __init__(self, best_loss, wait, **kwargs):
+        super().__init__(**kwargs)
+        self.resume_best = best_loss
+        self.resume_wait = wait
+
+    def on_train_begin(self, logs=None):
+        super().on_train_begin(logs)
+        self.best = self.resume_best
+        self.wait = self.resume_wait
+
+def _check_resumed_epochs(strategy, restored_epoch):
+    """
+    Make sure every worker restored the same checkpoint. Each worker reads the
+    chief's checkpoint directory, so without a shared filesystem the others
+    would start from scratch and their collectives would no longer line up.
+    """
+    epochs = strategy.experimental_distribute_values_from_function(
+        lambda context: tf.constant([restored_epoch], dtype=tf.int64)
+    )
+    epochs = set(strategy.gather(epochs, axis=0).numpy().tolist())
+    if len(epochs) > 1:
+        raise RuntimeError(
+            f"Workers restored different checkpoints (epochs {sorted(epochs)}). Put --output-dir on a "
+            "filesystem shared by all workers, or pass --no-resume to start over."
+        )
+
+def train(args):
+    """
+    Train the model described by `args` on this worker.
+    """
+    configure_runtime(args)
+    strategy = make_strategy()
+    task_index, is_chief = _worker_info(strategy)
+    os.makedirs(args.output_dir, exist_ok=True)
 
-# Load the data
-images, masks = load_data(images_dir, labels_dir)
+    global_batch_size = args.batch_size * strategy.num_replicas_in_sync
+    train_ds, val_ds = build_datasets(args, global_batch_size, task_index)
 
-# Split into train and validation sets (80% train, 20% validation)
-X_train, X_val, y_train, y_val = train_test_split(images, masks, test_size=0.2, random_state=42)
+    with strategy.scope():
+        if args.model == "light_unet":
+            model = light_unet_model(input_size=(*IMG_SIZE, 1), width_multiplier=args.width_multiplier)
+        else:
+            model = unet_model(input_size=(*IMG_SIZE, 1))
+        # Compile the model with Adam optimizer and binary cross-entropy loss
+        model.compile(optimizer=tf.keras.optimizers.Adam(args.learning_rate),
+                      loss='binary_crossentropy', metrics=['accuracy'])
+        epoch = tf.Variable(0, dtype=tf.int64, trainable=False, name="epoch")
+        best_loss = tf.Variable(np.inf, dtype=tf.float64, trainable=False, name="best_val_loss")
+        wait = tf.Variable(0, dtype=tf.int64, trainable=False, name="epochs_without_improvement")
+        checkpoint = tf.train.Checkpoint(model=model, optimizer=model.optimizer, epoch=epoch,
+                                         best_val_loss=best_loss, epochs_without_improvement=wait)
 
-# Convert the data to the format expected by the model
-X_train = np.array(X_train)
-y_train = np.array(y_train)
-X_val = np.array(X_val)
-y_val = np.array(y_val)
+    # Every worker takes part in saving, but only the chief's copy is kept
+    checkpoint_dir = os.path.join(args.output_dir, "checkpoints")
+    write_dir = checkpoint_dir if is_chief else os.path.join(checkpoint_dir, f".worker_{task_index}")
+    manager = tf.train.CheckpointManager(checkpoint, write_dir, max_to_keep=args.keep_checkpoints)
 
-# Create the U-Net model
-model = unet_model(input_size=(256, 256, 1))
+    # Resume from the chief's latest checkpoint: weights, optimizer state, epoch and best val_loss
+    latest = tf.train.latest_checkpoint(checkpoint_dir) if args.resume else None
+    if latest:
+        checkpoint.restore(latest)
+        print(f"Resuming from {latest} after epoch {int(epoch.numpy())}, best val_loss {best_loss.numpy():.4f}")
+    _check_resumed_epochs(strategy, int(epoch.numpy()))
 
-# Compile the model with Adam optimizer and binary cross-entropy loss
-model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+    # Set up callbacks for saving the best model and early stopping, seeded with the
+    # restored best so a resumed run never replaces best_model.keras with a worse epoch
+    best = float(best_loss.numpy())
+    callbacks = [
+        EpochCheckpoint(manager, epoch, best_loss, wait),
+        ModelCheckpoint(os.path.join(args.output_dir, "best_model.keras"),
+                        save_best_only=True, monitor='val_loss', mode='min',
+                        initial_value_threshold=best if np.isfinite(best) else None),
+        ResumableEarlyStopping(best, int(wait.numpy()), monitor='val_loss', patience=args.patience,
+                               restore_best_weights=True),
+    ]
 
-# Set up callbacks for saving the best model and early stopping
-callbacks = [
-    ModelCheckpoint('/kaggle/working/unet_best_model.keras', save_best_only=True, monitor='val_loss', mode='min'),
-    EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True)
-]
+    # Train the model
+    model.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=args.epochs,
+        initial_epoch=int(epoch.numpy()),
+        callbacks=callbacks,
+    )
 
-# Train the model
-history = model.fit(
-    X_train, y_train,
-    validation_data=(X_val, y_val),
-    epochs=20,
-    batch_size=16,
-    callbacks=callbacks
-)
+    # Evaluate the model; every worker must take part in the collective evaluation
+    loss, accuracy = model.evaluate(val_ds)
 
-# Save the final model
-model.save('/kaggle/working/unet_final_model.keras')
+    if is_chief:
+        # Save the final model
+        model.save(os.path.join(args.output_dir, "final_model.keras"))
+        print(f"Validation Loss: {loss}, Validation Accuracy: {accuracy}")
+    else:
+        shutil.rmtree(write_dir, ignore_errors=True)
 
-# Evaluate the model
-loss, accuracy = model.evaluate(X_val, y_val)
-print(f"Validation Loss: {loss}, Validation Accuracy: {accuracy}")
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.local_workers > 1 and not os.getenv("TF_CONFIG"):
+        sys.exit(launch_local_workers(args.local_workers, argv, args.intra_op_threads))
+    train(args)
 
-# Predict on all validation images
-predictions = model.predict(X_val)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
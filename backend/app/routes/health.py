@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.services.model import current_model, is_model_loaded
+from app.services.firebase import is_firebase_initialized
+from app.services.executor import run_io
+from app.services.jobs import job_store
+from app.utils.metrics import JOB_QUEUE_DEPTH
+
+router = APIRouter()
+
+@router.get("/health/live")
+async def liveness():
+    """
+    Liveness probe: the process is up and the event loop is responding.
+    """
+    return {"status": "alive"}
+
+@router.get("/health/ready")
+async def readiness(request: Request):
+    """
+    Readiness probe: the model has been loaded and warmed up.
+    """
+    checks = {
+        "warmed_up": getattr(request.app.state, "ready", False),
+        "model_loaded": is_model_loaded(),
+        "firebase_initialized": is_firebase_initialized(),
+    }
+    ready = checks["warmed_up"]
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "starting",
+            "checks": checks,
+            "model_version": current_model().version if checks["model_loaded"] else None,
+        },
+    )
+
+@router.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: per-stage latency histograms, batch sizes, queue depths
+    and cache hit counters.
+    """
+    # The job queue lives in SQLite, so its depth is read at scrape time
+    for status, count in (await run_io(job_store.count_by_status)).items():
+        JOB_QUEUE_DEPTH.labels(status).set(count)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
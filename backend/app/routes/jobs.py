@@ -0,0 +1,127 @@
+from typing import Optional
+from fastapi import APIRouter, Form, UploadFile, File, Header, HTTPException, Depends
+from fastapi.responses import JSONResponse
+import json
+import logging
+from app.services.firebase import verify_firebase_token, verify_bearer_token
+from app.services.executor import run_io
+from app.services.jobs import job_store, job_view
+from app.utils.encryption import encrypt_versioned
+from app.utils.uploads import close_uploads, spool_upload
+
+router = APIRouter(prefix="/jobs")
+
+# Longest accepted Idempotency-Key header
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+def _check_idempotency_key(idempotency_key: Optional[str]):
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters.")
+
+def _accepted(job: dict, created: bool) -> JSONResponse:
+    # 202 for a new job, 200 when an idempotent retry returns the existing one
+    status_url = f"/jobs/{job['id']}"
+    return JSONResponse(
+        status_code=202 if created else 200,
+        content={**job_view(job), "status_url": status_url},
+        headers={"Location": status_url},
+    )
+
+@router.post("/predict")
+async def submit_prediction(
+    user_id: str = Form(...),
+    firebase_token: str = Form(...),
+    image: UploadFile = File(...),
+    patient_name: Optional[str] = Form(None),
+    full_resolution: bool = Form(False),
+    return_rle: bool = Form(False),
+    idempotency_key: Optional[str] = Header(None),
+    verified_user: dict = Depends(verify_firebase_token)
+):
+    """
+    Queue a prediction and return its job ID right away instead of waiting for
+    inference, uploads and Firestore writes. Poll GET /jobs/{job_id} for the result,
+    which has the same fields as the /predict response.
+
+    Sending the same request again with the same `Idempotency-Key` header returns
+    the original job instead of queueing a second one.
+    """
+    try:
+        logging.info(f"Received prediction job from user_id: {user_id}")
+        _check_idempotency_key(idempotency_key)
+
+        # Validate file type
+        if not image.filename.lower().endswith((".jpg", ".jpeg")):
+            raise HTTPException(status_code=400, detail="Invalid file type. Please upload a JPG or JPEG image.")
+
+        content_digest = await spool_upload(image)
+        request = {
+            "user_id": user_id,
+            "content_digest": content_digest,
+            "patient_name": patient_name,
+            "full_resolution": full_resolution,
+            "return_rle": return_rle,
+        }
+        # Keep the patient name encrypted while the job sits in the queue
+        payload = {**request, "patient_name": encrypt_versioned(patient_name) if patient_name else None}
+        job, created = await run_io(
+            job_store.submit, "predict", verified_user["uid"], payload, idempotency_key, image.file, request
+        )
+        return _accepted(job, created)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error queueing prediction job: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    finally:
+        # The job store has copied the upload into the job's own spool
+        close_uploads(image)
+
+@router.post("/report")
+async def submit_report(
+    features: str = Form(...),
+    patient_history: str = Form(...),
+    firebase_token: str = Form(...),
+    idempotency_key: Optional[str] = Header(None),
+    verified_user: dict = Depends(verify_firebase_token)
+):
+    """
+    Queue report generation from the `features` returned by /predict and return
+    its job ID right away. Poll GET /jobs/{job_id} for the report.
+    """
+    try:
+        _check_idempotency_key(idempotency_key)
+        try:
+            image_features = json.loads(features)
+            mask_ratio = float(image_features["lesion_area_ratio"])
+        except (ValueError, TypeError, KeyError):
+            raise HTTPException(status_code=400, detail="Invalid features. Pass the features returned by /predict.")
+
+        request = {
+            "features": image_features,
+            "mask_ratio": mask_ratio,
+            "patient_history": patient_history,
+        }
+        payload = {**request, "patient_history": encrypt_versioned(patient_history)}
+        job, created = await run_io(
+            job_store.submit, "report", verified_user["uid"], payload, idempotency_key, None, request
+        )
+        return _accepted(job, created)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error queueing report job: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, verified_user: dict = Depends(verify_bearer_token)):
+    """
+    Status of a job, with its result once it has succeeded or its error once it has failed.
+    """
+    job = await run_io(job_store.get, job_id)
+    # Jobs of other users are reported as missing rather than forbidden
+    if job is None or job["user_id"] != verified_user.get("uid"):
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return JSONResponse(content=job_view(job))
@@ -1,15 +1,46 @@
-from typing import Optional
+from typing import List, Optional
 from fastapi import APIRouter, Form, UploadFile, File, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import hashlib
+import json
 import logging
-from app.services.firebase import verify_firebase_token, upload_to_firebase, update_user_images
-from app.services.model import predict_mask, preprocess_image
-from io import BytesIO
-from PIL import Image, UnidentifiedImageError
+import tempfile
+import zipfile
+import numpy as np
+from app.services.firebase import (
+    verify_firebase_token,
+    upload_to_firebase,
+    upload_file_to_firebase,
+    save_study_records,
+    list_patients,
+    revoke_user_sessions,
+)
+from app.services.model import current_model, predict_masks_async, preprocess_image
+from app.services.pipeline import (
+    decode_image,
+    encode_mask,
+    mask_file_name,
+    mask_rle,
+    prediction_cache_key,
+    run_prediction,
+)
 import time
-from app.services.firebase import db
-from app.utils.encryption import encrypt_data, decrypt_data
-from app.services.openai import extract_image_features, generate_medical_report
+from app.utils.encryption import encrypt_versioned, decrypt_many
+from app.services.openai import extract_image_features, generate_medical_report, report_service
+from app.services.executor import prediction_slot, run_cpu, run_io
+from app.services.cache import prediction_cache
+from app.services.features import extract_mask_features
+from app.utils.config import (
+    MAX_BATCH_IMAGES,
+    MAX_ARCHIVE_BYTES,
+    MAX_UPLOAD_BYTES,
+    PATIENTS_DEFAULT_PAGE_SIZE,
+    PATIENTS_MAX_PAGE_SIZE,
+)
+from app.utils.search_index import name_index_fields
+from app.utils.uploads import CHUNK_SIZE, close_uploads, spool_upload
+from app.utils.mask_codec import MASK_CONTENT_TYPE
 
 router = APIRouter()
 
@@ -22,70 +53,211 @@ async def predict(
     firebase_token: str = Form(...),
     image: UploadFile = File(...),
     patient_name: Optional[str] = Form(None),
-    verified_user: dict = Depends(verify_firebase_token)
+    full_resolution: bool = Form(False),
+    return_rle: bool = Form(False),
+    verified_user: dict = Depends(verify_firebase_token),
+    _slot: None = Depends(prediction_slot)
 ):
     """
     Handle the prediction request: Upload image and mask to Firebase Storage, make a prediction, 
     return the result, and store the image URLs in Firestore.
+
+    With `full_resolution` set, the mask is predicted tile by tile at the uploaded
+    image's size instead of at the model's 256x256 input size. The mask is stored
+    as a 1-bit PNG; with `return_rle` set it is also returned inline as `mask_rle`,
+    run-length encoded in the uncompressed COCO format.
     """
     try:
         # Log the received values
         logging.info(f"Received user_id: {user_id}")
-        logging.info(f"Verified user: {verified_user}")  # Log the decoded token information
 
         # Validate file type
         if not image.filename.lower().endswith((".jpg", ".jpeg")):
             raise HTTPException(status_code=400, detail="Invalid file type. Please upload a JPG or JPEG image.")
 
-        # Read and validate image data
-        image_data = await image.read()
-        try:
-            input_image = Image.open(BytesIO(image_data))
-        except UnidentifiedImageError:
-            raise HTTPException(status_code=400, detail="Invalid image file. Could not process the uploaded image.")
+        # Read and validate image data, then run the prediction pipeline
+        content_digest = await spool_upload(image)
+        result = await run_prediction(user_id, image.file, content_digest, patient_name, full_resolution, return_rle)
+
+        # Return the response with image and mask URLs
+        return JSONResponse(content=result)
+
+    except HTTPException as http_ex:
+        logging.error(http_ex)
+        raise http_ex
+    except Exception as e:
+        logging.error(e)
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+    finally:
+        close_uploads(image)
+
+def _spool_archive_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo):
+    """Copy one archive member into a spooled temporary file, hashing it on the way."""
+    spooled = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE)
+    digest = hashlib.sha256()
+    with archive.open(info) as member:
+        for chunk in iter(lambda: member.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            spooled.write(chunk)
+    spooled.seek(0)
+    return spooled, digest.hexdigest()
 
-        # Generate a unique filename based on user_id and current time
-        timestamp = int(time.time())
-        base_name = f"{user_id}_{timestamp}"
+def _extract_archive(archive_file) -> list:
+    """Extract the JPEG slices of a zip archive, in file name order, as (name, file, digest) tuples."""
+    try:
+        archive_file.seek(0)
+        with zipfile.ZipFile(archive_file) as archive:
+            members = sorted(
+                (info for info in archive.infolist()
+                 if not info.is_dir() and info.filename.lower().endswith((".jpg", ".jpeg"))),
+                key=lambda info: info.filename,
+            )
+            if len(members) > MAX_BATCH_IMAGES:
+                raise HTTPException(status_code=400, detail=f"Too many images. A study may contain at most {MAX_BATCH_IMAGES} images.")
+            # Guard against archives that expand far beyond their upload size
+            if sum(info.file_size for info in members) > MAX_ARCHIVE_BYTES:
+                raise HTTPException(status_code=413, detail="Archive is too large once extracted.")
+            if any(info.file_size > MAX_UPLOAD_BYTES for info in members):
+                raise HTTPException(status_code=413, detail="An image in the archive is too large.")
+            slices = []
+            try:
+                for info in members:
+                    slices.append((info.filename, *_spool_archive_member(archive, info)))
+            except BaseException:
+                close_uploads(*(spooled for _, spooled, _ in slices))
+                raise
+            return slices
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid archive. Please upload a zip file of JPG or JPEG images.")
 
-        # Upload the original image to Firebase
-        original_image_url = upload_to_firebase("procare-images/image", f"{base_name}_original.jpg", image_data, "image/jpeg")
+@router.post("/predict_batch")
+async def predict_batch(
+    user_id: str = Form(...),
+    firebase_token: str = Form(...),
+    images: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    patient_name: Optional[str] = Form(None),
+    return_rle: bool = Form(False),
+    verified_user: dict = Depends(verify_firebase_token),
+    _slot: None = Depends(prediction_slot)
+):
+    """
+    Handle a multi-slice study: predict masks for many images (uploaded individually
+    and/or as a zip archive) in one batched forward pass, upload the results
+    concurrently, and store the whole study in a single Firestore write.
+    With `return_rle` set, each slice's mask is also returned run-length encoded.
+    """
+    slices = []
+    try:
+        logging.info(f"Received study upload from user_id: {user_id}")
+
+        # Collect the slices from the individual uploads and the archive
+        for upload in images or []:
+            if not upload.filename.lower().endswith((".jpg", ".jpeg")):
+                raise HTTPException(status_code=400, detail=f"Invalid file type for {upload.filename}. Please upload JPG or JPEG images.")
+            slices.append((upload.filename, upload.file, await spool_upload(upload)))
+        if archive is not None:
+            await spool_upload(archive, MAX_ARCHIVE_BYTES)
+            slices.extend(await run_cpu(_extract_archive, archive.file))
 
-        # Preprocess the image and make a prediction
-        preprocessed_image = preprocess_image(input_image)
-        predicted_mask = predict_mask(preprocessed_image)
+        if not slices:
+            raise HTTPException(status_code=400, detail="No images uploaded.")
+        if len(slices) > MAX_BATCH_IMAGES:
+            raise HTTPException(status_code=400, detail=f"Too many images. A study may contain at most {MAX_BATCH_IMAGES} images.")
 
-        # Convert the prediction to an image
-        mask_image = Image.fromarray((predicted_mask * 255).astype("uint8"))  # Convert to grayscale image
+        # Pin the served model so every slice of the study comes from the same version
+        model = await run_cpu(current_model)
 
-        # Save the mask to a BytesIO buffer
-        mask_byte_arr = BytesIO()
-        mask_image.save(mask_byte_arr, format="JPEG")
-        mask_byte_arr.seek(0)
+        # Decode every slice and look up previously processed ones
+        decoded = await asyncio.gather(*(run_cpu(decode_image, image_file) for _, image_file, _ in slices))
+        cache_keys = [prediction_cache_key(user_id, digest, model.version) for _, _, digest in slices]
+        cached = await asyncio.gather(*(run_io(prediction_cache.get, key) for key in cache_keys))
+        was_cached = [entry is not None for entry in cached]
+        misses = [i for i, hit in enumerate(was_cached) if not hit]
 
-        # Upload the mask image to Firebase
-        mask_image_url = upload_to_firebase("procare-images/mask", f"{base_name}_mask.jpg", mask_byte_arr.getvalue(), "image/jpeg")
+        # Generate a unique study ID based on user_id and current time
+        study_id = f"{user_id}_{int(time.time())}"
+
+        # Start uploading the new originals while inference runs
+        original_uploads = [
+            asyncio.ensure_future(
+                run_io(upload_file_to_firebase, "procare-images/image", f"{study_id}_{i}_original.jpg", slices[i][1], "image/jpeg")
+            )
+            for i in misses
+        ]
+        try:
+            original_urls, mask_urls, mask_bytes, mask_features = [], [], [], []
+            if misses:
+                # Preprocess the slices and predict all masks in one forward pass
+                preprocessed = await asyncio.gather(*(run_cpu(preprocess_image, decoded[i]) for i in misses))
+                predicted_masks = await predict_masks_async(np.concatenate(preprocessed, axis=0), model)
 
-        # Update the Firestore document with the image URLs
-        update_user_images(user_id, original_image_url, mask_image_url)
+                # Encode the masks and describe the lesions, then upload the masks concurrently
+                mask_bytes = await asyncio.gather(*(run_cpu(encode_mask, mask) for mask in predicted_masks))
+                mask_features = await asyncio.gather(*(
+                    run_cpu(extract_mask_features, mask, image[0, ..., 0])
+                    for mask, image in zip(predicted_masks, preprocessed)
+                ))
+                mask_urls = await asyncio.gather(*(
+                    run_io(upload_to_firebase, "procare-images/mask", mask_file_name(f"{study_id}_{i}"), data, MASK_CONTENT_TYPE)
+                    for i, data in zip(misses, mask_bytes)
+                ))
+                original_urls = await asyncio.gather(*original_uploads)
+        except BaseException:
+            for upload in original_uploads:
+                upload.cancel()
+            raise
 
+        # Remember the new predictions
+        for i, original_url, mask_url, data, features in zip(misses, original_urls, mask_urls, mask_bytes, mask_features):
+            cached[i] = {
+                "mask": data,
+                "mask_content_type": MASK_CONTENT_TYPE,
+                "original_image_url": original_url,
+                "mask_image_url": mask_url,
+                "features": features,
+                "model_version": model.version,
+            }
+        await asyncio.gather(*(run_io(prediction_cache.put, cache_keys[i], cached[i]) for i in misses))
+
+        study_images = [
+            {
+                'original_image_url': entry["original_image_url"],
+                'mask_image_url': entry["mask_image_url"],
+                'features': entry.get("features"),
+                'model_version': model.version,
+            }
+            for entry in cached
+        ]
+
+        # Store the whole study in one batched write
+        patient_record = None
         if patient_name:
-            encrypted_name = encrypt_data(patient_name)
-            db.collection('patients').add({
-                'name': encrypted_name,
+            patient_record = {
+                'name': encrypt_versioned(patient_name),
+                **name_index_fields(patient_name),
                 'doctor_id': user_id,
-                'results': {
-                    'original_image_url': original_image_url,
-                    'mask_image_url': mask_image_url,
-                }
-            })
+                'study_id': study_id,
+                # First slice kept under `results` for clients expecting a single result
+                'results': study_images[0],
+                'study_results': study_images,
+            }
+        await run_io(save_study_records, user_id, study_images, patient_record)
+
+        results = [
+            {"file": name, **image_urls, "cached": hit}
+            for (name, _, _), image_urls, hit in zip(slices, study_images, was_cached)
+        ]
+        if return_rle:
+            rles = await asyncio.gather(*(run_cpu(mask_rle, entry["mask"]) for entry in cached))
+            for result, rle in zip(results, rles):
+                result["mask_rle"] = rle
 
-        # Return the response with image and mask URLs
         return JSONResponse(
             content={
                 "message": "Prediction successful",
-                "original_image_url": original_image_url,
-                "mask_image_url": mask_image_url,
+                "study_id": study_id,
+                "results": results,
             }
         )
 
@@ -95,94 +267,133 @@ async def predict(
     except Exception as e:
         logging.error(e)
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+    finally:
+        # Release the spooled uploads and extracted archive members, also on errors
+        close_uploads(*(images or []), archive, *(image_file for _, image_file, _ in slices))
+
+@router.post("/logout")
+async def logout(
+    firebase_token: str = Form(...),
+    verified_user: dict = Depends(verify_firebase_token)
+):
+    """
+    Sign the user out everywhere: revoke their refresh tokens and drop their
+    cached ID tokens on this worker. Other workers stop accepting the ID tokens
+    once their cache entries expire (TOKEN_CACHE_MAX_TTL), or on the next
+    verification when TOKEN_CHECK_REVOKED is set.
+    """
+    try:
+        await run_io(revoke_user_sessions, verified_user["uid"])
+        return {"message": "Sessions revoked"}
+    except Exception as e:
+        logging.error(f"Error revoking sessions: {e}")
+        raise HTTPException(status_code=500, detail="Error revoking sessions")
 
 @router.post("/patients")
 async def get_patients(
     doctor_id: str = Form(...),   # Doctor's ID, passed as a form field
-    name: Optional[str] = Form(None),  # Patient's name, passed as a form field
+    name: Optional[str] = Form(None),  # Patient's name or name prefix, passed as a form field
+    match: str = Form("prefix"),  # "prefix" or "exact" name matching
+    page_size: int = Form(PATIENTS_DEFAULT_PAGE_SIZE),  # Number of patients per page
+    cursor: Optional[str] = Form(None),  # `next_cursor` from the previous page
+    decrypt_names: bool = Form(True),  # Set to false to skip name decryption, e.g. for counting
     firebase_token: str = Form(...),  # Firebase token for authentication
     verified_user: dict = Depends(verify_firebase_token)  # Verify the user's identity
 ):
     """
-    Fetch patients assigned to the doctor based on doctor's ID and patient name.
+    Fetch a page of patients assigned to the doctor, optionally filtered by patient name.
+    Pass the returned `next_cursor` back as `cursor` to fetch the following page.
     """
     try:
         # Ensure the requesting doctor is the one associated with the doctor_id
         if verified_user.get("uid") != doctor_id:
             raise HTTPException(status_code=403, detail="Unauthorized access. Only the doctor can fetch their patients.")
 
+        if match not in ("prefix", "exact"):
+            raise HTTPException(status_code=400, detail="Invalid match mode. Use 'prefix' or 'exact'.")
+        page_size = min(max(page_size, 1), PATIENTS_MAX_PAGE_SIZE)
+
         # Query Firestore
-        
-        if name:
-            print(name, "name")
-            encrypted_name = encrypt_data(name)
-            print(encrypted_name)
-            patients_snapshot = (
-                db.collection('patients')
-                .where('doctor_id', '==', doctor_id)
-                .where('name', '==', encrypted_name)
-                .limit(10)
-                .stream()
-            )
-        else:
-            patients_snapshot = (
-                db.collection('patients')
-                .where('doctor_id', '==', doctor_id)
-                .limit(10)
-                .stream()
-            )
+        docs, has_more = await run_io(list_patients, doctor_id, name, match, page_size, cursor)
 
         patients = []
-        for doc in patients_snapshot:
+        for doc in docs:
             data = doc.to_dict()
-            data["name"] = decrypt_data(data["name"])
+            # Search tokens stay server-side
+            data.pop("name_index", None)
+            data.pop("name_prefixes", None)
             patients.append({"id": doc.id, **data})
 
-        return {"patients": patients}
+        # Decrypt the whole page at once, or not at all
+        if decrypt_names:
+            names = decrypt_many([patient["name"] for patient in patients])
+            for patient, patient_name in zip(patients, names):
+                patient["name"] = patient_name
+        else:
+            for patient in patients:
+                patient.pop("name", None)
+
+        return {
+            "patients": patients,
+            "next_cursor": docs[-1].id if has_more else None,
+        }
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(e)
+        logging.error(f"Error fetching patients: {e}")
         raise HTTPException(status_code=500, detail=f"Error fetching patients: {str(e)}")
 
 @router.post("/generate_report")
 async def generate_report(
-    mri_image: UploadFile = File(...),
-    mask_image: UploadFile = File(...),
+    mri_image: Optional[UploadFile] = File(None),
+    mask_image: Optional[UploadFile] = File(None),
+    features: Optional[str] = Form(None),
     patient_history: str = Form(...),
+    stream: bool = Form(False),
     firebase_token: str = Form(...),
     verified_user: dict = Depends(verify_firebase_token)
 ):
     """
     Endpoint to generate a medical severity report from an MRI image, mask, and patient history.
+    Instead of the images, the `features` returned by /predict can be passed as JSON to skip decoding.
+    With `stream` set, the report is streamed back as plain text while it is generated.
     """
     try:
-        # Log received values
-        logging.info(f"Received patient history: {patient_history}")
-        logging.info(f"Verified user: {verified_user}")
-
-        # Read MRI image and mask image as bytes
-        mri_image_data = await mri_image.read()
-        mask_image_data = await mask_image.read()
-
-        # Save the images to temporary files for processing (in real-world apps, use proper file storage)
-        mri_image_path = "/tmp/mri_image.png"
-        mask_image_path = "/tmp/mask_image.png"
-        
-        with open(mri_image_path, "wb") as f:
-            f.write(mri_image_data)
-        
-        with open(mask_image_path, "wb") as f:
-            f.write(mask_image_data)
-
-        # Extract image features from MRI image using OpenAI's CLIP model
-        image_features = extract_image_features(mri_image_path)
+        if features:
+            # Reuse the lesion features stored with the prediction
+            try:
+                image_features = json.loads(features)
+                mask_ratio = float(image_features["lesion_area_ratio"])
+            except (ValueError, TypeError, KeyError):
+                raise HTTPException(status_code=400, detail="Invalid features. Pass the features returned by /predict.")
+        elif mri_image is not None and mask_image is not None:
+            # Check the upload sizes; the images are decoded straight from their spooled buffers
+            await spool_upload(mri_image)
+            await spool_upload(mask_image)
+
+            # Extract the lesion features and mask-to-image ratio from the uploads
+            image_features, mask_ratio = await run_cpu(extract_image_features, mri_image.file, mask_image.file)
+        else:
+            raise HTTPException(status_code=400, detail="Upload the MRI and mask images or pass their features.")
+
+        # Stream the report as it is generated
+        if stream:
+            return StreamingResponse(
+                report_service.stream(image_features, mask_ratio, patient_history),
+                media_type="text/plain",
+            )
 
         # Generate a severity report based on the extracted features and patient history
-        severity_report = generate_medical_report(image_features, patient_history)
+        severity_report = await generate_medical_report(image_features, mask_ratio, patient_history)
 
         # Return the generated report
         return JSONResponse(content={"severity_report": severity_report})
 
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error generating report: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
+    finally:
+        close_uploads(mri_image, mask_image)
@@ -0,0 +1,137 @@
+import os
+import json
+import base64
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+from app.utils.config import PREDICTION_CACHE_SIZE, PREDICTION_CACHE_DIR
+from app.utils.metrics import CACHE_REQUESTS
+
+class PredictionCache:
+    """
+    Content-addressed cache of prediction results.
+
+    Entries are keyed by the uploading user, the hash of the uploaded image bytes and
+    the model version, and hold the encoded mask together with the storage URLs it
+    was uploaded to. The URLs point at the user's own files, so entries are never
+    shared between users.
+    Recent entries live in an in-memory LRU; when `disk_dir` is set every entry is
+    also written there so it survives restarts and is shared between workers.
+    """
+
+    def __init__(self, max_entries: int, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir or None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(user_id: str, content_digest: str, model_version: str) -> str:
+        """
+        Build the cache key for an upload.
+
+        Args:
+            user_id (str): ID of the user the upload and its stored files belong to.
+            content_digest (str): SHA-256 hex digest of the uploaded image bytes.
+            model_version (str): Version of the model producing the mask.
+
+        Returns:
+            str: Hex digest identifying the (user, image, model) triple.
+        """
+        return hashlib.sha256(f"{user_id}\0{model_version}\0{content_digest}".encode()).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, entry: dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Look up a cached prediction.
+
+        Args:
+            key (str): Key from `make_key`.
+
+        Returns:
+            dict or None: Entry with `mask`, `mask_content_type`, `original_image_url`
+            and `mask_image_url`, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                CACHE_REQUESTS.labels("prediction", "hit").inc()
+                return entry
+
+        stored = self._read_disk(key) if self.disk_dir else None
+        if stored is None:
+            CACHE_REQUESTS.labels("prediction", "miss").inc()
+            return None
+
+        entry = {**stored, "mask": base64.b64decode(stored["mask"])}
+        self._remember(key, entry)
+        CACHE_REQUESTS.labels("prediction", "disk_hit").inc()
+        return entry
+
+    def _read_disk(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._disk_path(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable prediction cache entry {key}: {e}")
+            return None
+
+    def put(self, key: str, entry: dict):
+        """
+        Store a prediction.
+
+        Args:
+            key (str): Key from `make_key`.
+            entry (dict): Entry with `mask` (bytes), `mask_content_type`,
+                `original_image_url` and `mask_image_url`.
+        """
+        self._remember(key, entry)
+
+        if not self.disk_dir:
+            return
+
+        path = self._disk_path(key)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            stored = {**entry, "mask": base64.b64encode(entry["mask"]).decode()}
+            # Write to a temporary file first so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            # A failed cache write must not fail the prediction it caches
+            logging.warning(f"Could not write prediction cache entry {key}: {e}")
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        """
+        Drop the in-memory entries. The on-disk tier is left alone.
+        """
+        with self._lock:
+            self._entries.clear()
+
+# Shared cache used by the prediction routes
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_DIR)
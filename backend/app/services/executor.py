@@ -0,0 +1,81 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from app.utils.config import CPU_WORKERS, IO_WORKERS, MAX_PENDING_PREDICTIONS
+from app.utils.metrics import EXECUTOR_WAIT_SECONDS, PREDICTIONS_IN_FLIGHT, PREDICTIONS_REJECTED
+
+# CPU-bound work (PIL decoding, preprocessing, encoding) runs on threads since
+# PIL and NumPy release the GIL and the loaded model cannot be shared across processes
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+
+# Blocking network calls (Firebase Storage, Firestore) get their own pool so slow
+# uploads never starve the CPU-bound steps
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+
+def _timed_wait(pool: str, func, *args, **kwargs):
+    # Record how long the call sat in the pool's queue before a thread picked it up
+    submitted = time.perf_counter()
+
+    def call():
+        EXECUTOR_WAIT_SECONDS.labels(pool).observe(time.perf_counter() - submitted)
+        return func(*args, **kwargs)
+    return call
+
+async def run_cpu(func, *args, **kwargs):
+    """
+    Run a CPU-bound function on the CPU worker pool.
+    Args:
+        func (callable): Function to run.
+    Returns:
+        The function's return value.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, _timed_wait("cpu", func, *args, **kwargs))
+
+async def run_io(func, *args, **kwargs):
+    """
+    Run a blocking I/O function on the I/O worker pool.
+    Args:
+        func (callable): Function to run.
+    Returns:
+        The function's return value.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, _timed_wait("io", func, *args, **kwargs))
+
+class PipelineLimiter:
+    """
+    Caps the number of requests in flight through a pipeline. Requests beyond the
+    limit are rejected with 503 instead of queueing up behind the worker pools.
+    """
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+
+    async def slot(self):
+        """
+        FastAPI dependency that holds a pipeline slot for the lifetime of the request.
+
+        Raises:
+            HTTPException: 503 if the pipeline is already at capacity.
+        """
+        # Only touched from the event loop, so a plain counter is enough
+        if self.in_flight >= self.max_in_flight:
+            PREDICTIONS_REJECTED.inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy processing other predictions. Please retry shortly.",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+# Shared limiter for the prediction routes
+prediction_limiter = PipelineLimiter(MAX_PENDING_PREDICTIONS)
+prediction_slot = prediction_limiter.slot
+PREDICTIONS_IN_FLIGHT.set_function(lambda: prediction_limiter.in_flight)
@@ -0,0 +1,97 @@
+import numpy as np
+from scipy import ndimage
+from app.utils.metrics import timed
+
+# Number of connected components described individually, largest first
+MAX_COMPONENTS = 10
+
+def _box(slices):
+    # ndimage slices -> [top, left, bottom, right] with exclusive bottom/right
+    return [int(slices[0].start), int(slices[1].start), int(slices[0].stop), int(slices[1].stop)]
+
+@timed("features")
+def extract_mask_features(mask, image=None, threshold=0.5):
+    """
+    Describe the lesion in a predicted mask in one vectorized pass.
+
+    Args:
+        mask (np.ndarray): Mask of shape (H, W), either probabilities in [0, 1]
+            or 8-bit gray levels.
+        image (np.ndarray, optional): Image of the same shape, used for intensity
+            statistics, either normalized to [0, 1] like the model input or 8-bit
+            gray levels. Statistics are always reported on the [0, 1] scale, so
+            /predict and /generate_report describe the same scan the same way.
+        threshold (float): Probability above which a pixel belongs to the lesion.
+
+    Returns:
+        dict: JSON-serializable lesion features: area, component count, bounding
+        box, centroid, per-component details and intensity statistics.
+    """
+    mask = np.asarray(mask)
+    if mask.dtype == np.uint8:
+        binary = mask > int(threshold * 255)
+    else:
+        binary = mask > threshold
+    height, width = binary.shape
+
+    labels, count = ndimage.label(binary)
+    flat_labels = labels.ravel()
+
+    # Per-component pixel counts and coordinate sums, all from a few bincounts
+    rows, cols = np.indices(binary.shape)
+    areas = np.bincount(flat_labels, minlength=count + 1)[1:]
+    row_sums = np.bincount(flat_labels, weights=rows.ravel(), minlength=count + 1)[1:]
+    col_sums = np.bincount(flat_labels, weights=cols.ravel(), minlength=count + 1)[1:]
+    boxes = ndimage.find_objects(labels)
+
+    lesion_area = int(areas.sum())
+    features = {
+        "image_height": height,
+        "image_width": width,
+        "lesion_area_pixels": lesion_area,
+        "lesion_area_ratio": lesion_area / float(height * width),
+        "component_count": int(count),
+        "centroid": None,
+        "bounding_box": None,
+        "components": [],
+        "intensity": None,
+    }
+    if lesion_area == 0:
+        return features
+
+    features["centroid"] = [float(row_sums.sum() / lesion_area), float(col_sums.sum() / lesion_area)]
+    lesion_rows = np.flatnonzero(binary.any(axis=1))
+    lesion_cols = np.flatnonzero(binary.any(axis=0))
+    features["bounding_box"] = [
+        int(lesion_rows[0]), int(lesion_cols[0]), int(lesion_rows[-1]) + 1, int(lesion_cols[-1]) + 1
+    ]
+
+    if image is not None:
+        image = np.asarray(image)
+        scale = 255.0 if image.dtype == np.uint8 else 1.0
+        image = (image.astype(np.float64) / scale).reshape(binary.shape)
+        flat_image = image.ravel()
+        component_means = np.bincount(flat_labels, weights=flat_image, minlength=count + 1)[1:] / areas
+        lesion_values = flat_image[binary.ravel()]
+        background = flat_image[~binary.ravel()]
+        features["intensity"] = {
+            "mean": float(lesion_values.mean()),
+            "std": float(lesion_values.std()),
+            "min": float(lesion_values.min()),
+            "max": float(lesion_values.max()),
+            "background_mean": float(background.mean()) if background.size else None,
+        }
+    else:
+        component_means = None
+
+    for index in np.argsort(areas)[::-1][:MAX_COMPONENTS]:
+        component = {
+            "area_pixels": int(areas[index]),
+            "centroid": [float(row_sums[index] / areas[index]), float(col_sums[index] / areas[index])],
+            "bounding_box": _box(boxes[index]),
+        }
+        if component_means is not None:
+            component["mean_intensity"] = float(component_means[index])
+        features["components"].append(component)
+
+    return features
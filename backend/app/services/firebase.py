@@ -1,15 +1,105 @@
 from firebase_admin import credentials, initialize_app, storage, auth, firestore
 from firebase_admin.exceptions import FirebaseError
-from fastapi import Form, HTTPException
+from fastapi import Form, Header, HTTPException
 import logging
-from app.utils.config import FIREBASE_CREDENTIALS, FIREBASE_STORAGE_BUCKET
+import threading
+from app.utils.config import (
+    FIREBASE_CREDENTIALS,
+    FIREBASE_STORAGE_BUCKET,
+    TOKEN_CACHE_SIZE,
+    TOKEN_CACHE_MAX_TTL,
+    TOKEN_CHECK_REVOKED,
+    SEARCH_INDEX_MAX_PREFIX,
+)
+from app.services.token_cache import TokenCache
+from app.utils.metrics import timed
+from app.utils.search_index import normalize_name, exact_search_token, prefix_search_token
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate(FIREBASE_CREDENTIALS)
-initialize_app(cred, {"storageBucket": FIREBASE_STORAGE_BUCKET})
+# The Firebase Admin SDK is initialized on first use instead of at import
+_firebase_app = None
+_db = None
+_bucket = None
+_init_lock = threading.Lock()
 
-bucket = storage.bucket()
-db = firestore.client()
+def init_firebase():
+    """
+    Initialize the Firebase Admin SDK and the Firestore client, once.
+
+    Returns:
+        firebase_admin.App: The initialized Firebase app.
+    """
+    global _firebase_app, _db
+    if _db is None:
+        with _init_lock:
+            if _db is None:
+                if _firebase_app is None:
+                    cred = credentials.Certificate(FIREBASE_CREDENTIALS)
+                    _firebase_app = initialize_app(cred, {"storageBucket": FIREBASE_STORAGE_BUCKET})
+                _db = firestore.client(_firebase_app)
+    return _firebase_app
+
+def get_db():
+    """
+    Return the Firestore client, initializing Firebase if needed.
+    """
+    init_firebase()
+    return _db
+
+def get_bucket():
+    """
+    Return the default Storage bucket, initializing Firebase if needed.
+    """
+    if _bucket is not None:
+        return _bucket
+    return storage.bucket(app=init_firebase())
+
+def is_firebase_initialized():
+    """
+    Whether the Firebase Admin SDK has been initialized.
+    """
+    return _db is not None
+
+def use_firebase_clients(db, bucket=None):
+    """
+    Use the given Firestore client and Storage bucket instead of initializing the
+    Admin SDK from FIREBASE_CREDENTIALS, e.g. emulator clients or local fakes.
+
+    Args:
+        db: Firestore client.
+        bucket (optional): Storage bucket; defaults to the Admin SDK's bucket.
+    """
+    global _db, _bucket
+    with _init_lock:
+        _db = db
+        _bucket = bucket
+
+def _verify_with_firebase(firebase_token: str) -> dict:
+    return auth.verify_id_token(firebase_token, app=init_firebase(), check_revoked=TOKEN_CHECK_REVOKED)
+
+# Verified tokens are reused until they expire, so repeat requests skip signature checks
+token_cache = TokenCache(_verify_with_firebase, max_entries=TOKEN_CACHE_SIZE, max_ttl=TOKEN_CACHE_MAX_TTL)
+
+def set_token_verifier(verifier):
+    """
+    Replace the function used to verify tokens on a cache miss, e.g. with a local
+    fake for offline testing. Clears the token cache.
+
+    Args:
+        verifier (callable): Takes the raw token and returns the decoded claims.
+    """
+    token_cache.verifier = verifier
+    token_cache.clear()
+
+def revoke_user_sessions(uid: str):
+    """
+    Revoke a user's refresh tokens and drop their cached ID tokens, so the
+    revocation takes effect immediately on this worker.
+
+    Args:
+        uid (str): The user whose sessions should be revoked.
+    """
+    auth.revoke_refresh_tokens(uid, app=init_firebase())
+    token_cache.invalidate_user(uid)
 
 def verify_firebase_token(firebase_token: str = Form(...)) -> dict:
     """
@@ -25,13 +115,30 @@ def verify_firebase_token(firebase_token: str = Form(...)) -> dict:
         HTTPException: If token verification fails.
     """
     try:
-        decoded_token = auth.verify_id_token(firebase_token)
+        decoded_token = token_cache.verify(firebase_token)
         return decoded_token
     except FirebaseError as e:
         raise HTTPException(status_code=401, detail=f"Invalid Firebase token: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Token verification error: {str(e)}")
 
+def verify_bearer_token(authorization: str = Header(None)) -> dict:
+    """
+    Verifies a Firebase token sent as "Authorization: Bearer <token>", for
+    requests without a form body such as GET requests.
+
+    Returns:
+        dict: Decoded token containing user information.
+
+    Raises:
+        HTTPException: If the header is missing or token verification fails.
+    """
+    scheme, _, firebase_token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not firebase_token:
+        raise HTTPException(status_code=401, detail="Missing bearer token.", headers={"WWW-Authenticate": "Bearer"})
+    return verify_firebase_token(firebase_token.strip())
+
+@timed("upload")
 def upload_to_firebase(directory: str, file_name: str, file_data: bytes, content_type: str):
     """
     Upload a file to Firebase Storage under a specified directory.
@@ -45,11 +152,31 @@ def upload_to_firebase(directory: str, file_name: str, file_data: bytes, content
     Returns:
         str: The public URL of the uploaded file.
     """
-    bucket = storage.bucket()
+    bucket = get_bucket()
     blob = bucket.blob(f"{directory}/{file_name}")
     blob.upload_from_string(file_data, content_type=content_type)
     return blob.public_url
 
+@timed("upload")
+def upload_file_to_firebase(directory: str, file_name: str, file_obj, content_type: str):
+    """
+    Upload a file object to Firebase Storage under a specified directory, streaming
+    it from the start of the file instead of holding it in memory.
+
+    Args:
+        directory (str): The directory where the file will be uploaded (e.g., 'image' or 'mask').
+        file_name (str): The name of the file to be uploaded.
+        file_obj (file-like): Readable, seekable file object with the data.
+        content_type (str): The content type of the file (e.g., 'image/jpeg').
+
+    Returns:
+        str: The public URL of the uploaded file.
+    """
+    bucket = get_bucket()
+    blob = bucket.blob(f"{directory}/{file_name}")
+    blob.upload_from_file(file_obj, content_type=content_type, rewind=True)
+    return blob.public_url
+
 def update_user_images(user_id: str, original_image_url: str, mask_image_url: str):
     """
     Updates the Firestore document for the user with the image URLs.
@@ -61,7 +188,7 @@ def update_user_images(user_id: str, original_image_url: str, mask_image_url: st
     """
     try:
         # Get the user document
-        user_ref = db.collection('users-procare').document(user_id)
+        user_ref = get_db().collection('users-procare').document(user_id)
         
         # Prepare the data to update
         new_image_data = {
@@ -81,3 +208,100 @@ def update_user_images(user_id: str, original_image_url: str, mask_image_url: st
         logging.error(f"Error updating Firestore for user {user_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error updating Firestore: {str(e)}")
 
+def save_prediction_records(user_id: str, original_image_url: str, mask_image_url: str,
+                            patient_record: dict = None, features: dict = None, model_version: str = None):
+    """
+    Stores the image URLs on the user document and, optionally, a new patient
+    document in a single batched Firestore write.
+
+    Args:
+        user_id (str): The user ID to identify the document.
+        original_image_url (str): The URL of the original uploaded image.
+        mask_image_url (str): The URL of the generated mask image.
+        patient_record (dict, optional): Patient document to create alongside the update.
+        features (dict, optional): Lesion features stored next to the image URLs.
+        model_version (str, optional): Version of the model that produced the mask.
+    """
+    image = {
+        'original_image_url': original_image_url,
+        'mask_image_url': mask_image_url,
+    }
+    if features is not None:
+        image['features'] = features
+    if model_version is not None:
+        image['model_version'] = model_version
+    save_study_records(user_id, [image], patient_record)
+
+@timed("firestore")
+def save_study_records(user_id: str, images: list, patient_record: dict = None):
+    """
+    Stores the URLs of one or more images on the user document and, optionally,
+    a new patient document in a single batched Firestore write.
+
+    Args:
+        user_id (str): The user ID to identify the document.
+        images (list): Dicts with `original_image_url`, `mask_image_url` and optionally
+            `features` and `model_version`.
+        patient_record (dict, optional): Patient document to create alongside the update.
+    """
+    try:
+        db = get_db()
+        batch = db.batch()
+
+        # Append the new image URLs to the user's document
+        user_ref = db.collection('users-procare').document(user_id)
+        batch.update(user_ref, {
+            'images': firestore.ArrayUnion(images)
+        })
+
+        # Create the patient document in the same commit
+        if patient_record is not None:
+            batch.set(db.collection('patients').document(), patient_record)
+
+        batch.commit()
+        logging.info(f"Saved {len(images)} prediction record(s) for user {user_id}")
+
+    except Exception as e:
+        logging.error(f"Error saving prediction records for user {user_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error updating Firestore: {str(e)}")
+
+def list_patients(doctor_id: str, name: str = None, match: str = "prefix", page_size: int = 10, cursor: str = None):
+    """
+    Fetch one page of a doctor's patients, ordered by document ID.
+
+    Args:
+        doctor_id (str): The doctor whose patients are listed.
+        name (str, optional): Patient name ("exact") or name prefix ("prefix") to filter on.
+        match (str): "prefix" or "exact".
+        page_size (int): Maximum number of documents to return.
+        cursor (str, optional): ID of the last document of the previous page.
+
+    Returns:
+        tuple: (list of document snapshots, whether another page follows).
+    """
+    patients = get_db().collection('patients')
+    query = patients.where('doctor_id', '==', doctor_id)
+
+    # Match the name through its blind index instead of decrypting every document
+    if name and normalize_name(name):
+        if match == "exact":
+            query = query.where('name_index', '==', exact_search_token(name))
+        elif len(normalize_name(name)) > SEARCH_INDEX_MAX_PREFIX:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Name prefixes are limited to {SEARCH_INDEX_MAX_PREFIX} characters. Use exact matching for full names.",
+            )
+        else:
+            query = query.where('name_prefixes', 'array_contains', prefix_search_token(name))
+
+    # Document IDs give a stable order to page through
+    query = query.order_by(firestore.FieldPath.document_id())
+    if cursor:
+        cursor_snapshot = patients.document(cursor).get()
+        if not cursor_snapshot.exists or cursor_snapshot.get('doctor_id') != doctor_id:
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+        query = query.start_after(cursor_snapshot)
+
+    # Fetch one extra document to know whether another page follows
+    docs = list(query.limit(page_size + 1).stream())
+    return docs[:page_size], len(docs) > page_size
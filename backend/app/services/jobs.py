@@ -0,0 +1,469 @@
+import os
+import json
+import uuid
+import time
+import shutil
+import sqlite3
+import hashlib
+import asyncio
+import logging
+import tempfile
+import threading
+from fastapi import HTTPException
+from app.services.executor import run_io
+from app.services.pipeline import run_prediction
+from app.services.openai import generate_medical_report
+from app.utils.encryption import decrypt_versioned
+from app.utils.config import (
+    JOB_DB_PATH,
+    JOB_SPOOL_DIR,
+    JOB_WORKERS,
+    JOB_POLL_INTERVAL,
+    JOB_MAX_ATTEMPTS,
+    JOB_MAX_QUEUED,
+    JOB_STALE_SECONDS,
+    JOB_HEARTBEAT_SECONDS,
+    JOB_RETENTION_SECONDS,
+)
+
+# Job states; jobs only ever move forward, except for retries going back to "queued"
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    idempotency_key TEXT,
+    request_hash TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    claimed_at REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_idempotency ON jobs (user_id, idempotency_key);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at);
+"""
+
+# How often the worker pool requeues abandoned jobs and purges old ones, in seconds
+_MAINTENANCE_INTERVAL = 60
+
+class JobStore:
+    """
+    Persistent job queue in a local SQLite database.
+
+    Uploaded inputs are spooled to `spool_dir` next to the database, so a job
+    survives restarts and can be picked up by a worker in another process
+    (see app/jobs/prediction_worker.py). The database is opened in WAL mode so
+    the API and the workers can read and write it concurrently.
+
+    A claim is identified by the job's `attempts` count, which every claim
+    increments. Workers pass it back to `heartbeat`, `complete`, `fail` and
+    `release`, which only act while the job is still running under that claim,
+    so a worker whose job was requeued as stale cannot overwrite the new run.
+
+    All methods block; call them through `run_io` from async code.
+    """
+
+    def __init__(self, db_path: str = JOB_DB_PATH, spool_dir: str = JOB_SPOOL_DIR,
+                 max_attempts: int = JOB_MAX_ATTEMPTS, max_queued: int = JOB_MAX_QUEUED, clock=time.time):
+        self.db_path = db_path
+        self.spool_dir = spool_dir
+        self.max_attempts = max_attempts
+        self.max_queued = max_queued
+        self.clock = clock
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; the schema is created on first use
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._init_lock:
+                if not self._initialized:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+                    os.makedirs(self.spool_dir, exist_ok=True)
+                conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                if not self._initialized:
+                    conn.executescript(_SCHEMA)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def spool_path(self, job_id: str) -> str:
+        """Path of the spooled input file of a job."""
+        return os.path.join(self.spool_dir, f"{job_id}.bin")
+
+    def _spool(self, job_id: str, file_obj):
+        # Write to a temporary file first so a worker never reads a partial input
+        file_obj.seek(0)
+        fd, tmp_path = tempfile.mkstemp(dir=self.spool_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(file_obj, f)
+            os.replace(tmp_path, self.spool_path(job_id))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _remove_spool(self, job_id: str):
+        try:
+            os.unlink(self.spool_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def _find_by_key(self, conn, user_id: str, idempotency_key: str, request_hash: str):
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE user_id = ? AND idempotency_key = ?", (user_id, idempotency_key)
+        ).fetchone()
+        if row is not None and row["request_hash"] != request_hash:
+            raise HTTPException(status_code=409, detail="Idempotency key was already used for a different request.")
+        return row
+
+    def submit(self, kind: str, user_id: str, payload: dict, idempotency_key: str = None, input_file=None,
+               fingerprint: dict = None):
+        """
+        Queue a job, or return the existing one if the idempotency key was seen before.
+
+        Args:
+            kind (str): Job type, a key of the worker pool's handlers.
+            user_id (str): UID of the authenticated user who owns the job.
+            payload (dict): JSON-serializable job arguments.
+            idempotency_key (str, optional): Client-chosen key; resubmitting the same
+                request with the same key returns the original job.
+            input_file (optional): File object to spool as the job's input.
+            fingerprint (dict, optional): What identifies the request for the
+                idempotency check, when the payload holds randomized values such
+                as encrypted fields. Only its hash is stored. Defaults to the payload.
+
+        Returns:
+            tuple: (job row as a dict, whether a new job was created).
+
+        Raises:
+            HTTPException: 409 if the key was used for a different request,
+                503 if the queue is full.
+        """
+        payload_json = json.dumps(payload, sort_keys=True)
+        fingerprint_json = payload_json if fingerprint is None else json.dumps(fingerprint, sort_keys=True)
+        request_hash = hashlib.sha256(f"{kind}\0{fingerprint_json}".encode()).hexdigest()
+        conn = self._connect()
+
+        if idempotency_key:
+            existing = self._find_by_key(conn, user_id, idempotency_key, request_hash)
+            if existing is not None:
+                return dict(existing), False
+
+        queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        if queued >= self.max_queued:
+            raise HTTPException(
+                status_code=503,
+                detail="The job queue is full. Please retry shortly.",
+                headers={"Retry-After": "5"},
+            )
+
+        job_id = uuid.uuid4().hex
+        if input_file is not None:
+            self._spool(job_id, input_file)
+
+        now = self.clock()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, user_id, idempotency_key, request_hash, payload, status, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, user_id, idempotency_key, request_hash, payload_json, QUEUED, now, now),
+            )
+        except sqlite3.IntegrityError:
+            # A concurrent request with the same key won the race
+            self._remove_spool(job_id)
+            return dict(self._find_by_key(conn, user_id, idempotency_key, request_hash)), False
+        return self.get(job_id), True
+
+    def get(self, job_id: str):
+        """Job row as a dict, or None if it does not exist."""
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def count_by_status(self) -> dict:
+        """Number of jobs in each state."""
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys((QUEUED, RUNNING, SUCCEEDED, FAILED), 0)
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def claim(self):
+        """
+        Atomically move the oldest queued job to "running".
+
+        Returns:
+            dict: The claimed job, or None if the queue is empty.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = self.clock()
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, claimed_at = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, now, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row["id"])
+
+    def heartbeat(self, job_id: str, attempt: int) -> bool:
+        """
+        Refresh the claim on a running job so `requeue_stale` leaves it alone.
+
+        Args:
+            job_id (str): The running job.
+            attempt (int): The job's `attempts` when it was claimed.
+
+        Returns:
+            bool: False if the job is no longer running under this claim.
+        """
+        now = self.clock()
+        cursor = self._connect().execute(
+            "UPDATE jobs SET claimed_at = ?, updated_at = ? WHERE id = ? AND status = ? AND attempts = ?",
+            (now, now, job_id, RUNNING, attempt),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, result: dict, attempt: int = None) -> bool:
+        """
+        Store the result of a finished job and drop its spooled input.
+
+        Returns:
+            bool: False if the job is no longer running under the claim `attempt`,
+            in which case nothing is stored.
+        """
+        query = "UPDATE jobs SET status = ?, result = ?, error = NULL, updated_at = ? WHERE id = ?"
+        params = [SUCCEEDED, json.dumps(result), self.clock(), job_id]
+        if attempt is not None:
+            query += " AND status = ? AND attempts = ?"
+            params += [RUNNING, attempt]
+        if self._connect().execute(query, params).rowcount != 1:
+            return False
+        self._remove_spool(job_id)
+        return True
+
+    def fail(self, job_id: str, error: str, retry: bool = True, attempt: int = None) -> bool:
+        """
+        Record a failed attempt. The job is queued again while attempts remain
+        and `retry` is set; otherwise it is marked failed and its input dropped.
+
+        Returns:
+            bool: False if the job is gone or no longer running under the claim `attempt`.
+        """
+        job = self.get(job_id)
+        if job is None or (attempt is not None and (job["status"] != RUNNING or job["attempts"] != attempt)):
+            return False
+        if retry and job["attempts"] < self.max_attempts:
+            status = QUEUED
+        else:
+            status = FAILED
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status = ? AND attempts = ?",
+            (status, error, self.clock(), job_id, job["status"], job["attempts"]),
+        )
+        if cursor.rowcount != 1:
+            return False
+        if status == FAILED:
+            self._remove_spool(job_id)
+        return True
+
+    def release(self, job_id: str, attempt: int = None):
+        """Put a running job back in the queue without counting the attempt, e.g. on shutdown."""
+        query = "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), updated_at = ? WHERE id = ? AND status = ?"
+        params = [QUEUED, self.clock(), job_id, RUNNING]
+        if attempt is not None:
+            query += " AND attempts = ?"
+            params.append(attempt)
+        self._connect().execute(query, params)
+
+    def requeue_stale(self, stale_seconds: float = JOB_STALE_SECONDS) -> int:
+        """
+        Requeue jobs whose worker disappeared while running them, i.e. whose
+        claim has not been refreshed by a heartbeat for `stale_seconds`. Jobs that
+        already used up their attempts are failed instead, so an input that
+        crashes the worker cannot loop forever.
+
+        Returns:
+            int: Number of jobs requeued or failed.
+        """
+        now = self.clock()
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < ? THEN ? ELSE ? END,"
+            " error = CASE WHEN attempts < ? THEN error ELSE 'Worker stopped while running the job.' END,"
+            " updated_at = ? WHERE status = ? AND claimed_at < ?",
+            (self.max_attempts, QUEUED, FAILED, self.max_attempts, now, RUNNING, now - stale_seconds),
+        )
+        return cursor.rowcount
+
+    def purge(self, retention_seconds: float = JOB_RETENTION_SECONDS) -> int:
+        """
+        Delete finished jobs older than the retention period.
+
+        Returns:
+            int: Number of jobs deleted.
+        """
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (SUCCEEDED, FAILED, self.clock() - retention_seconds),
+        )
+        return cursor.rowcount
+
+def job_view(job: dict) -> dict:
+    """Public representation of a job for the status endpoint."""
+    view = {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+    if job["status"] == SUCCEEDED:
+        view["result"] = json.loads(job["result"])
+    if job["status"] == FAILED:
+        view["error"] = job["error"]
+    return view
+
+async def _run_prediction_job(store: JobStore, job: dict) -> dict:
+    payload = json.loads(job["payload"])
+    # The patient name is kept encrypted while the job waits in the queue
+    patient_name = decrypt_versioned(payload["patient_name"]) if payload.get("patient_name") else None
+    with open(store.spool_path(job["id"]), "rb") as image_file:
+        return await run_prediction(
+            payload["user_id"], image_file, payload["content_digest"],
+            patient_name, payload.get("full_resolution", False), payload.get("return_rle", False),
+        )
+
+async def _run_report_job(store: JobStore, job: dict) -> dict:
+    payload = json.loads(job["payload"])
+    severity_report = await generate_medical_report(
+        payload["features"], payload["mask_ratio"], decrypt_versioned(payload["patient_history"])
+    )
+    return {"severity_report": severity_report}
+
+# Job kinds and the coroutines that process them
+JOB_HANDLERS = {
+    "predict": _run_prediction_job,
+    "report": _run_report_job,
+}
+
+class JobWorkerPool:
+    """
+    Asyncio workers that claim jobs from a JobStore and run their handlers.
+
+    Failed attempts are retried up to the store's `max_attempts`, except for
+    client errors (4xx), which would fail the same way again. While a handler
+    runs, its claim is refreshed every `heartbeat_interval` seconds so long jobs
+    are not mistaken for abandoned ones.
+    """
+
+    def __init__(self, store: JobStore, handlers: dict = None, concurrency: int = JOB_WORKERS,
+                 poll_interval: float = JOB_POLL_INTERVAL, heartbeat_interval: float = JOB_HEARTBEAT_SECONDS):
+        self.store = store
+        self.handlers = JOB_HANDLERS if handlers is None else handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self._tasks = []
+
+    def start(self):
+        """Start the workers and the maintenance task on the running event loop."""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._work(i)) for i in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+        logging.info(f"Started {self.concurrency} job workers")
+
+    async def stop(self):
+        """Cancel the workers; jobs they were running go back to the queue."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _maintain(self):
+        while True:
+            try:
+                requeued = await run_io(self.store.requeue_stale)
+                purged = await run_io(self.store.purge)
+                if requeued or purged:
+                    logging.info(f"Job queue maintenance: requeued {requeued}, purged {purged}")
+            except Exception as e:
+                logging.error(f"Job queue maintenance failed: {e}")
+            await asyncio.sleep(_MAINTENANCE_INTERVAL)
+
+    async def _work(self, worker_id: int):
+        while True:
+            try:
+                job = await run_io(self.store.claim)
+            except Exception as e:
+                logging.error(f"Job worker {worker_id} could not claim a job: {e}")
+                job = None
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self._process(worker_id, job)
+
+    async def _heartbeat(self, job: dict):
+        # Keep the claim fresh until cancelled; a lost claim means the job was requeued
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                if not await run_io(self.store.heartbeat, job["id"], job["attempts"]):
+                    logging.warning(f"Job {job['id']} was requeued while still running; its result will be dropped")
+                    return
+            except Exception as e:
+                logging.error(f"Could not refresh the claim on job {job['id']}: {e}")
+
+    async def _process(self, worker_id: int, job: dict):
+        handler = self.handlers.get(job["kind"])
+        attempt = job["attempts"]
+        if handler is None:
+            await run_io(self.store.fail, job["id"], f"Unknown job kind: {job['kind']}", False, attempt)
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            result = await handler(self.store, job)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back right away rather than waiting for it to go stale
+            await asyncio.shield(run_io(self.store.release, job["id"], attempt))
+            raise
+        except HTTPException as e:
+            logging.error(f"Job {job['id']} failed: {e.detail}")
+            await run_io(self.store.fail, job["id"], str(e.detail), e.status_code >= 500, attempt)
+            return
+        except Exception as e:
+            logging.error(f"Job {job['id']} failed on worker {worker_id}: {e}")
+            await run_io(self.store.fail, job["id"], str(e), True, attempt)
+            return
+        finally:
+            heartbeat.cancel()
+        if not await run_io(self.store.complete, job["id"], result, attempt):
+            logging.warning(f"Job {job['id']} finished on worker {worker_id} after it was requeued; dropping the result")
+
+# Shared queue and worker pool
+job_store = JobStore()
+job_workers = JobWorkerPool(job_store)
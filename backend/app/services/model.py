@@ -1,18 +1,202 @@
 import os
-from dotenv import load_dotenv
-from tensorflow.keras.models import load_model
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from tensorflow.keras.preprocessing.image import img_to_array
+from app.utils.config import (
+    INFERENCE_MAX_BATCH_SIZE,
+    INFERENCE_MAX_WAIT_MS,
+    INFERENCE_BACKEND,
+    TFLITE_MODEL_PATH,
+    TFLITE_NUM_THREADS,
+    TILE_OVERLAP,
+)
+from app.utils.metrics import INFERENCE_BATCH_SIZE, INFERENCE_QUEUE_DEPTH, stage_timer, timed
+from app.services.registry import ModelSpec, model_registry
+from app.services.executor import run_cpu
 
 # Get model path from the environment variable
 MODEL_PATH = os.getenv("MODEL_PATH", "app/model/segmentation_model.keras")
 
+def _default_model_version(model_path):
+    # Include the file's modification time so retraining in place changes the version
+    try:
+        return f"{os.path.basename(model_path)}-{int(os.path.getmtime(model_path))}"
+    except OSError:
+        return os.path.basename(model_path)
+
 # Set image size for the model's input
 IMG_SIZE = (256, 256)
 
-# Load the model globally when the application starts
-model = load_model(MODEL_PATH)
+class KerasBackend:
+    """
+    Runs inference through the full Keras model.
+    """
+
+    def __init__(self, model_path):
+        # TensorFlow is only imported once a model is actually needed
+        from tensorflow.keras.models import load_model
+        self.model = load_model(model_path)
+
+    def predict(self, batch):
+        return self.model.predict(batch, batch_size=len(batch), verbose=0)
+
+class TFLiteBackend:
+    """
+    Runs inference through a TF-Lite model exported with app/model/export.py.
+    """
+
+    def __init__(self, model_path, num_threads=TFLITE_NUM_THREADS):
+        # Prefer the standalone runtime, which avoids loading all of TensorFlow
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        # The interpreter holds per-call state, so forward passes must not overlap
+        self._lock = threading.Lock()
+
+    def predict(self, batch):
+        with self._lock:
+            batch = batch.astype(self._input["dtype"], copy=False)
+            # Resize the input tensor when the batch size changes
+            if tuple(self._input["shape"]) != batch.shape:
+                self.interpreter.resize_tensor_input(self._input["index"], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output = self.interpreter.get_output_details()[0]
+            self.interpreter.set_tensor(self._input["index"], batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self._output["index"]).copy()
+
+def _backend_path(name):
+    if name == "keras":
+        return MODEL_PATH
+    if name == "tflite":
+        return TFLITE_MODEL_PATH
+    raise ValueError(f"Unknown inference backend: {name}")
+
+def load_backend(name=INFERENCE_BACKEND, model_path=None):
+    """
+    Load an inference backend.
+    Args:
+        name (str): "keras" or "tflite".
+        model_path (str, optional): Model file; defaults to the configured path for the backend.
+    Returns:
+        KerasBackend or TFLiteBackend: The loaded backend.
+    """
+    model_path = model_path or _backend_path(name)
+    if name == "keras":
+        return KerasBackend(model_path)
+    if name == "tflite":
+        return TFLiteBackend(model_path)
+    raise ValueError(f"Unknown inference backend: {name}")
+
+# Version identifier set through the environment, overriding the file-based default
+MODEL_VERSION = os.getenv("MODEL_VERSION")
+
+def resolve_active_spec():
+    """
+    The model that should be served: the registry's ACTIVE version when
+    MODEL_REGISTRY_DIR is set, otherwise the configured backend's model file.
+    """
+    if model_registry is not None:
+        version = model_registry.active_version()
+        if version is None:
+            raise ValueError(f"No ACTIVE model version in {model_registry.root}; activate one with app.services.registry.")
+        return model_registry.spec(version)
+    path = _backend_path(INFERENCE_BACKEND)
+    return ModelSpec(MODEL_VERSION or _default_model_version(path), path, INFERENCE_BACKEND)
+
+class LoadedModel:
+    """
+    A loaded inference backend together with the version it was loaded from.
+
+    Requests hold on to the LoadedModel they started with, so a hot reload never
+    mixes two models within one request and the old model stays usable until
+    its last request finishes.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.version = spec.version
+        self.backend = load_backend(spec.backend, spec.path)
+
+    def predict(self, batch):
+        return self.backend.predict(batch)
+
+    def warm_up(self):
+        """
+        Run a dummy batch through the model so the first real request does not
+        pay for graph tracing and memory allocation.
+        """
+        self.predict(np.zeros((1, *IMG_SIZE, 1), dtype=np.float32))
 
+# The model is loaded on first use (or by the startup warm-up) rather than at import
+_current_model = None
+_model_lock = threading.Lock()
+
+def current_model():
+    """
+    Return the model currently being served, loading it on the first call.
+    """
+    global _current_model
+    if _current_model is None:
+        with _model_lock:
+            if _current_model is None:
+                spec = resolve_active_spec()
+                logging.info(f"Loading {spec.backend} model {spec.version} from {spec.path}")
+                _current_model = LoadedModel(spec)
+    return _current_model
+
+def current_model_version():
+    """
+    Version of the model being served, without loading it.
+    """
+    model = _current_model
+    return model.version if model is not None else resolve_active_spec().version
+
+def reload_model(spec=None):
+    """
+    Load and warm up a model, then atomically make it the served model.
+
+    Requests already running keep the model they started with; new requests use
+    the new one. If loading fails the current model stays in place.
+
+    Args:
+        spec (ModelSpec, optional): Model to load; defaults to the active one.
+
+    Returns:
+        LoadedModel: The newly served model.
+    """
+    global _current_model
+    spec = spec or resolve_active_spec()
+    logging.info(f"Loading {spec.backend} model {spec.version} from {spec.path}")
+    model = LoadedModel(spec)
+    model.warm_up()
+    with _model_lock:
+        previous, _current_model = _current_model, model
+    logging.info(f"Now serving model {model.version}" + (f" (was {previous.version})" if previous else ""))
+    return model
+
+def is_model_loaded():
+    """
+    Whether the inference backend has been loaded.
+    """
+    return _current_model is not None
+
+def warm_up():
+    """
+    Load the model and run a dummy batch through it so the first real request
+    does not pay for graph tracing and memory allocation.
+    """
+    current_model().warm_up()
+
+@timed("preprocess")
 def preprocess_image(image):
     """
     Preprocess the input image for prediction.
@@ -23,7 +207,7 @@ def preprocess_image(image):
     """
     image = image.convert("L")  # Convert to grayscale
     image = image.resize(IMG_SIZE)  # Resize to model's input size
-    image = img_to_array(image) / 255.0  # Normalize pixel values to [0, 1]
+    image = np.asarray(image, dtype=np.float32)[..., np.newaxis] / 255.0  # Normalize pixel values to [0, 1]
     return np.expand_dims(image, axis=0)  # Add batch dimension
 
 def predict_mask(preprocessed_image):
@@ -34,5 +218,270 @@ def predict_mask(preprocessed_image):
     Returns:
         np.ndarray: Predicted mask.
     """
-    prediction = model.predict(preprocessed_image)
+    prediction = current_model().predict(preprocessed_image)
     return prediction.squeeze()  # Remove batch dimension
+
+def predict_batch(batch, model=None):
+    """
+    Run a single forward pass over a stacked batch of preprocessed images.
+    Args:
+        batch (np.ndarray): Array of shape (N, 256, 256, 1).
+        model (LoadedModel, optional): Model to use; defaults to the served model.
+    Returns:
+        np.ndarray: Predicted masks of shape (N, 256, 256, 1).
+    """
+    return (model or current_model()).predict(batch)
+
+class BatchInferenceEngine:
+    """
+    Collects preprocessed images from concurrent requests and runs them through
+    the model as one batch.
+
+    A batch is dispatched as soon as `max_batch_size` images are waiting or
+    `max_wait_ms` has passed since the first image of the batch arrived. The
+    forward pass runs on a dedicated thread so the event loop stays free.
+
+    Requests pinned to different models (during a hot reload) are collected
+    together but run as one forward pass per model.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=INFERENCE_MAX_BATCH_SIZE, max_wait_ms=INFERENCE_MAX_WAIT_MS):
+        self._predict_fn = predict_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._queue = None
+        self._worker = None
+        self._listeners = []
+        # Requests taken off the queue for the batch being collected or run
+        self._in_flight = []
+
+    def add_listener(self, listener):
+        """
+        Call `listener(inputs, outputs, seconds)` on the event loop after every
+        forward pass, e.g. to compare a shadow model against production.
+        """
+        self._listeners.append(listener)
+
+    def _ensure_started(self):
+        # The queue and worker are bound to the running loop, so create them lazily
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, preprocessed_image, model=None):
+        """
+        Queue a preprocessed image and wait for its prediction.
+        Args:
+            preprocessed_image (np.ndarray): Array of shape (N, 256, 256, 1).
+            model (LoadedModel, optional): Model to run; defaults to the served model.
+        Returns:
+            np.ndarray: Predictions for the submitted images, shape (N, 256, 256, 1).
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((preprocessed_image, future, model))
+        return await future
+
+    async def _collect_batch(self):
+        # Block for the first item, then gather more until the batch is full or the wait expires
+        batch = self._in_flight = [await self._queue.get()]
+        size = len(batch[0][0])
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - loop.time()
+            try:
+                if timeout <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+
+            # Skip requests whose callers have already gone away
+            batch = [item for item in batch if not item[1].done()]
+
+            # One forward pass per model; normally there is only one
+            groups = {}
+            for images, future, model in batch:
+                groups.setdefault(model, []).append((images, future))
+            for model, group in groups.items():
+                await self._forward(loop, model, group)
+            self._in_flight = []
+
+    async def _forward(self, loop, model, group):
+        inputs = np.concatenate([images for images, _ in group], axis=0)
+        INFERENCE_BATCH_SIZE.observe(len(inputs))
+        start = loop.time()
+        try:
+            with stage_timer("forward"):
+                outputs = await loop.run_in_executor(self._executor, self._predict_fn, inputs, model)
+        except Exception as e:
+            logging.error(f"Batched inference failed: {e}")
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        seconds = loop.time() - start
+
+        # Hand each request back its own slice of the batch
+        offset = 0
+        for images, future in group:
+            count = len(images)
+            if not future.done():
+                future.set_result(outputs[offset:offset + count])
+            offset += count
+
+        for listener in self._listeners:
+            try:
+                listener(inputs, outputs, seconds)
+            except Exception as e:
+                logging.error(f"Inference listener failed: {e}")
+
+    def queue_depth(self):
+        """
+        Number of requests waiting for a batch.
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def stop(self):
+        """
+        Stop the batching worker and fail any requests still waiting.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        # Fail both the requests of the interrupted batch and those still queued
+        pending = [future for _, future, _ in self._in_flight]
+        self._in_flight = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future, _ = self._queue.get_nowait()
+                pending.append(future)
+        for future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Inference engine stopped"))
+
+# Shared engine used by the API routes
+inference_engine = BatchInferenceEngine(predict_batch)
+INFERENCE_QUEUE_DEPTH.set_function(inference_engine.queue_depth)
+
+async def predict_mask_async(preprocessed_image, model=None):
+    """
+    Generate the segmentation mask through the shared batching engine.
+    Args:
+        preprocessed_image: Preprocessed input image with a batch dimension of one.
+        model (LoadedModel, optional): Model to run; defaults to the served model.
+    Returns:
+        np.ndarray: Predicted mask.
+    """
+    prediction = await inference_engine.submit(preprocessed_image, model)
+    return prediction.squeeze()  # Remove batch dimension
+
+async def predict_masks_async(preprocessed_images, model=None):
+    """
+    Generate masks for a stack of images in one submission to the batching engine.
+    Args:
+        preprocessed_images (np.ndarray): Array of shape (N, 256, 256, 1).
+        model (LoadedModel, optional): Model to run; defaults to the served model.
+    Returns:
+        np.ndarray: Predicted masks of shape (N, 256, 256).
+    """
+    predictions = await inference_engine.submit(preprocessed_images, model)
+    return predictions[..., 0]
+
+@timed("preprocess")
+def preprocess_full_resolution(image):
+    """
+    Preprocess the input image for tiled prediction, keeping its original size.
+    Args:
+        image (PIL.Image): Input image.
+    Returns:
+        np.ndarray: Normalized grayscale image of shape (H, W).
+    """
+    image = image.convert("L")  # Convert to grayscale
+    return np.asarray(image, dtype=np.float32) / 255.0  # Normalize pixel values to [0, 1]
+
+def _tile_starts(length, tile, stride):
+    # Evenly strided offsets, plus a final tile flush with the far edge
+    starts = list(range(0, length - tile + 1, stride))
+    if starts[-1] + tile < length:
+        starts.append(length - tile)
+    return starts
+
+def _blend_window(tile, overlap):
+    # Weights ramp up across the overlap so neighbouring tiles fade into each other
+    ramp = np.minimum(np.arange(1, tile + 1), np.arange(tile, 0, -1)) / (overlap + 1)
+    ramp = np.minimum(ramp, 1.0).astype(np.float32)
+    return np.outer(ramp, ramp)
+
+def _stack_tiles(padded, coords, tile):
+    # Cut tiles out of the padded image as one (N, tile, tile, 1) batch
+    return np.stack([padded[y:y + tile, x:x + tile] for y, x in coords])[..., np.newaxis]
+
+def _accumulate_tiles(mask_sum, weight_sum, coords, predictions, window):
+    # Add window-weighted tile predictions into the full-resolution accumulators, in place
+    tile = window.shape[0]
+    for (y, x), prediction in zip(coords, predictions):
+        mask_sum[y:y + tile, x:x + tile] += prediction[..., 0] * window
+        weight_sum[y:y + tile, x:x + tile] += window
+
+def _blend_result(mask_sum, weight_sum, height, width):
+    return (mask_sum / weight_sum)[:height, :width]
+
+async def predict_mask_tiled(image, overlap=TILE_OVERLAP, tiles_per_batch=INFERENCE_MAX_BATCH_SIZE, model=None):
+    """
+    Generate a full-resolution mask by running overlapping 256x256 tiles through
+    the batching engine and blending them back together.
+
+    Tiles are generated and submitted `tiles_per_batch` at a time, so only the
+    output accumulators grow with the image size. Tiling and blending run on the
+    CPU pool, so large images do not stall the event loop.
+
+    Args:
+        image (np.ndarray): Normalized grayscale image of shape (H, W).
+        overlap (int): Overlap in pixels between neighbouring tiles.
+        tiles_per_batch (int): Number of tiles submitted per forward pass.
+        model (LoadedModel, optional): Model to run; defaults to the served model.
+    Returns:
+        np.ndarray: Predicted mask of shape (H, W).
+    """
+    tile = IMG_SIZE[0]
+    overlap = min(max(overlap, 0), tile // 2)
+    height, width = image.shape
+
+    # Pad images smaller than a tile up to the tile size
+    padded = await run_cpu(np.pad, image, ((0, max(tile - height, 0)), (0, max(tile - width, 0))))
+    padded_height, padded_width = padded.shape
+
+    stride = tile - overlap
+    coords = [
+        (y, x)
+        for y in _tile_starts(padded_height, tile, stride)
+        for x in _tile_starts(padded_width, tile, stride)
+    ]
+
+    window = _blend_window(tile, overlap)
+    mask_sum = np.zeros(padded.shape, dtype=np.float32)
+    weight_sum = np.zeros(padded.shape, dtype=np.float32)
+
+    for i in range(0, len(coords), max(tiles_per_batch, 1)):
+        chunk = coords[i:i + tiles_per_batch]
+        batch = await run_cpu(_stack_tiles, padded, chunk, tile)
+        predictions = await inference_engine.submit(batch, model)
+        await run_cpu(_accumulate_tiles, mask_sum, weight_sum, chunk, predictions, window)
+
+    return await run_cpu(_blend_result, mask_sum, weight_sum, height, width)
@@ -1,65 +1,250 @@
 # openai_service.py
 
-import openai
-from PIL import Image
+import json
+import random
+import asyncio
+import hashlib
 import logging
+from collections import OrderedDict
+import httpx
+from PIL import Image
 import numpy as np
-from app.utils.config import OPENAI_API_KEY
-
-openai.api_key = OPENAI_API_KEY
+from app.services.features import extract_mask_features
+from app.utils.config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    OPENAI_MODEL,
+    REPORT_TIMEOUT_SECONDS,
+    REPORT_MAX_CONCURRENCY,
+    REPORT_MAX_RETRIES,
+    REPORT_MAX_RETRY_AFTER_SECONDS,
+    REPORT_CACHE_SIZE,
+)
+from app.utils.metrics import CACHE_REQUESTS
 
-# Function to extract image features and calculate pixel ratio (mask-to-image ratio)
-def extract_image_features(image_path, mask_path):
+# Function to extract lesion features and the mask-to-image ratio from uploaded images
+def extract_image_features(image_file, mask_file):
     try:
-        # Open original image and mask image files
-        original_image = Image.open(image_path)
-        mask_image = Image.open(mask_path)
-        
-        # Convert images to RGB
-        original_image = original_image.convert("RGB")  # Ensure it's RGB
-        mask_image = mask_image.convert("L")  # Convert mask to grayscale
-        
-        # Convert images to numpy arrays
-        original_image_np = np.array(original_image)
-        mask_image_np = np.array(mask_image)
-        
-        # Calculate the number of masked pixels
-        masked_pixels = np.sum(mask_image_np > 0)  # Assuming non-zero values indicate the mask
-        
-        # Calculate the ratio of masked pixels to total pixels
-        total_pixels = original_image_np.shape[0] * original_image_np.shape[1]
-        mask_ratio = masked_pixels / total_pixels
-
-        # Create an embedding (for simplicity, let's assume it's a placeholder function for CLIP)
-        image_embedding = "image_embedding_placeholder"  # Ideally, call CLIP here
-
-        # Return the image embedding and mask ratio
-        return image_embedding, mask_ratio
+        # Decode both images once, in memory (paths or file objects)
+        with Image.open(image_file) as original_image, Image.open(mask_file) as mask_image:
+            original_image = original_image.convert("L")
+            mask_image = mask_image.convert("L")
+
+            # Bring the mask to the image's size so the statistics line up
+            if mask_image.size != original_image.size:
+                mask_image = mask_image.resize(original_image.size, Image.NEAREST)
+
+            original_image_np = np.asarray(original_image)
+            mask_image_np = np.asarray(mask_image)
+
+        features = extract_mask_features(mask_image_np, original_image_np)
+
+        # Return the lesion features and mask ratio
+        return features, features["lesion_area_ratio"]
     except Exception as e:
         logging.error(f"Error extracting image features: {str(e)}")
         raise
 
-# Function to generate a medical report from image features, mask ratio, and patient history
-def generate_medical_report(image_features, mask_ratio, patient_history):
-    try:
-        # Create the prompt for GPT-4
-        prompt = f"""
+# Build the prompt for the report from image features, mask ratio, and patient history
+def build_report_prompt(image_features, mask_ratio, patient_history):
+    return f"""
         Based on the following image features, mask-to-image ratio, and the patient's history, generate a severity report:
         Image Features: {image_features}
         Mask-to-Image Ratio: {mask_ratio:.2%}
         Patient History: {patient_history}
         Generate a detailed severity report describing the MRI scan, the severity of the condition, and any treatment recommendations.
         """
-        
-        # Send prompt to OpenAI's GPT model
-        response = openai.Completion.create(
-            model="gpt-4",
-            prompt=prompt,
-            max_tokens=500,
-            temperature=0.7
-        )
-        
-        return response.choices[0].text.strip()
+
+# Status codes worth retrying: rate limiting and transient server errors
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+class ReportService:
+    """
+    Async client for generating medical reports through an OpenAI-compatible
+    chat completions API.
+
+    Requests share one pooled HTTP client, at most `max_concurrency` run at once,
+    transient failures are retried with exponential backoff (or the server's
+    Retry-After, capped at `max_retry_after` seconds), and finished reports
+    are cached by (features, mask ratio, patient history hash). Pointing
+    `base_url` at a local stub server makes the service testable offline.
+    """
+
+    def __init__(self, base_url=OPENAI_BASE_URL, api_key=OPENAI_API_KEY, model=OPENAI_MODEL,
+                 timeout=REPORT_TIMEOUT_SECONDS, max_concurrency=REPORT_MAX_CONCURRENCY,
+                 max_retries=REPORT_MAX_RETRIES, cache_size=REPORT_CACHE_SIZE, transport=None,
+                 max_retry_after=REPORT_MAX_RETRY_AFTER_SECONDS):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.cache_size = cache_size
+        # Custom httpx transport, e.g. an httpx.MockTransport serving canned reports
+        self.transport = transport
+        self._cache = OrderedDict()
+        self._client = None
+        self._semaphore = None
+
+    def _get_client(self):
+        # Created lazily so the client and semaphore bind to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=self.timeout,
+                transport=self.transport,
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def aclose(self):
+        """
+        Close the pooled HTTP client.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def cache_key(image_features, mask_ratio, patient_history):
+        history_hash = hashlib.sha256(patient_history.encode()).hexdigest()
+        features = json.dumps(image_features, sort_keys=True, default=str)
+        return hashlib.sha256(f"{features}|{mask_ratio:.6f}|{history_hash}".encode()).hexdigest()
+
+    def _cache_get(self, key):
+        report = self._cache.get(key)
+        if report is not None:
+            self._cache.move_to_end(key)
+        CACHE_REQUESTS.labels("report", "hit" if report is not None else "miss").inc()
+        return report
+
+    def _cache_put(self, key, report):
+        self._cache[key] = report
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _payload(self, prompt, stream):
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 500,
+            "temperature": 0.7,
+            "stream": stream,
+        }
+
+    async def _backoff(self, attempt, response=None):
+        # Honour Retry-After (in seconds, capped) when given, otherwise back off exponentially with jitter
+        delay = None
+        if response is not None:
+            try:
+                delay = min(max(float(response.headers.get("retry-after")), 0.0), self.max_retry_after)
+            except (TypeError, ValueError):
+                delay = None
+        if delay is None:
+            delay = min(2 ** attempt, 30) * (0.5 + random.random() / 2)
+        await asyncio.sleep(delay)
+
+    async def _send(self, payload):
+        # Open a (streaming) response, retrying transient failures before any output is read
+        client = self._get_client()
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                request = client.build_request("POST", "/chat/completions", json=payload)
+                response = await client.send(request, stream=True)
+                if response.status_code not in _RETRYABLE_STATUS or attempt == self.max_retries:
+                    if response.status_code >= 400:
+                        await response.aread()
+                        response.raise_for_status()
+                    return response
+                # Drain the (small) error body so the connection goes back to the pool
+                await response.aread()
+                await response.aclose()
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if attempt == self.max_retries:
+                    raise
+                logging.warning(f"Report request failed ({e}), retrying")
+            await self._backoff(attempt, response)
+
+    async def generate(self, image_features, mask_ratio, patient_history):
+        """
+        Generate (or fetch from cache) a severity report.
+
+        Args:
+            image_features: Features extracted from the MRI image and mask.
+            mask_ratio (float): Mask-to-image ratio.
+            patient_history (str): Patient history text.
+
+        Returns:
+            str: The generated report.
+        """
+        key = self.cache_key(image_features, mask_ratio, patient_history)
+        report = self._cache_get(key)
+        if report is not None:
+            return report
+
+        prompt = build_report_prompt(image_features, mask_ratio, patient_history)
+        self._get_client()
+        async with self._semaphore:
+            response = await self._send(self._payload(prompt, stream=False))
+            try:
+                body = json.loads(await response.aread())
+            finally:
+                await response.aclose()
+
+        report = body["choices"][0]["message"]["content"].strip()
+        self._cache_put(key, report)
+        return report
+
+    async def stream(self, image_features, mask_ratio, patient_history):
+        """
+        Generate a severity report, yielding text as it arrives. Cached reports are
+        yielded in one piece; completed streams are added to the cache.
+
+        Yields:
+            str: Chunks of the report.
+        """
+        key = self.cache_key(image_features, mask_ratio, patient_history)
+        report = self._cache_get(key)
+        if report is not None:
+            yield report
+            return
+
+        prompt = build_report_prompt(image_features, mask_ratio, patient_history)
+        self._get_client()
+        parts = []
+        async with self._semaphore:
+            response = await self._send(self._payload(prompt, stream=True))
+            try:
+                # Server-sent events: "data: {json}" lines, terminated by "data: [DONE]"
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            finally:
+                await response.aclose()
+
+        self._cache_put(key, "".join(parts).strip())
+
+# Shared report service used by the API routes
+report_service = ReportService()
+
+# Function to generate a medical report from image features, mask ratio, and patient history
+async def generate_medical_report(image_features, mask_ratio, patient_history):
+    try:
+        return await report_service.generate(image_features, mask_ratio, patient_history)
     except Exception as e:
         logging.error(f"Error generating medical report: {str(e)}")
         raise
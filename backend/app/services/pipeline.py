@@ -0,0 +1,167 @@
+import re
+import asyncio
+import time
+from fastapi import HTTPException
+from PIL import Image, UnidentifiedImageError
+from app.services.firebase import upload_to_firebase, upload_file_to_firebase, save_prediction_records
+from app.services.model import (
+    current_model,
+    predict_mask_async,
+    predict_mask_tiled,
+    preprocess_image,
+    preprocess_full_resolution,
+)
+from app.services.executor import run_cpu, run_io
+from app.services.cache import prediction_cache
+from app.services.features import extract_mask_features
+from app.utils.encryption import encrypt_versioned
+from app.utils.search_index import name_index_fields
+from app.utils.metrics import timed
+from app.utils.mask_codec import MASK_CONTENT_TYPE, MASK_EXTENSION, MASK_FORMAT, decode_mask_image, encode_png, encode_rle
+from app.model.postprocess import apply_threshold_to_predictions
+
+@timed("decode")
+def decode_image(image_file) -> Image.Image:
+    """Decode an uploaded file into a fully loaded PIL image, straight from its spooled buffer."""
+    try:
+        image_file.seek(0)
+        input_image = Image.open(image_file)
+        input_image.load()
+        return input_image
+    except (UnidentifiedImageError, OSError):
+        raise HTTPException(status_code=400, detail="Invalid image file. Could not process the uploaded image.")
+
+@timed("encode")
+def encode_mask(predicted_mask) -> bytes:
+    """Threshold a predicted mask and encode it losslessly as a 1-bit PNG."""
+    return encode_png(apply_threshold_to_predictions(predicted_mask))
+
+def mask_rle(mask_bytes: bytes) -> dict:
+    """Run-length encoding of a stored mask image, for returning masks inline."""
+    return encode_rle(decode_mask_image(mask_bytes))
+
+def mask_file_name(base_name: str, model_version: str = None) -> str:
+    """
+    Storage file name of the mask for an upload. Masks written for a specific
+    model version, e.g. by the backfill, get the version in their name so they
+    never replace a mask that records still point at.
+    """
+    if model_version:
+        return f"{base_name}_mask_{re.sub(r'[^A-Za-z0-9.-]+', '-', model_version)}.{MASK_EXTENSION}"
+    return f"{base_name}_mask.{MASK_EXTENSION}"
+
+def prediction_cache_key(user_id: str, content_digest: str, model_version: str, full_resolution: bool = False) -> str:
+    """Cache key for a user's upload under a model version and the current mask format."""
+    model_key = f"{model_version}:{MASK_FORMAT}"
+    if full_resolution:
+        model_key += ":tiled"
+    return prediction_cache.make_key(user_id, content_digest, model_key)
+
+async def run_prediction(user_id: str, image_file, content_digest: str,
+                         patient_name: str = None, full_resolution: bool = False,
+                         return_rle: bool = False) -> dict:
+    """
+    Predict the mask for one uploaded image, upload the image and mask to Firebase
+    Storage and store the URLs, lesion features and patient record in Firestore.
+
+    Shared by the synchronous /predict endpoint and the background job workers.
+
+    Args:
+        user_id (str): ID of the user the prediction belongs to.
+        image_file: Seekable file object holding the uploaded JPEG.
+        content_digest (str): SHA-256 of the upload, used as the cache key.
+        patient_name (str, optional): Patient to store the result under.
+        full_resolution (bool): Predict tile by tile at the image's own size.
+        return_rle (bool): Also return the mask inline, run-length encoded.
+
+    Returns:
+        dict: The prediction result: image and mask URLs, lesion features, the
+        model version, whether the result came from the cache and, if
+        requested, `mask_rle`.
+    """
+    input_image = await run_cpu(decode_image, image_file)
+
+    # Pin the served model so a hot reload cannot change it halfway through the request
+    model = await run_cpu(current_model)
+
+    # Reuse the stored mask and URLs if this user already uploaded this exact image
+    cache_key = prediction_cache_key(user_id, content_digest, model.version, full_resolution)
+    cached = await run_io(prediction_cache.get, cache_key)
+
+    if cached is not None:
+        original_image_url = cached["original_image_url"]
+        mask_image_url = cached["mask_image_url"]
+        mask_features = cached.get("features")
+        mask_bytes = cached["mask"]
+    else:
+        # Generate a unique filename based on user_id and current time
+        timestamp = int(time.time())
+        base_name = f"{user_id}_{timestamp}"
+
+        # Start uploading the original image while inference runs
+        original_upload = asyncio.ensure_future(
+            run_io(upload_file_to_firebase, "procare-images/image", f"{base_name}_original.jpg", image_file, "image/jpeg")
+        )
+        try:
+            # Preprocess the image and make a prediction
+            if full_resolution:
+                preprocessed_image = await run_cpu(preprocess_full_resolution, input_image)
+                predicted_mask = await predict_mask_tiled(preprocessed_image, model=model)
+                model_input = preprocessed_image
+            else:
+                preprocessed_image = await run_cpu(preprocess_image, input_image)
+                predicted_mask = await predict_mask_async(preprocessed_image, model)
+                model_input = preprocessed_image[0, ..., 0]
+
+            # Threshold the prediction into a 1-bit PNG and describe the lesion
+            mask_bytes, mask_features = await asyncio.gather(
+                run_cpu(encode_mask, predicted_mask),
+                run_cpu(extract_mask_features, predicted_mask, model_input),
+            )
+
+            # Upload the mask image to Firebase alongside the pending original upload
+            original_image_url, mask_image_url = await asyncio.gather(
+                original_upload,
+                run_io(upload_to_firebase, "procare-images/mask", mask_file_name(base_name), mask_bytes, MASK_CONTENT_TYPE),
+            )
+        except BaseException:
+            original_upload.cancel()
+            raise
+
+        await run_io(prediction_cache.put, cache_key, {
+            "mask": mask_bytes,
+            "mask_content_type": MASK_CONTENT_TYPE,
+            "original_image_url": original_image_url,
+            "mask_image_url": mask_image_url,
+            "features": mask_features,
+            "model_version": model.version,
+        })
+
+    # Store the image URLs, lesion features and the patient record in one batched write
+    patient_record = None
+    if patient_name:
+        patient_record = {
+            'name': encrypt_versioned(patient_name),
+            **name_index_fields(patient_name),
+            'doctor_id': user_id,
+            'results': {
+                'original_image_url': original_image_url,
+                'mask_image_url': mask_image_url,
+                'features': mask_features,
+                'model_version': model.version,
+            }
+        }
+    await run_io(save_prediction_records, user_id, original_image_url, mask_image_url,
+                 patient_record, mask_features, model.version)
+
+    result = {
+        "message": "Prediction successful",
+        "original_image_url": original_image_url,
+        "mask_image_url": mask_image_url,
+        "features": mask_features,
+        "model_version": model.version,
+        "cached": cached is not None,
+    }
+    if return_rle:
+        result["mask_rle"] = await run_cpu(mask_rle, mask_bytes)
+    return result
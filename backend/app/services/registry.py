@@ -0,0 +1,196 @@
+import os
+import shutil
+import hashlib
+import argparse
+import tempfile
+from collections import namedtuple
+from app.utils.config import MODEL_REGISTRY_DIR, SHADOW_MODEL_VERSION
+
+# A model artifact to serve: version identifier, file path and inference backend
+ModelSpec = namedtuple("ModelSpec", ["version", "path", "backend"])
+
+# Artifact file names inside a version directory and the backend that serves them
+ARTIFACT_BACKENDS = {
+    "model.tflite": "tflite",
+    "model.keras": "keras",
+    "model.h5": "keras",
+}
+
+# Pointer files naming the served and the shadow version
+ACTIVE_FILE = "ACTIVE"
+SHADOW_FILE = "SHADOW"
+
+def _write_pointer(path, value):
+    # Replace the pointer atomically so readers never see a partial version name
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(value + "\n")
+    os.replace(tmp_path, path)
+
+def _read_pointer(path):
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+class ModelRegistry:
+    """
+    Directory of versioned model artifacts.
+
+    Each version lives in its own directory holding one artifact
+    (`model.keras`, `model.h5` or `model.tflite`). The `ACTIVE` file names the
+    version to serve and the optional `SHADOW` file a candidate to compare
+    against it. Versions are immutable; switching models only rewrites a pointer
+    file, which every worker picks up on its next poll.
+
+        registry/
+            ACTIVE
+            SHADOW
+            unet-3f2a9c1b7e4d/model.keras
+            unet-small-91be02c4aa10/model.tflite
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def versions(self):
+        """Versions with an artifact, sorted by name."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name)) and self._artifact_name(name)
+        )
+
+    def _artifact_name(self, version):
+        directory = os.path.join(self.root, version)
+        for name in ARTIFACT_BACKENDS:
+            if os.path.isfile(os.path.join(directory, name)):
+                return name
+        return None
+
+    def spec(self, version):
+        """
+        Artifact of a version.
+
+        Raises:
+            ValueError: If the version does not exist.
+        """
+        name = self._artifact_name(version) if version else None
+        if name is None:
+            raise ValueError(f"Model version {version!r} is not in the registry at {self.root}")
+        return ModelSpec(version, os.path.join(self.root, version, name), ARTIFACT_BACKENDS[name])
+
+    def active_version(self):
+        """Version named by the ACTIVE pointer, or None."""
+        return _read_pointer(os.path.join(self.root, ACTIVE_FILE))
+
+    def shadow_version(self):
+        """Version named by the SHADOW pointer, or None."""
+        return _read_pointer(os.path.join(self.root, SHADOW_FILE))
+
+    def activate(self, version):
+        """Serve `version` from now on."""
+        self.spec(version)
+        _write_pointer(os.path.join(self.root, ACTIVE_FILE), version)
+
+    def set_shadow(self, version):
+        """Shadow `version` against the active model, or stop shadowing with None."""
+        path = os.path.join(self.root, SHADOW_FILE)
+        if version is None:
+            if os.path.exists(path):
+                os.unlink(path)
+            return
+        self.spec(version)
+        _write_pointer(path, version)
+
+    def register(self, artifact_path, version=None):
+        """
+        Copy a model artifact into the registry as a new version.
+
+        Args:
+            artifact_path (str): .keras, .h5 or .tflite file.
+            version (str, optional): Version name; defaults to the file name
+                followed by the first 12 hex digits of its SHA-256.
+
+        Returns:
+            str: The new version.
+        """
+        extension = os.path.splitext(artifact_path)[1].lower()
+        artifact_name = f"model{extension}"
+        if artifact_name not in ARTIFACT_BACKENDS:
+            raise ValueError(f"Unsupported model artifact: {artifact_path}")
+
+        if version is None:
+            digest = hashlib.sha256()
+            with open(artifact_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            stem = os.path.splitext(os.path.basename(artifact_path))[0]
+            version = f"{stem}-{digest.hexdigest()[:12]}"
+
+        target = os.path.join(self.root, version)
+        if os.path.exists(target):
+            raise ValueError(f"Model version {version!r} already exists")
+
+        # Copy into a temporary directory and rename it, so a version appears complete or not at all
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.root, prefix=".staging-")
+        try:
+            shutil.copy2(artifact_path, os.path.join(staging, artifact_name))
+            os.rename(staging, target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return version
+
+# Shared registry, or None when models are configured through MODEL_PATH / TFLITE_MODEL_PATH
+model_registry = ModelRegistry(MODEL_REGISTRY_DIR) if MODEL_REGISTRY_DIR else None
+
+def resolve_shadow_spec():
+    """
+    Candidate model to shadow: SHADOW_MODEL_VERSION if set, otherwise the
+    registry's SHADOW pointer. None when shadowing is off.
+    """
+    if model_registry is None:
+        return None
+    version = SHADOW_MODEL_VERSION or model_registry.shadow_version()
+    return model_registry.spec(version) if version else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the versioned model registry.")
+    parser.add_argument("--root", default=MODEL_REGISTRY_DIR, required=not MODEL_REGISTRY_DIR,
+                        help="Registry directory (defaults to MODEL_REGISTRY_DIR).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List versions and the active and shadow pointers.")
+    register = commands.add_parser("register", help="Add a model artifact as a new version.")
+    register.add_argument("artifact")
+    register.add_argument("--version")
+    register.add_argument("--activate", action="store_true", help="Serve the new version right away.")
+    activate = commands.add_parser("activate", help="Serve a version.")
+    activate.add_argument("version")
+    shadow = commands.add_parser("shadow", help="Shadow a version against the active one.")
+    shadow.add_argument("version", nargs="?", help="Version to shadow; omit to stop shadowing.")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root)
+    if args.command == "list":
+        active, candidate = registry.active_version(), registry.shadow_version()
+        for version in registry.versions():
+            marker = " (active)" if version == active else " (shadow)" if version == candidate else ""
+            print(f"{version}{marker}")
+    elif args.command == "register":
+        version = registry.register(args.artifact, args.version)
+        if args.activate:
+            registry.activate(version)
+        print(f"Registered {version}{' and activated it' if args.activate else ''}")
+    elif args.command == "activate":
+        registry.activate(args.version)
+        print(f"Activated {args.version}")
+    elif args.command == "shadow":
+        registry.set_shadow(args.version)
+        print(f"Shadowing {args.version}" if args.version else "Stopped shadowing")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import time
+import random
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from app.model.postprocess import overlap_metrics
+from app.services.executor import run_cpu, run_io
+from app.services.model import LoadedModel, current_model, inference_engine, is_model_loaded, reload_model, resolve_active_spec
+from app.services.registry import resolve_shadow_spec
+from app.utils.config import MODEL_RELOAD_POLL_SECONDS, SHADOW_MAX_PENDING, SHADOW_SAMPLE_RATE
+from app.utils.metrics import SHADOW_DICE, SHADOW_SECONDS, SHADOW_SKIPPED
+
+class ShadowRunner:
+    """
+    Runs a candidate model on a sample of production batches and records its
+    latency and its agreement (Dice) with the production masks.
+
+    The candidate runs on its own thread after production has answered, so it
+    never delays a request. At most `max_pending` batches are shadowed at once;
+    sampled batches beyond that are skipped rather than queued.
+
+    Args:
+        sample_rate (float): Fraction of forward passes to shadow.
+        max_pending (int): Shadow runs allowed in flight.
+    """
+
+    def __init__(self, sample_rate=SHADOW_SAMPLE_RATE, max_pending=SHADOW_MAX_PENDING):
+        self.sample_rate = sample_rate
+        self.max_pending = max(1, max_pending)
+        self.model = None
+        self._pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+
+    @property
+    def spec(self):
+        return self.model.spec if self.model is not None else None
+
+    def __call__(self, inputs, outputs, seconds):
+        # Inference engine listener, called on the event loop after each forward pass
+        model = self.model
+        if model is None or random.random() >= self.sample_rate:
+            return
+        if self._pending >= self.max_pending:
+            SHADOW_SKIPPED.inc()
+            return
+        self._pending += 1
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, self._compare, model, inputs, outputs, seconds
+        )
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        self._pending -= 1
+        if not future.cancelled() and future.exception() is not None:
+            logging.error(f"Shadow inference failed: {future.exception()}")
+
+    def _compare(self, model, inputs, outputs, production_seconds):
+        start = time.perf_counter()
+        candidate = model.predict(inputs)
+        seconds = time.perf_counter() - start
+
+        dice = overlap_metrics(outputs[..., 0] > 0.5, candidate[..., 0] > 0.5)["dice"]
+        SHADOW_SECONDS.labels(model.version).observe(seconds)
+        for value in dice:
+            SHADOW_DICE.labels(model.version).observe(value)
+        logging.info(
+            f"Shadow {model.version}: {len(inputs)} image(s) in {seconds * 1000:.1f} ms "
+            f"(production {production_seconds * 1000:.1f} ms), "
+            f"Dice mean {dice.mean():.4f} min {dice.min():.4f}"
+        )
+
+# Shared shadow runner, fed by every batch of the shared inference engine
+shadow_runner = ShadowRunner()
+inference_engine.add_listener(shadow_runner)
+
+def _load_warm(spec):
+    model = LoadedModel(spec)
+    model.warm_up()
+    return model
+
+async def sync_models(failed):
+    """
+    Bring the served and shadow models in line with the registry.
+
+    Args:
+        failed (set): Specs that failed to load; they are not retried until they change.
+    """
+    # Swap the served model once it is loaded; before that the first request loads the active one
+    active = await run_io(resolve_active_spec)
+    if is_model_loaded() and active != current_model().spec and active not in failed:
+        try:
+            await run_cpu(reload_model, active)
+        except Exception as e:
+            failed.add(active)
+            logging.error(f"Failed to load model {active.version}, keeping {current_model().version}: {e}")
+
+    shadow = await run_io(resolve_shadow_spec) if SHADOW_SAMPLE_RATE > 0 else None
+    if shadow is not None and shadow.version == active.version:
+        shadow = None
+    if shadow != shadow_runner.spec and shadow not in failed:
+        if shadow is None:
+            logging.info(f"Stopped shadowing {shadow_runner.model.version}")
+            shadow_runner.model = None
+            return
+        try:
+            shadow_runner.model = await run_cpu(_load_warm, shadow)
+            logging.info(f"Shadowing {shadow.version} on {SHADOW_SAMPLE_RATE:.0%} of batches")
+        except Exception as e:
+            failed.add(shadow)
+            logging.error(f"Failed to load shadow model {shadow.version}: {e}")
+
+async def watch_models(poll_seconds=MODEL_RELOAD_POLL_SECONDS):
+    """
+    Poll the registry pointers (or the model file) and hot-swap the served and
+    shadow models when they change. Runs until cancelled.
+
+    Args:
+        poll_seconds (float): Seconds between checks.
+    """
+    failed = set()
+    while True:
+        try:
+            await sync_models(failed)
+        except Exception as e:
+            logging.error(f"Model registry check failed: {e}")
+        await asyncio.sleep(poll_seconds)
@@ -0,0 +1,90 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from app.utils.metrics import CACHE_REQUESTS
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified ID tokens.
+
+    A token is verified once through `verifier` and its decoded claims are reused
+    until the earlier of the token's own `exp` and `max_ttl` seconds after
+    verification. The short `max_ttl` bounds how long a revoked token can keep
+    being accepted; `invalidate_user` drops a user's tokens immediately.
+
+    The verifier is any callable taking the raw token and returning the decoded
+    claims (or raising), so a local fake can be plugged in for offline testing.
+    """
+
+    def __init__(self, verifier, max_entries=4096, max_ttl=300.0, clock=time.time):
+        self.verifier = verifier
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        # Keep only a digest of the token in memory
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def verify(self, token):
+        """
+        Return the decoded claims for a token, verifying it only on a cache miss.
+
+        Args:
+            token (str): Raw ID token.
+
+        Returns:
+            dict: Decoded token claims.
+        """
+        key = self._key(token)
+        now = self._clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, claims = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    CACHE_REQUESTS.labels("token", "hit").inc()
+                    return claims
+                del self._entries[key]
+
+        CACHE_REQUESTS.labels("token", "miss").inc()
+
+        # Verify outside the lock; failures are never cached
+        claims = self.verifier(token)
+
+        expires_at = now + self.max_ttl
+        if "exp" in claims:
+            expires_at = min(expires_at, float(claims["exp"]))
+
+        if expires_at > now:
+            with self._lock:
+                self._entries[key] = (expires_at, claims)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return claims
+
+    def invalidate_user(self, uid):
+        """
+        Drop every cached token belonging to a user, e.g. after revoking their sessions.
+        """
+        with self._lock:
+            stale = [key for key, (_, claims) in self._entries.items() if claims.get("uid") == uid]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        """
+        Drop every cached token.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -2,4 +2,80 @@ import os
 
 FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS", "firebase.json")
 FIREBASE_STORAGE_BUCKET = os.getenv("FIREBASE_STORAGE_BUCKET", "")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
\ No newline at end of file
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+
+# Micro-batching settings for the inference engine
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+
+# Worker pools and backpressure for the prediction pipeline
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+MAX_PENDING_PREDICTIONS = int(os.getenv("MAX_PENDING_PREDICTIONS", "32"))
+
+# Prediction cache: in-memory LRU size and optional on-disk directory
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "256"))
+PREDICTION_CACHE_DIR = os.getenv("PREDICTION_CACHE_DIR", "")
+
+# Inference backend: "keras" or "tflite" (see app/model/export.py)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "keras")
+TFLITE_MODEL_PATH = os.getenv("TFLITE_MODEL_PATH", "app/model/segmentation_model.tflite")
+TFLITE_NUM_THREADS = int(os.getenv("TFLITE_NUM_THREADS", str(os.cpu_count() or 1)))
+
+# Load the model and run a dummy batch during startup
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+# Overlap in pixels between neighbouring tiles in full-resolution inference
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", "32"))
+
+# Limits for multi-slice study uploads to /predict_batch
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", "64"))
+MAX_ARCHIVE_BYTES = int(os.getenv("MAX_ARCHIVE_BYTES", str(512 * 1024 * 1024)))
+
+# Verified Firebase ID-token cache
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+TOKEN_CACHE_MAX_TTL = float(os.getenv("TOKEN_CACHE_MAX_TTL", "300"))
+TOKEN_CHECK_REVOKED = os.getenv("TOKEN_CHECK_REVOKED", "false").lower() in ("1", "true", "yes")
+
+# Patient search: page sizes and the longest name prefix that is indexed
+PATIENTS_DEFAULT_PAGE_SIZE = int(os.getenv("PATIENTS_DEFAULT_PAGE_SIZE", "10"))
+PATIENTS_MAX_PAGE_SIZE = int(os.getenv("PATIENTS_MAX_PAGE_SIZE", "100"))
+SEARCH_INDEX_MAX_PREFIX = int(os.getenv("SEARCH_INDEX_MAX_PREFIX", "20"))
+
+# Upload size limits in bytes, per file and per request
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(512 * 1024 * 1024)))
+
+# Report generation (OpenAI-compatible chat completions API)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+REPORT_TIMEOUT_SECONDS = float(os.getenv("REPORT_TIMEOUT_SECONDS", "60"))
+REPORT_MAX_CONCURRENCY = int(os.getenv("REPORT_MAX_CONCURRENCY", "4"))
+REPORT_MAX_RETRIES = int(os.getenv("REPORT_MAX_RETRIES", "3"))
+# Upper bound on a server's Retry-After, so one response cannot stall a request for minutes
+REPORT_MAX_RETRY_AFTER_SECONDS = float(os.getenv("REPORT_MAX_RETRY_AFTER_SECONDS", "30"))
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+
+# Background prediction jobs: SQLite queue, spooled uploads and the worker pool
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "job_queue/jobs.sqlite3")
+JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", "job_queue/spool")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "600"))
+# How often a worker refreshes the claim of the job it is running; keep well below JOB_STALE_SECONDS
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+# Sampling profiler: fraction of requests profiled with cProfile, and where the .prof files go.
+# A profile covers the whole event loop while the sampled request is in flight, including other requests.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Model registry: versioned artifacts with hot reload, and shadow comparison of a candidate
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "")
+MODEL_RELOAD_POLL_SECONDS = float(os.getenv("MODEL_RELOAD_POLL_SECONDS", "10"))
+SHADOW_MODEL_VERSION = os.getenv("SHADOW_MODEL_VERSION", "")
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0"))
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "1"))
@@ -12,17 +12,120 @@ if not ENCRYPTION_KEY:
 # Ensure the key is 32 bytes (256 bits) long by hashing the ENCRYPTION_KEY
 key = hashlib.sha256(ENCRYPTION_KEY.encode()).digest()
 
+# ECB keeps no state between calls, so one cipher object per direction is reused
+# instead of expanding the key schedule on every call
+_ecb_encryptor = AES.new(key, AES.MODE_ECB)
+_ecb_decryptor = AES.new(key, AES.MODE_ECB)
+
+def _parse_key_ring(value: str) -> dict:
+    # "1:first-secret,2:second-secret" -> {1: "first-secret", 2: "second-secret"}
+    ring = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        version, _, secret = item.partition(":")
+        if not version.isdigit() or not secret:
+            raise ValueError("ENCRYPTION_KEYS must look like '1:secret,2:secret'.")
+        ring[int(version)] = secret
+    return ring
+
+# Versioned keys for authenticated encryption. Without ENCRYPTION_KEYS, ENCRYPTION_KEY is version 1.
+_key_ring_secrets = _parse_key_ring(os.getenv("ENCRYPTION_KEYS", "")) or {1: ENCRYPTION_KEY}
+KEY_VERSION = int(os.getenv("ENCRYPTION_KEY_VERSION", max(_key_ring_secrets)))
+
+if KEY_VERSION not in _key_ring_secrets:
+    raise ValueError(f"ENCRYPTION_KEY_VERSION {KEY_VERSION} is not in ENCRYPTION_KEYS.")
+
+# Derived separately from the ECB key so the same secret never serves two modes
+_gcm_keys = {
+    version: hashlib.sha256(b"aes-gcm:" + secret.encode()).digest()
+    for version, secret in _key_ring_secrets.items()
+}
+
+_NONCE_SIZE = 12
+_TAG_SIZE = 16
+
 def encrypt_data(data: str) -> str:
     """Encrypts the provided data deterministically using AES in ECB mode."""
-    cipher = AES.new(key, AES.MODE_ECB)
     # Pad data to make its length a multiple of AES block size (16 bytes)
     padded_data = pad(data.encode(), AES.block_size)
-    encrypted_data = cipher.encrypt(padded_data)
+    encrypted_data = _ecb_encryptor.encrypt(padded_data)
     return encrypted_data.hex()  # Return the encrypted data as a hex string
 
 def decrypt_data(data: str) -> str:
-    """Decrypts the provided data."""
-    cipher = AES.new(key, AES.MODE_ECB)
+    """Decrypts the provided data, in either the ECB or the versioned format."""
+    if is_versioned(data):
+        return decrypt_versioned(data)
     encrypted_data = bytes.fromhex(data)
-    decrypted_data = unpad(cipher.decrypt(encrypted_data), AES.block_size)
+    decrypted_data = unpad(_ecb_decryptor.decrypt(encrypted_data), AES.block_size)
     return decrypted_data.decode()
+
+def encrypt_many(values: list) -> list:
+    """Encrypts many values with ECB in a single cipher call."""
+    padded = [pad(value.encode(), AES.block_size) for value in values]
+    encrypted = _ecb_encryptor.encrypt(b"".join(padded))
+
+    # Split the joined ciphertext back at the padded lengths
+    results = []
+    offset = 0
+    for block in padded:
+        results.append(encrypted[offset:offset + len(block)].hex())
+        offset += len(block)
+    return results
+
+def decrypt_many(values: list) -> list:
+    """Decrypts many values; ECB values are decrypted together in a single cipher call."""
+    results = [None] * len(values)
+    legacy_positions = []
+    legacy_blocks = []
+    for i, value in enumerate(values):
+        if is_versioned(value):
+            results[i] = decrypt_versioned(value)
+        else:
+            legacy_positions.append(i)
+            legacy_blocks.append(bytes.fromhex(value))
+
+    if legacy_blocks:
+        decrypted = _ecb_decryptor.decrypt(b"".join(legacy_blocks))
+        offset = 0
+        for i, block in zip(legacy_positions, legacy_blocks):
+            results[i] = unpad(decrypted[offset:offset + len(block)], AES.block_size).decode()
+            offset += len(block)
+    return results
+
+def is_versioned(data: str) -> bool:
+    """Whether a value is in the versioned "v<version>:<hex>" format."""
+    return data.startswith("v") and ":" in data
+
+def key_version(data: str):
+    """Key version of a versioned value, or None for legacy ECB values."""
+    if not is_versioned(data):
+        return None
+    return int(data[1:data.index(":")])
+
+def encrypt_versioned(data: str, version: int = None) -> str:
+    """
+    Encrypts the provided data with AES-GCM under a versioned key.
+    The result is "v<version>:" followed by the hex nonce, ciphertext and tag.
+    """
+    version = KEY_VERSION if version is None else version
+    nonce = os.urandom(_NONCE_SIZE)
+    cipher = AES.new(_gcm_keys[version], AES.MODE_GCM, nonce=nonce)
+    ciphertext, tag = cipher.encrypt_and_digest(data.encode())
+    return f"v{version}:{(nonce + ciphertext + tag).hex()}"
+
+def decrypt_versioned(data: str) -> str:
+    """Decrypts and authenticates a value produced by encrypt_versioned."""
+    version = key_version(data)
+    if version not in _gcm_keys:
+        raise ValueError(f"Unknown encryption key version: {version}")
+    raw = bytes.fromhex(data[data.index(":") + 1:])
+    nonce, ciphertext, tag = raw[:_NONCE_SIZE], raw[_NONCE_SIZE:-_TAG_SIZE], raw[-_TAG_SIZE:]
+    cipher = AES.new(_gcm_keys[version], AES.MODE_GCM, nonce=nonce)
+    return cipher.decrypt_and_verify(ciphertext, tag).decode()
+
+def encrypt_many_versioned(values: list, version: int = None) -> list:
+    """Encrypts many values with AES-GCM under a versioned key."""
+    return [encrypt_versioned(value, version) for value in values]
+
+def needs_reencryption(data: str, version: int = None) -> bool:
+    """Whether a stored value is legacy ECB or under a key version other than `version`."""
+    return key_version(data) != (KEY_VERSION if version is None else version)
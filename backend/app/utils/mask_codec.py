@@ -0,0 +1,68 @@
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+# Stored mask format; part of the prediction cache key so entries in an older format are not reused
+MASK_FORMAT = "png1"
+MASK_CONTENT_TYPE = "image/png"
+MASK_EXTENSION = "png"
+
+def encode_png(binary_mask) -> bytes:
+    """
+    Encode a binary mask losslessly as a 1-bit PNG.
+
+    Args:
+        binary_mask (np.ndarray): Mask of shape (H, W); nonzero pixels are foreground.
+
+    Returns:
+        bytes: PNG data, black background and white foreground.
+    """
+    binary_mask = np.asarray(binary_mask) > 0
+    height, width = binary_mask.shape
+    # Pack 8 pixels per byte, rows padded to whole bytes, as PIL's "1" mode expects
+    packed = np.packbits(binary_mask, axis=1)
+    image = Image.frombytes("1", (width, height), packed.tobytes())
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+def decode_mask_image(data: bytes) -> np.ndarray:
+    """
+    Decode a stored mask image (1-bit PNG, or an older 8-bit JPEG) into a boolean mask.
+    """
+    with Image.open(BytesIO(data)) as image:
+        return np.asarray(image.convert("L")) >= 128
+
+def encode_rle(binary_mask) -> dict:
+    """
+    Run-length encode a binary mask in the uncompressed COCO format.
+
+    Runs are counted in column-major order and alternate between background and
+    foreground, starting with background (so the first count may be 0).
+
+    Args:
+        binary_mask (np.ndarray): Mask of shape (H, W); nonzero pixels are foreground.
+
+    Returns:
+        dict: {"size": [H, W], "counts": [run lengths]}.
+    """
+    binary_mask = np.asarray(binary_mask) > 0
+    flat = binary_mask.ravel(order="F")
+    # Positions where the value changes, plus both ends
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    boundaries = np.concatenate(([0], changes, [flat.size]))
+    counts = np.diff(boundaries).tolist()
+    if flat.size and flat[0]:
+        counts.insert(0, 0)
+    return {"size": list(binary_mask.shape), "counts": counts}
+
+def decode_rle(rle: dict) -> np.ndarray:
+    """
+    Decode a mask produced by `encode_rle` back into a boolean array of shape (H, W).
+    """
+    height, width = rle["size"]
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    # Runs alternate background/foreground, starting with background
+    values = np.arange(len(counts)) % 2 == 1
+    flat = np.repeat(values, counts)
+    return flat.reshape((height, width), order="F")
@@ -0,0 +1,111 @@
+import time
+import functools
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram
+
+# Latency buckets in seconds, from sub-millisecond preprocessing to slow uploads
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "End-to-end request latency by route.",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+# Stages: decode, preprocess, forward, encode, features, upload, firestore
+STAGE_SECONDS = Histogram(
+    "prediction_stage_seconds",
+    "Time spent in each stage of the prediction pipeline.",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+EXECUTOR_WAIT_SECONDS = Histogram(
+    "executor_wait_seconds",
+    "Time work waited for a free thread in a worker pool.",
+    ["pool"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+INFERENCE_BATCH_SIZE = Histogram(
+    "inference_batch_size",
+    "Images per batched forward pass.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+INFERENCE_QUEUE_DEPTH = Gauge(
+    "inference_queue_depth",
+    "Requests waiting for the batching engine.",
+)
+
+PREDICTIONS_IN_FLIGHT = Gauge(
+    "predictions_in_flight",
+    "Prediction requests currently holding a pipeline slot.",
+)
+
+PREDICTIONS_REJECTED = Counter(
+    "predictions_rejected_total",
+    "Prediction requests rejected with 503 because the pipeline was full.",
+)
+
+JOB_QUEUE_DEPTH = Gauge(
+    "job_queue_depth",
+    "Background jobs by status.",
+    ["status"],
+)
+
+SHADOW_SECONDS = Histogram(
+    "shadow_inference_seconds",
+    "Forward pass latency of the shadow candidate model.",
+    ["version"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+SHADOW_DICE = Histogram(
+    "shadow_dice",
+    "Dice agreement between shadow and production masks, per image.",
+    ["version"],
+    buckets=(0.5, 0.7, 0.8, 0.9, 0.95, 0.98, 0.99, 0.995, 1.0),
+)
+
+SHADOW_SKIPPED = Counter(
+    "shadow_skipped_total",
+    "Sampled batches not shadowed because the shadow model was still busy.",
+)
+
+# Hit rate of a cache = hits / (hits + misses); results are "hit", "disk_hit" or "miss"
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result.",
+    ["cache", "result"],
+)
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    Record the time spent in the enclosed block under a pipeline stage.
+
+    Args:
+        stage (str): Stage name, e.g. "decode" or "upload".
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+def timed(stage: str):
+    """
+    Decorator recording every call of a function under a pipeline stage.
+
+    Args:
+        stage (str): Stage name, e.g. "decode" or "upload".
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
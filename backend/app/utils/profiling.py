@@ -0,0 +1,71 @@
+import os
+import re
+import time
+import random
+import cProfile
+import logging
+import threading
+from app.utils.config import PROFILE_SAMPLE_RATE, PROFILE_DIR
+
+# Only one profiler can be active per process, so at most one request is profiled at a time
+_profile_lock = threading.Lock()
+
+# Requests in flight, and how many others overlapped the profiled one (None when not profiling)
+_active_requests = 0
+_overlapping = None
+
+def _should_profile() -> bool:
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def _profile_path(method: str, path: str) -> str:
+    route = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+    return os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}_{method}_{route}.prof")
+
+async def profile_requests(request, call_next):
+    """
+    HTTP middleware that profiles a random sample of requests with cProfile.
+
+    Set PROFILE_SAMPLE_RATE (e.g. 0.01) to enable it; each sampled request is
+    written to PROFILE_DIR as a .prof file for `python -m pstats` or snakeviz.
+
+    The profile is not limited to the sampled request. cProfile records the
+    event-loop thread for as long as the request is in flight, so every other
+    coroutine that runs on the loop while it awaits (other requests, the
+    inference engine, background tasks) is attributed to the same .prof file.
+    The number of requests that overlapped is logged with each profile; read
+    profiles with overlaps as "event loop during this request" rather than
+    "this request". Time spent on the worker pools is not captured at all and
+    shows up as awaiting; the per-stage metrics cover that part.
+    """
+    global _active_requests, _overlapping
+    _active_requests += 1
+    if _overlapping is not None:
+        _overlapping += 1
+    try:
+        if not _should_profile() or not _profile_lock.acquire(blocking=False):
+            return await call_next(request)
+        try:
+            return await _profile(request, call_next)
+        finally:
+            _profile_lock.release()
+    finally:
+        _active_requests -= 1
+
+async def _profile(request, call_next):
+    global _overlapping
+    # Count the requests already in flight and those starting before this one ends
+    _overlapping = _active_requests - 1
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return await call_next(request)
+    finally:
+        profiler.disable()
+        overlapping, _overlapping = _overlapping, None
+        path = _profile_path(request.method, request.url.path)
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(path)
+            logging.info(f"Wrote request profile {path} ({overlapping} other request(s) overlapped it)")
+        except OSError as e:
+            logging.warning(f"Could not write request profile: {e}")
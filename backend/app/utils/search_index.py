@@ -0,0 +1,50 @@
+import os
+import hmac
+import hashlib
+import unicodedata
+from app.utils.encryption import ENCRYPTION_KEY
+from app.utils.config import SEARCH_INDEX_MAX_PREFIX
+
+# Blind-index key, kept separate from the encryption key so search tokens reveal
+# nothing about the ciphertexts. Derived from ENCRYPTION_KEY unless set explicitly.
+_index_secret = os.getenv("SEARCH_INDEX_KEY") or ENCRYPTION_KEY
+index_key = hmac.new(_index_secret.encode(), b"patient-name-blind-index", hashlib.sha256).digest()
+
+def normalize_name(name: str) -> str:
+    """Normalize a name for searching: Unicode NFKC, case-folded, single spaces."""
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+def _token(kind: str, value: str) -> str:
+    # The kind label keeps exact and prefix tokens for the same text distinct
+    return hmac.new(index_key, f"{kind}:{value}".encode(), hashlib.sha256).hexdigest()[:32]
+
+def name_index_fields(name: str) -> dict:
+    """
+    Build the blind-index fields stored next to an encrypted patient name.
+
+    `name_index` matches the whole normalized name and `name_prefixes` holds one
+    token per prefix, up to SEARCH_INDEX_MAX_PREFIX characters.
+    """
+    normalized = normalize_name(name)
+    return {
+        'name_index': _token("exact", normalized),
+        'name_prefixes': [
+            _token("prefix", normalized[:length])
+            for length in range(1, min(len(normalized), SEARCH_INDEX_MAX_PREFIX) + 1)
+        ],
+    }
+
+def exact_search_token(name: str) -> str:
+    """Token to match against `name_index`."""
+    return _token("exact", normalize_name(name))
+
+def prefix_search_token(prefix: str) -> str:
+    """
+    Token to match against `name_prefixes`. Only the first SEARCH_INDEX_MAX_PREFIX
+    characters of a name are indexed, so longer prefixes raise ValueError rather
+    than silently matching on their truncation.
+    """
+    normalized = normalize_name(prefix)
+    if len(normalized) > SEARCH_INDEX_MAX_PREFIX:
+        raise ValueError(f"Name prefixes are indexed up to {SEARCH_INDEX_MAX_PREFIX} characters.")
+    return _token("prefix", normalized)
@@ -0,0 +1,56 @@
+import hashlib
+from fastapi import HTTPException, UploadFile
+from app.utils.config import MAX_UPLOAD_BYTES
+
+# Size of the chunks read from an upload at a time
+CHUNK_SIZE = 1024 * 1024
+
+def close_uploads(*files):
+    """
+    Close uploads and spooled temporary files now, releasing their file
+    descriptors and disk space instead of waiting for garbage collection.
+
+    Args:
+        files: UploadFile or file objects; None entries are ignored.
+    """
+    for file in files:
+        if file is not None:
+            (file.file if isinstance(file, UploadFile) else file).close()
+
+async def spool_upload(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """
+    Stream through an upload in chunks, enforcing a size limit and hashing its content,
+    then rewind it so it can be decoded or re-uploaded straight from its spooled file.
+
+    Args:
+        upload (UploadFile): The uploaded file.
+        max_bytes (int): Maximum accepted size.
+
+    Returns:
+        str: SHA-256 hex digest of the content.
+
+    Raises:
+        HTTPException: 413 if the upload exceeds `max_bytes`, 400 if it is empty.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            # Release the spooled data right away rather than at the end of the request
+            close_uploads(upload)
+            raise HTTPException(
+                status_code=413,
+                detail=f"File {upload.filename} is too large. The maximum size is {max_bytes // (1024 * 1024)} MB.",
+            )
+        digest.update(chunk)
+
+    if size == 0:
+        close_uploads(upload)
+        raise HTTPException(status_code=400, detail=f"File {upload.filename} is empty.")
+
+    await upload.seek(0)
+    return digest.hexdigest()
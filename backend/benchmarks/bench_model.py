@@ -0,0 +1,127 @@
+import asyncio
+import argparse
+import time
+import tracemalloc
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+
+# Load .env before importing modules that read their configuration at import time
+load_dotenv()
+
+from app.services.model import (
+    inference_engine,
+    predict_batch,
+    predict_mask,
+    predict_mask_async,
+    preprocess_image,
+    warm_up,
+)
+from benchmarks.common import environment, latency_summary, memory_usage, write_results
+
+def _random_image(size, seed=0):
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, size=(size[1], size[0]), dtype=np.uint8), mode="L")
+
+def _time_calls(func, iterations, warmup):
+    for _ in range(warmup):
+        func()
+    latencies = []
+    tracemalloc.start()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {**latency_summary(latencies), "python_peak_alloc_mb": peak / (1024 * 1024)}
+
+def bench_preprocess(image_size, iterations, warmup):
+    """
+    Latency of `preprocess_image` for one uploaded image of the given size.
+    """
+    image = _random_image(image_size)
+    return _time_calls(lambda: preprocess_image(image), iterations, warmup)
+
+def bench_single(iterations, warmup):
+    """
+    Latency of one `predict_mask` call on a single preprocessed image.
+    """
+    preprocessed = preprocess_image(_random_image((256, 256)))
+    return _time_calls(lambda: predict_mask(preprocessed), iterations, warmup)
+
+def bench_batched(batch_sizes, iterations, warmup):
+    """
+    Latency and throughput of one forward pass at each batch size.
+    """
+    image = preprocess_image(_random_image((256, 256)))
+    results = []
+    for batch_size in batch_sizes:
+        batch = np.repeat(image, batch_size, axis=0)
+        summary = _time_calls(lambda: predict_batch(batch), iterations, warmup)
+        summary["batch_size"] = batch_size
+        summary["images_per_second"] = batch_size * 1000.0 / summary["mean_ms"]
+        results.append(summary)
+    return results
+
+async def bench_engine(concurrency, requests):
+    """
+    Throughput of the batching engine with `concurrency` callers submitting
+    single images at once, i.e. how well the batch settings fill batches.
+    """
+    preprocessed = preprocess_image(_random_image((256, 256)))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await predict_mask_async(preprocessed)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    await inference_engine.stop()
+    return {
+        **latency_summary(latencies),
+        "concurrency": concurrency,
+        "images_per_second": requests / elapsed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing and model inference on CPU.")
+    parser.add_argument("--iterations", type=int, default=50, help="Timed calls per measurement.")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed calls before each measurement.")
+    parser.add_argument("--image-size", type=int, nargs=2, default=(512, 512), metavar=("WIDTH", "HEIGHT"),
+                        help="Size of the uploaded image fed to preprocess_image.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--engine-concurrency", type=int, nargs="+", default=[1, 8, 32],
+                        help="Concurrent callers for the batching engine benchmark.")
+    parser.add_argument("--engine-requests", type=int, default=256)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+    args = parser.parse_args()
+
+    memory_before = memory_usage()
+    load_start = time.perf_counter()
+    warm_up()
+    load_seconds = time.perf_counter() - load_start
+
+    results = {
+        "benchmark": "model",
+        "environment": environment(),
+        "model_load_seconds": load_seconds,
+        "memory": {"before_load": memory_before, "after_load": memory_usage()},
+        "preprocess": bench_preprocess(tuple(args.image_size), args.iterations, args.warmup),
+        "predict_single": bench_single(args.iterations, args.warmup),
+        "predict_batched": bench_batched(args.batch_sizes, args.iterations, args.warmup),
+        "engine": [
+            asyncio.run(bench_engine(concurrency, args.engine_requests))
+            for concurrency in args.engine_concurrency
+        ],
+    }
+    results["memory"]["after_run"] = memory_usage()
+    write_results(results, args.output)
+
+if __name__ == "__main__":
+    main()
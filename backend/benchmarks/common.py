@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import subprocess
+import numpy as np
+
+def latency_summary(latencies):
+    """
+    Percentiles and mean of a list of latencies.
+
+    Args:
+        latencies (list): Latencies in seconds.
+
+    Returns:
+        dict: count, mean, min, p50, p90, p95, p99 and max, in milliseconds.
+    """
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies) * 1000.0
+    p50, p90, p95, p99 = np.percentile(values, [50, 90, 95, 99])
+    return {
+        "count": len(values),
+        "mean_ms": float(values.mean()),
+        "min_ms": float(values.min()),
+        "p50_ms": float(p50),
+        "p90_ms": float(p90),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(values.max()),
+    }
+
+def memory_usage():
+    """
+    Current and peak resident memory of this process.
+
+    Returns:
+        dict: rss_mb (current, Linux only) and max_rss_mb (peak since start).
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss_mb = max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+    usage = {"rss_mb": None, "max_rss_mb": max_rss_mb}
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        usage["rss_mb"] = pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    return usage
+
+def environment():
+    """
+    Settings that make results comparable: host, backend, model version and batching.
+    """
+    from app.services.model import current_model_version
+    from app.utils.config import (
+        INFERENCE_BACKEND,
+        INFERENCE_MAX_BATCH_SIZE,
+        INFERENCE_MAX_WAIT_MS,
+        CPU_WORKERS,
+        IO_WORKERS,
+        TFLITE_NUM_THREADS,
+    )
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "inference_backend": INFERENCE_BACKEND,
+        "model_version": current_model_version(),
+        "inference_max_batch_size": INFERENCE_MAX_BATCH_SIZE,
+        "inference_max_wait_ms": INFERENCE_MAX_WAIT_MS,
+        "tflite_num_threads": TFLITE_NUM_THREADS,
+        "cpu_workers": CPU_WORKERS,
+        "io_workers": IO_WORKERS,
+    }
+
+def write_results(results, path=None):
+    """
+    Write results as JSON to `path`, or to stdout without one.
+    """
+    text = json.dumps(results, indent=2)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote results to {path}", file=sys.stderr)
+    else:
+        print(text)
@@ -0,0 +1,249 @@
+import copy
+import json
+import time
+import asyncio
+import uuid
+import threading
+import httpx
+from google.api_core.exceptions import FailedPrecondition
+
+class FakeBlob:
+    """Storage blob; uploads go through its bucket, after an optional simulated latency."""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.public_url = f"https://storage.fake/{bucket.name}/{name}"
+
+    def upload_from_string(self, data, content_type=None):
+        self.bucket.record(self.name, data)
+
+    def upload_from_file(self, file_obj, content_type=None, rewind=False):
+        if rewind:
+            file_obj.seek(0)
+        self.bucket.record(self.name, file_obj.read())
+
+    def download_as_bytes(self):
+        return self.bucket.files[self.name]
+
+class FakeBucket:
+    """
+    In-memory stand-in for a Firebase Storage bucket.
+
+    Args:
+        latency (float): Seconds each upload sleeps, to model network time.
+        keep_files (bool): Keep uploaded data in `files` so it can be listed and
+            downloaded again. The load test leaves it off and only counts bytes.
+    """
+
+    def __init__(self, name="fake-bucket", latency=0.0, keep_files=False):
+        self.name = name
+        self.latency = latency
+        self.keep_files = keep_files
+        self.files = {}
+        self.uploads = 0
+        self.bytes_uploaded = 0
+        self._lock = threading.Lock()
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix=""):
+        with self._lock:
+            names = sorted(name for name in self.files if name.startswith(prefix))
+        return [FakeBlob(self, name) for name in names]
+
+    def record(self, name, data):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.uploads += 1
+            self.bytes_uploaded += len(data)
+            if self.keep_files:
+                self.files[name] = data
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        self._data = copy.deepcopy(data)
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+class FakeDocument:
+    def __init__(self, collection, doc_id):
+        self.collection = collection
+        self.id = doc_id
+        self.key = (collection.name, doc_id)
+
+    def get(self):
+        return self.collection.db.snapshot(self)
+
+class FakeQuery:
+    """Query supporting chained `==` and `array_contains` filters."""
+
+    def __init__(self, collection, filters=()):
+        self.collection = collection
+        self.filters = list(filters)
+
+    def where(self, field, op, value):
+        if op not in ("==", "array_contains"):
+            raise NotImplementedError(f"Unsupported operator: {op}")
+        return FakeQuery(self.collection, [*self.filters, (field, op, value)])
+
+    def _matches(self, data):
+        for field, op, value in self.filters:
+            actual = data.get(field)
+            if op == "==" and actual != value:
+                return False
+            if op == "array_contains" and value not in (actual or []):
+                return False
+        return True
+
+    def stream(self):
+        for doc_id, data in self.collection.db.documents(self.collection.name):
+            if self._matches(data):
+                yield self.collection.document(doc_id).get()
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def document(self, doc_id=None):
+        return FakeDocument(self, doc_id or uuid.uuid4().hex)
+
+    def where(self, field, op, value):
+        return FakeQuery(self).where(field, op, value)
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.operations = []
+
+    @property
+    def writes(self):
+        return len(self.operations)
+
+    def set(self, ref, data):
+        self.operations.append((ref.key, data, None, True))
+
+    def update(self, ref, data, option=None):
+        self.operations.append((ref.key, data, option, False))
+
+    def commit(self):
+        self.db.commit(self.operations)
+
+class FakeFirestore:
+    """
+    In-memory stand-in for the Firestore client.
+
+    Documents are kept in `docs`, keyed by (collection, document ID). Every write
+    bumps the document's update time. A batch whose `write_option` refers to an
+    older update time fails with FailedPrecondition and writes nothing, as in
+    Firestore. Unlike Firestore, updating a missing document creates it, so the
+    load test needs no seeded users.
+
+    Args:
+        latency (float): Seconds each batch commit sleeps, to model network time.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.docs = {}
+        self.update_times = {}
+        self.commits = 0
+        self.writes = 0
+        # Called before each commit, e.g. to simulate a concurrent writer
+        self.before_commit = None
+        self._lock = threading.RLock()
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def write_option(self, last_update_time=None):
+        return {"last_update_time": last_update_time}
+
+    def set(self, collection, doc_id, data):
+        """Write a document directly, outside any batch."""
+        with self._lock:
+            key = (collection, doc_id)
+            self.docs[key] = copy.deepcopy(data)
+            self.update_times[key] = self.update_times.get(key, 0) + 1
+
+    def snapshot(self, ref):
+        with self._lock:
+            return FakeSnapshot(ref, self.docs.get(ref.key), self.update_times.get(ref.key))
+
+    def documents(self, collection):
+        with self._lock:
+            return [(key[1], data) for key, data in sorted(self.docs.items()) if key[0] == collection]
+
+    def commit(self, operations):
+        if self.before_commit is not None:
+            self.before_commit()
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            for key, _, option, _ in operations:
+                if option is not None and self.update_times.get(key) != option["last_update_time"]:
+                    raise FailedPrecondition(f"{key[0]}/{key[1]} changed since it was read")
+            for key, data, _, replace in operations:
+                self.set(*key, data if replace else {**self.docs.get(key, {}), **data})
+            self.commits += 1
+            self.writes += len(operations)
+
+def fake_verify_token(token):
+    """Accept any token and use it as the user ID."""
+    return {"uid": token, "exp": time.time() + 3600}
+
+def fake_llm_transport(report="Severity: low. No significant lesion detected.", latency=0.0):
+    """
+    httpx transport answering chat completion requests with a canned report,
+    as JSON or as a server-sent event stream.
+
+    Args:
+        report (str): Report text to return.
+        latency (float): Seconds to wait before answering.
+    """
+    async def handler(request):
+        if latency:
+            await asyncio.sleep(latency)
+        payload = json.loads(request.content)
+        if payload.get("stream"):
+            events = [
+                f"data: {json.dumps({'choices': [{'delta': {'content': word + ' '}}]})}\n\n"
+                for word in report.split()
+            ]
+            events.append("data: [DONE]\n\n")
+            return httpx.Response(200, content="".join(events).encode(), headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": report}}]})
+
+    return httpx.MockTransport(handler)
+
+def install_fakes(upload_latency=0.0, firestore_latency=0.0, llm_latency=0.0):
+    """
+    Route the app's Firebase Storage, Firestore, token verification and report
+    generation to local fakes.
+
+    Returns:
+        tuple: (FakeBucket, FakeFirestore) to inspect after a run.
+    """
+    from app.services.firebase import use_firebase_clients, set_token_verifier
+    from app.services.openai import report_service
+
+    bucket = FakeBucket(latency=upload_latency)
+    db = FakeFirestore(latency=firestore_latency)
+    use_firebase_clients(db, bucket)
+    set_token_verifier(fake_verify_token)
+    report_service.transport = fake_llm_transport(latency=llm_latency)
+    return bucket, db
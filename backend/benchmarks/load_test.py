@@ -0,0 +1,161 @@
+import os
+import asyncio
+import argparse
+import time
+from collections import Counter
+from io import BytesIO
+import numpy as np
+import httpx
+from PIL import Image
+from dotenv import load_dotenv
+
+# Load .env before importing modules that read their configuration at import time
+load_dotenv()
+# The app refuses to start without a key; the fakes never persist anything
+os.environ.setdefault("ENCRYPTION_KEY", "benchmark-only-key")
+
+from benchmarks.common import environment, latency_summary, memory_usage, write_results
+from benchmarks.fakes import install_fakes
+
+def make_images(count, size, seed=0):
+    """
+    Distinct random JPEG uploads, so requests only hit the prediction cache when they repeat an image.
+    """
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        pixels = rng.integers(0, 256, size=(size[1], size[0]), dtype=np.uint8)
+        buffer = BytesIO()
+        Image.fromarray(pixels, mode="L").save(buffer, format="JPEG")
+        images.append(buffer.getvalue())
+    return images
+
+def _stage_totals():
+    # (sum, count) of every pipeline stage histogram so far
+    from app.utils.metrics import STAGE_SECONDS
+    totals = {}
+    for metric in STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                totals.setdefault(stage, [0.0, 0.0])[0] = sample.value
+            elif sample.name.endswith("_count"):
+                totals.setdefault(stage, [0.0, 0.0])[1] = sample.value
+    return totals
+
+def _stage_means(before, after):
+    means = {}
+    for stage, (total, count) in after.items():
+        prev_total, prev_count = before.get(stage, (0.0, 0.0))
+        if count > prev_count:
+            means[stage] = (total - prev_total) / (count - prev_count) * 1000.0
+    return means
+
+async def run_level(client, images, concurrency, requests, full_resolution=False):
+    """
+    Send `requests` /predict calls with at most `concurrency` in flight.
+
+    Returns:
+        dict: Latency percentiles, throughput, status codes and mean stage times.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = Counter()
+    errors = Counter()
+
+    async def one(i):
+        async with semaphore:
+            data = {
+                "user_id": "bench-user",
+                "firebase_token": "bench-user",
+                "full_resolution": str(full_resolution).lower(),
+            }
+            files = {"image": (f"slice_{i}.jpg", images[i % len(images)], "image/jpeg")}
+            start = time.perf_counter()
+            try:
+                response = await client.post("/predict", data=data, files=files)
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] += 1
+                return
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+
+    stages_before = _stage_totals()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "duration_seconds": elapsed,
+        "requests_per_second": requests / elapsed,
+        "latency": latency_summary(latencies),
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "errors": dict(errors),
+        "stage_mean_ms": _stage_means(stages_before, _stage_totals()),
+        "memory": memory_usage(),
+    }
+
+async def run(args):
+    bucket, db = install_fakes(args.upload_latency, args.firestore_latency)
+
+    from app.main import app
+    from app.services.executor import run_cpu
+    from app.services.model import inference_engine, warm_up
+    from app.services.openai import report_service
+    from app.services.cache import prediction_cache
+
+    # Measure the full pipeline: keep earlier runs' results out of the way
+    prediction_cache.disk_dir = None
+    await run_cpu(warm_up)
+    images = make_images(args.distinct_images or args.requests, tuple(args.image_size))
+
+    transport = httpx.ASGITransport(app=app)
+    levels = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=args.timeout) as client:
+        await run_level(client, images, 1, args.warmup, args.full_resolution)
+        for concurrency in args.concurrency:
+            # Every level starts cold, so only repeats within a level hit the cache
+            prediction_cache.clear()
+            levels.append(await run_level(client, images, concurrency, args.requests, args.full_resolution))
+
+    await inference_engine.stop()
+    await report_service.aclose()
+    return {
+        "benchmark": "predict_load",
+        "environment": environment(),
+        "settings": {
+            "image_size": list(args.image_size),
+            "distinct_images": args.distinct_images or args.requests,
+            "full_resolution": args.full_resolution,
+            "upload_latency_seconds": args.upload_latency,
+            "firestore_latency_seconds": args.firestore_latency,
+        },
+        "levels": levels,
+        "fake_storage": {"uploads": bucket.uploads, "bytes": bucket.bytes_uploaded},
+        "fake_firestore": {"commits": db.commits, "writes": db.writes},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load-test /predict in-process, with Firebase and the report API replaced by local fakes."
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32],
+                        help="Concurrency levels to run, one after another.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level.")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed requests before the first level.")
+    parser.add_argument("--image-size", type=int, nargs=2, default=(512, 512), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--distinct-images", type=int, default=None,
+                        help="Number of distinct uploads to cycle through; fewer than --requests exercises the cache.")
+    parser.add_argument("--full-resolution", action="store_true", help="Use tiled full-resolution inference.")
+    parser.add_argument("--upload-latency", type=float, default=0.0, help="Simulated seconds per Storage upload.")
+    parser.add_argument("--firestore-latency", type=float, default=0.0, help="Simulated seconds per Firestore commit.")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+    args = parser.parse_args()
+
+    write_results(asyncio.run(run(args)), args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Run the tests from anywhere with the backend package importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules read their configuration at import time; keep the tests offline and self-contained
+os.environ.setdefault("ENCRYPTION_KEY", "test-only-key")
+os.environ.setdefault("WARMUP_ON_STARTUP", "false")
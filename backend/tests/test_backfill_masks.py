@@ -0,0 +1,167 @@
+import json
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from PIL import Image
+from google.api_core.exceptions import FailedPrecondition
+from app.jobs import backfill_masks
+from app.jobs.backfill_masks import IMAGE_PREFIX, MASK_DIRECTORY, backfill_masks as run_backfill
+from app.services.pipeline import mask_file_name
+from benchmarks.fakes import FakeBucket, FakeFirestore
+
+class FakeModel:
+    """Model predicting a bright square; optionally crashes on the n-th forward pass."""
+
+    def __init__(self, version="v2", crash_on_call=None):
+        self.version = version
+        self.crash_on_call = crash_on_call
+        self.calls = 0
+        self.images = 0
+
+    def predict(self, batch):
+        self.calls += 1
+        if self.calls == self.crash_on_call:
+            raise RuntimeError("worker killed")
+        self.images += len(batch)
+        masks = np.zeros(batch.shape, dtype=np.float32)
+        masks[:, 64:192, 64:192] = 1.0
+        return masks
+
+def _jpeg():
+    buffer = BytesIO()
+    Image.fromarray(np.full((64, 64), 128, dtype=np.uint8)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+def _store(bucket, base_name, data=None):
+    name = f"{IMAGE_PREFIX}{base_name}_original.jpg"
+    bucket.files[name] = _jpeg() if data is None else data
+    return bucket.blob(name).public_url
+
+def _entry(url, **fields):
+    return {"original_image_url": url, "mask_image_url": url.replace("_original.jpg", "_mask.png"), **fields}
+
+def _images(db, user_id):
+    return db.docs[("users-procare", user_id)]["images"]
+
+def test_backfill_updates_records_and_counts_each_outcome(tmp_path):
+    bucket, db = FakeBucket(keep_files=True), FakeFirestore()
+    # Admin SDK user IDs may contain underscores and end in digits
+    user_id = "clinic_7"
+    stale = _store(bucket, f"{user_id}_1700000000")
+    done = _store(bucket, f"{user_id}_1700000100_0")
+    broken = _store(bucket, f"{user_id}_1700000100_1", data=b"not a jpeg")
+    _store(bucket, "deleted-user_1700000200")
+    db.set("users-procare", user_id, {"images": [
+        _entry(stale, model_version="v1"),
+        _entry(done, model_version="v2"),
+        _entry(broken),
+    ]})
+    db.set("patients", "p1", {"doctor_id": user_id, "results": _entry(stale)})
+
+    counts = run_backfill(bucket, db, FakeModel(), checkpoint_path=str(tmp_path / "checkpoint.json"))
+
+    assert counts == {"updated": 1, "skipped": 1, "orphaned": 1, "failed": 1}
+    images = _images(db, user_id)
+    mask_name = f"{MASK_DIRECTORY}/{mask_file_name(f'{user_id}_1700000000', 'v2')}"
+    assert mask_name in bucket.files
+    assert images[0]["model_version"] == "v2"
+    assert images[0]["mask_image_url"] == bucket.blob(mask_name).public_url
+    assert images[0]["features"]["lesion_area_ratio"] > 0
+    assert images[1] == _entry(done, model_version="v2")
+    assert "model_version" not in images[2]
+    patient = db.docs[("patients", "p1")]["results"]
+    assert patient["model_version"] == "v2"
+    assert patient["mask_image_url"] == images[0]["mask_image_url"]
+
+def test_backfill_resumes_from_the_checkpoint_after_a_crash(tmp_path):
+    bucket, db = FakeBucket(keep_files=True), FakeFirestore()
+    urls = [_store(bucket, f"user{i}_1700000000") for i in range(3)]
+    for i, url in enumerate(urls):
+        db.set("users-procare", f"user{i}", {"images": [_entry(url)]})
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+
+    with pytest.raises(RuntimeError):
+        run_backfill(bucket, db, FakeModel(crash_on_call=2), checkpoint_path=checkpoint_path, batch_size=1)
+
+    # Only the committed first batch is recorded
+    with open(checkpoint_path) as f:
+        state = json.load(f)
+    assert state["last_blob"] == f"{IMAGE_PREFIX}user0_1700000000_original.jpg"
+    assert state["counts"]["updated"] == 1
+    assert [_images(db, f"user{i}")[0].get("model_version") for i in range(3)] == ["v2", None, None]
+
+    model = FakeModel()
+    counts = run_backfill(bucket, db, model, checkpoint_path=checkpoint_path, batch_size=1)
+
+    assert model.images == 2
+    assert counts == {"updated": 3, "skipped": 0, "orphaned": 0, "failed": 0}
+    assert all(_images(db, f"user{i}")[0]["model_version"] == "v2" for i in range(3))
+
+def test_checkpoint_of_another_model_version_is_ignored(tmp_path):
+    checkpoint = backfill_masks.BackfillCheckpoint(str(tmp_path / "checkpoint.json"), "v1")
+    checkpoint.last_blob = "procare-images/image/user0_1_original.jpg"
+    checkpoint.save()
+
+    assert backfill_masks.BackfillCheckpoint(checkpoint.path, "v1").last_blob == checkpoint.last_blob
+    assert backfill_masks.BackfillCheckpoint(checkpoint.path, "v2").last_blob is None
+
+def test_commit_retries_when_records_change_concurrently(tmp_path):
+    bucket, db = FakeBucket(keep_files=True), FakeFirestore()
+    url = _store(bucket, "user0_1700000000")
+    db.set("users-procare", "user0", {"images": [_entry(url)]})
+    new_upload = _entry("https://storage.fake/fake-bucket/procare-images/image/user0_1700000999_original.jpg")
+
+    # A /predict for the same user lands between the backfill's read and its write
+    def concurrent_predict():
+        db.before_commit = None
+        db.set("users-procare", "user0", {"images": [*_images(db, "user0"), new_upload]})
+    db.before_commit = concurrent_predict
+
+    counts = run_backfill(bucket, db, FakeModel(), checkpoint_path=str(tmp_path / "checkpoint.json"))
+
+    assert counts["updated"] == 1
+    images = _images(db, "user0")
+    assert images[0]["model_version"] == "v2"
+    assert images[1] == new_upload
+
+def test_commit_gives_up_when_records_keep_changing():
+    db = FakeFirestore()
+    url = "https://storage.fake/fake-bucket/procare-images/image/user0_1700000000_original.jpg"
+    db.set("users-procare", "user0", {"images": [_entry(url)]})
+    db.before_commit = lambda: db.set("users-procare", "user0", db.docs[("users-procare", "user0")])
+    results = {url: {"mask_image_url": "https://storage.fake/mask.png", "features": {}}}
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        with pytest.raises(FailedPrecondition):
+            backfill_masks._commit_updates(db, pool, ["user0"], results, "v2", attempts=3)
+    assert db.commits == 0
+    assert "model_version" not in _images(db, "user0")[0]
+
+def test_failed_commit_leaves_the_old_mask_in_place(tmp_path):
+    bucket, db = FakeBucket(keep_files=True), FakeFirestore()
+    url = _store(bucket, "user0_1700000000")
+    old_mask = f"{MASK_DIRECTORY}/{mask_file_name('user0_1700000000')}"
+    bucket.files[old_mask] = b"v1 mask"
+    db.set("users-procare", "user0", {"images": [_entry(url, mask_image_url=bucket.blob(old_mask).public_url)]})
+    # Every commit loses the race against a concurrent writer
+    db.before_commit = lambda: db.set("users-procare", "user0", db.docs[("users-procare", "user0")])
+
+    with pytest.raises(FailedPrecondition):
+        run_backfill(bucket, db, FakeModel(), checkpoint_path=str(tmp_path / "checkpoint.json"))
+
+    # The record still describes the mask it points at
+    assert bucket.files[old_mask] == b"v1 mask"
+    assert _images(db, "user0")[0]["mask_image_url"] == bucket.blob(old_mask).public_url
+    assert "model_version" not in _images(db, "user0")[0]
+
+def test_mask_file_names_carry_the_model_version():
+    assert mask_file_name("user0_1700000000").endswith("_mask.png")
+    assert mask_file_name("user0_1700000000", "v2") == "user0_1700000000_mask_v2.png"
+    assert mask_file_name("user0_1", "runs/2024:05") == "user0_1_mask_runs-2024-05.png"
+
+def test_candidate_user_ids_allow_underscores():
+    assert backfill_masks._candidate_user_ids("abc_1700000000") == ["abc"]
+    assert backfill_masks._candidate_user_ids("abc_1700000000_3") == ["abc_1700000000", "abc"]
+    assert backfill_masks._candidate_user_ids("clinic_7_1700000000") == ["clinic_7", "clinic"]
+    assert backfill_masks._candidate_user_ids("nouser") == []
@@ -0,0 +1,56 @@
+import numpy as np
+from PIL import Image
+from app.model.evaluation import evaluate_masks
+from app.model.structural_similarity_accuracy import calculate_average_ssim
+
+def _write_mask(path, size, box):
+    # White rectangle `box` = (left, top, right, bottom) on black, saved as PNG
+    mask = np.zeros((size[1], size[0]), dtype=np.uint8)
+    left, top, right, bottom = box
+    mask[top:bottom, left:right] = 255
+    Image.fromarray(mask).save(path)
+
+def test_identical_masks_score_perfectly(tmp_path):
+    original_dir, predicted_dir = tmp_path / "original", tmp_path / "predicted"
+    original_dir.mkdir()
+    predicted_dir.mkdir()
+    for name in ("a.png", "b.png"):
+        _write_mask(original_dir / name, (64, 64), (10, 10, 40, 40))
+        _write_mask(predicted_dir / name, (64, 64), (10, 10, 40, 40))
+
+    rows, summary = evaluate_masks(str(predicted_dir), str(original_dir), workers=1)
+    assert summary["count"] == 2
+    assert summary["dice"] == 1.0
+    assert summary["iou"] == 1.0
+    assert summary["hausdorff"] == 0.0
+
+def test_chunk_with_mixed_image_sizes(tmp_path):
+    original_dir, predicted_dir = tmp_path / "original", tmp_path / "predicted"
+    original_dir.mkdir()
+    predicted_dir.mkdir()
+    # Ground truth at two sizes in one chunk; predictions at another size, resized to the ground truth
+    _write_mask(original_dir / "small.png", (64, 64), (16, 16, 48, 48))
+    _write_mask(original_dir / "large.png", (128, 96), (32, 24, 96, 72))
+    _write_mask(predicted_dir / "small.png", (128, 128), (32, 32, 96, 96))
+    _write_mask(predicted_dir / "large.png", (256, 192), (64, 48, 192, 144))
+
+    rows, summary = evaluate_masks(str(predicted_dir), str(original_dir), workers=1, chunk_size=8)
+    assert [row["file"] for row in rows] == ["large.png", "small.png"]
+    for row in rows:
+        assert row["dice"] == 1.0
+        assert row["pixel_accuracy"] == 1.0
+
+    # The SSIM wrapper keeps producing a score where the original implementation did
+    assert calculate_average_ssim(str(original_dir), str(predicted_dir)) is not None
+
+def test_mismatched_masks(tmp_path):
+    original_dir, predicted_dir = tmp_path / "original", tmp_path / "predicted"
+    original_dir.mkdir()
+    predicted_dir.mkdir()
+    _write_mask(original_dir / "a.png", (64, 64), (0, 0, 32, 64))
+    _write_mask(predicted_dir / "a.png", (64, 64), (16, 0, 48, 64))
+
+    rows, _ = evaluate_masks(str(predicted_dir), str(original_dir), workers=1)
+    # Overlap is 16 of 32 columns on each side
+    assert abs(rows[0]["dice"] - 0.5) < 1e-9
+    assert abs(rows[0]["iou"] - 1 / 3) < 1e-9
@@ -0,0 +1,34 @@
+from io import BytesIO
+import numpy as np
+import pytest
+from PIL import Image
+from app.services.features import extract_mask_features
+from app.services.openai import extract_image_features
+
+def _scan():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(64, 64), dtype=np.uint8)
+    mask = np.zeros((64, 64), dtype=np.uint8)
+    mask[16:40, 20:44] = 255
+    return image, mask
+
+def _png(array):
+    buffer = BytesIO()
+    Image.fromarray(array).save(buffer, format="PNG")
+    buffer.seek(0)
+    return buffer
+
+def test_intensity_is_reported_on_the_model_input_scale():
+    image, mask = _scan()
+    # /predict describes the normalized model input and the predicted probabilities
+    predicted = extract_mask_features(mask / 255.0, image.astype(np.float32) / 255.0)
+    # /generate_report describes the uploaded 8-bit images
+    uploaded, ratio = extract_image_features(_png(image), _png(mask))
+
+    assert ratio == predicted["lesion_area_ratio"]
+    for key, value in predicted["intensity"].items():
+        assert uploaded["intensity"][key] == pytest.approx(value, abs=1e-6)
+        assert 0.0 <= value <= 1.0
+    assert [c["mean_intensity"] for c in uploaded["components"]] == pytest.approx(
+        [c["mean_intensity"] for c in predicted["components"]], abs=1e-6
+    )
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+from app.services.model import BatchInferenceEngine
+
+def _image(value=0.0):
+    return np.full((1, 4, 4, 1), value, dtype=np.float32)
+
+def test_concurrent_requests_share_a_batch():
+    calls = []
+
+    def predict(batch, model=None):
+        calls.append(len(batch))
+        return batch * 2
+
+    async def run():
+        engine = BatchInferenceEngine(predict, max_batch_size=4, max_wait_ms=50)
+        results = await asyncio.gather(*(engine.submit(_image(i)) for i in range(4)))
+        await engine.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert calls == [4]
+    for i, result in enumerate(results):
+        assert np.all(result == 2 * i)
+
+def test_stop_fails_requests_of_the_running_batch():
+    started = threading.Event()
+    release = threading.Event()
+
+    def predict(batch, model=None):
+        started.set()
+        release.wait(5)
+        return batch
+
+    async def run():
+        engine = BatchInferenceEngine(predict, max_batch_size=1, max_wait_ms=0)
+        running = asyncio.ensure_future(engine.submit(_image()))
+        queued = asyncio.ensure_future(engine.submit(_image()))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        await engine.stop()
+        release.set()
+        return await asyncio.wait_for(asyncio.gather(running, queued, return_exceptions=True), 5)
+
+    running, queued = asyncio.run(run())
+    for result in (running, queued):
+        assert isinstance(result, RuntimeError)
+        assert str(result) == "Inference engine stopped"
+
+def test_tiled_prediction_blends_back_to_full_resolution(monkeypatch):
+    from app.services import model as model_module
+
+    # Identity "model": the blended mask must reproduce the input image
+    engine = BatchInferenceEngine(lambda batch, model=None: batch, max_batch_size=4, max_wait_ms=0)
+    monkeypatch.setattr(model_module, "inference_engine", engine)
+    image = np.random.default_rng(0).random((300, 520), dtype=np.float32)
+
+    async def run():
+        try:
+            return await model_module.predict_mask_tiled(image, overlap=32, tiles_per_batch=3)
+        finally:
+            await engine.stop()
+
+    mask = asyncio.run(run())
+    assert mask.shape == image.shape
+    np.testing.assert_allclose(mask, image, rtol=1e-5)
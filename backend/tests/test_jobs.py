@@ -0,0 +1,204 @@
+import io
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+from app.routes import jobs as jobs_routes
+from app.services import firebase
+from app.services.jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobStore, JobWorkerPool
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def store(tmp_path, clock):
+    return JobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "spool"), max_attempts=3, max_queued=10, clock=clock)
+
+def test_idempotent_resubmission_returns_the_original_job(store):
+    job, created = store.submit("report", "alice", {"features": {"a": 1}}, "key-1")
+    replay, replay_created = store.submit("report", "alice", {"features": {"a": 1}}, "key-1")
+    assert created and not replay_created
+    assert replay["id"] == job["id"]
+
+    # Keys are scoped to the user
+    other, other_created = store.submit("report", "bob", {"features": {"a": 1}}, "key-1")
+    assert other_created and other["id"] != job["id"]
+
+def test_reused_key_with_a_different_request_conflicts(store):
+    store.submit("report", "alice", {"features": {"a": 1}}, "key-1")
+    with pytest.raises(HTTPException) as error:
+        store.submit("report", "alice", {"features": {"a": 2}}, "key-1")
+    assert error.value.status_code == 409
+
+    # A fingerprint stands in for randomized payloads such as encrypted fields
+    store.submit("report", "alice", {"history": "ciphertext-1"}, "key-2", fingerprint={"history": "plain"})
+    _, created = store.submit("report", "alice", {"history": "ciphertext-2"}, "key-2", fingerprint={"history": "plain"})
+    assert not created
+
+def test_full_queue_rejects_new_jobs(tmp_path, clock):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "spool"), max_queued=2, clock=clock)
+    store.submit("report", "alice", {"n": 1})
+    store.submit("report", "alice", {"n": 2}, "key")
+    with pytest.raises(HTTPException) as error:
+        store.submit("report", "alice", {"n": 3})
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"]
+
+    # Replays of known keys are still answered, and claimed jobs free up room
+    assert store.submit("report", "alice", {"n": 2}, "key")[1] is False
+    store.claim()
+    assert store.submit("report", "alice", {"n": 3})[1] is True
+
+def test_concurrent_claims_take_each_job_once(store):
+    for i in range(10):
+        store.submit("report", "alice", {"n": i})
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        claimed = list(pool.map(lambda _: store.claim(), range(16)))
+
+    ids = [job["id"] for job in claimed if job is not None]
+    assert len(ids) == 10 == len(set(ids))
+    assert store.count_by_status()[RUNNING] == 10
+
+def test_failed_attempts_are_retried_until_they_run_out(store):
+    job, _ = store.submit("predict", "alice", {"n": 1}, input_file=io.BytesIO(b"jpeg bytes"))
+    with open(store.spool_path(job["id"]), "rb") as f:
+        assert f.read() == b"jpeg bytes"
+
+    for attempt in range(1, 4):
+        claimed = store.claim()
+        assert claimed["attempts"] == attempt
+        assert store.fail(job["id"], "upstream timeout", attempt=attempt)
+        assert store.get(job["id"])["status"] == (QUEUED if attempt < 3 else FAILED)
+
+    assert store.claim() is None
+    assert store.get(job["id"])["error"] == "upstream timeout"
+    with pytest.raises(FileNotFoundError):
+        open(store.spool_path(job["id"]))
+
+def test_client_errors_fail_without_retrying(store):
+    job, _ = store.submit("report", "alice", {"n": 1})
+    claimed = store.claim()
+    store.fail(job["id"], "Invalid image file.", retry=False, attempt=claimed["attempts"])
+    assert store.get(job["id"])["status"] == FAILED
+
+def test_stale_jobs_are_requeued_unless_their_claim_is_refreshed(store, clock):
+    stale, _ = store.submit("report", "alice", {"n": 1})
+    alive, _ = store.submit("report", "alice", {"n": 2})
+    store.claim()
+    store.claim()
+
+    clock.now += 500
+    assert store.heartbeat(alive["id"], 1)
+    clock.now += 200
+    assert store.requeue_stale(stale_seconds=600) == 1
+    assert store.get(stale["id"])["status"] == QUEUED
+    assert store.get(alive["id"])["status"] == RUNNING
+
+    # The original worker lost its claim: it can neither refresh nor complete the job
+    reclaimed = store.claim()
+    assert reclaimed["id"] == stale["id"] and reclaimed["attempts"] == 2
+    assert not store.heartbeat(stale["id"], 1)
+    assert not store.complete(stale["id"], {"report": "first run"}, attempt=1)
+    assert not store.fail(stale["id"], "first run failed", attempt=1)
+    assert store.complete(stale["id"], {"report": "second run"}, attempt=2)
+    assert json.loads(store.get(stale["id"])["result"]) == {"report": "second run"}
+
+def test_stale_jobs_out_of_attempts_fail(tmp_path, clock):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "spool"), max_attempts=1, clock=clock)
+    job, _ = store.submit("report", "alice", {"n": 1})
+    store.claim()
+    clock.now += 601
+    assert store.requeue_stale(stale_seconds=600) == 1
+    assert store.get(job["id"])["status"] == FAILED
+
+def test_purge_drops_old_finished_jobs(store, clock):
+    done, _ = store.submit("report", "alice", {"n": 1})
+    waiting, _ = store.submit("report", "alice", {"n": 2})
+    store.complete(store.claim()["id"], {"report": "done"})
+    clock.now += 10
+    assert store.purge(retention_seconds=5) == 1
+    assert store.get(done["id"]) is None
+    assert store.get(waiting["id"])["status"] == QUEUED
+
+def test_worker_pool_heartbeats_long_jobs_and_completes_them(store):
+    store.clock = time.time
+    job, _ = store.submit("report", "alice", {"n": 1})
+
+    async def slow_handler(job_store, job):
+        await asyncio.sleep(0.2)
+        return {"severity_report": "low"}
+
+    pool = JobWorkerPool(store, {"report": slow_handler}, heartbeat_interval=0.02)
+    claimed = store.claim()
+    first_claim = claimed["claimed_at"]
+
+    async def run():
+        task = asyncio.create_task(pool._process(0, claimed))
+        await asyncio.sleep(0.1)
+        refreshed = store.get(job["id"])["claimed_at"]
+        await task
+        return refreshed
+
+    assert asyncio.run(run()) > first_claim
+    finished = store.get(job["id"])
+    assert finished["status"] == SUCCEEDED
+    assert json.loads(finished["result"]) == {"severity_report": "low"}
+
+def test_stopping_the_pool_releases_running_jobs(store):
+    job, _ = store.submit("report", "alice", {"n": 1})
+    started = threading.Event()
+
+    async def blocking_handler(job_store, job):
+        started.set()
+        await asyncio.sleep(60)
+
+    pool = JobWorkerPool(store, {"report": blocking_handler}, concurrency=1, poll_interval=0.01)
+
+    async def run():
+        pool.start()
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        await pool.stop()
+
+    asyncio.run(run())
+    released = store.get(job["id"])
+    assert released["status"] == QUEUED
+    assert released["attempts"] == 0
+
+def test_jobs_are_only_visible_to_their_owner(store, monkeypatch):
+    job, _ = store.submit("report", "alice", {"n": 1})
+    monkeypatch.setattr(jobs_routes, "job_store", store)
+    monkeypatch.setattr(firebase.token_cache, "verifier", lambda token: {"uid": token, "exp": 4 * 10 ** 9})
+    app = FastAPI()
+    app.include_router(jobs_routes.router)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            own = await client.get(f"/jobs/{job['id']}", headers={"Authorization": "Bearer alice"})
+            other = await client.get(f"/jobs/{job['id']}", headers={"Authorization": "Bearer bob"})
+            anonymous = await client.get(f"/jobs/{job['id']}")
+            return own, other, anonymous
+
+    try:
+        own, other, anonymous = asyncio.run(run())
+    finally:
+        firebase.token_cache.clear()
+
+    assert own.status_code == 200
+    assert own.json()["job_id"] == job["id"] and own.json()["status"] == QUEUED
+    assert other.status_code == 404
+    assert anonymous.status_code == 401
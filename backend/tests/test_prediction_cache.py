@@ -0,0 +1,37 @@
+from app.services.cache import PredictionCache
+from app.services.pipeline import prediction_cache_key
+
+ENTRY = {
+    "mask": b"\x89PNG mask",
+    "mask_content_type": "image/png",
+    "original_image_url": "https://storage.fake/procare-images/image/doctor-a_1700000000_original.jpg",
+    "mask_image_url": "https://storage.fake/procare-images/mask/doctor-a_1700000000_mask.png",
+    "features": {"lesion_area_ratio": 0.1},
+}
+
+def test_entries_are_not_shared_between_users():
+    digest = "ab" * 32
+    assert prediction_cache_key("doctor-a", digest, "v1") != prediction_cache_key("doctor-b", digest, "v1")
+    assert prediction_cache_key("doctor-a", digest, "v1") != prediction_cache_key("doctor-a", digest, "v2")
+    assert prediction_cache_key("doctor-a", digest, "v1") != prediction_cache_key("doctor-a", digest, "v1", True)
+
+    cache = PredictionCache(max_entries=4)
+    cache.put(PredictionCache.make_key("doctor-a", digest, "v1"), ENTRY)
+    assert cache.get(PredictionCache.make_key("doctor-a", digest, "v1")) == ENTRY
+    assert cache.get(PredictionCache.make_key("doctor-b", digest, "v1")) is None
+
+def test_disk_entries_survive_a_restart(tmp_path):
+    key = PredictionCache.make_key("doctor-a", "cd" * 32, "v1")
+    PredictionCache(max_entries=4, disk_dir=str(tmp_path)).put(key, ENTRY)
+    assert PredictionCache(max_entries=4, disk_dir=str(tmp_path)).get(key) == ENTRY
+
+def test_unserializable_entries_stay_in_memory_only(tmp_path):
+    key = PredictionCache.make_key("doctor-a", "ef" * 32, "v1")
+    entry = {**ENTRY, "features": {"lesion_area_ratio": object()}}
+    cache = PredictionCache(max_entries=4, disk_dir=str(tmp_path))
+
+    cache.put(key, entry)
+
+    assert cache.get(key) is entry
+    assert not list(tmp_path.rglob("*.tmp"))
+    assert not list(tmp_path.rglob("*.json"))
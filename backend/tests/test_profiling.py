@@ -0,0 +1,38 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+from app.utils import profiling
+
+def _request(path):
+    return SimpleNamespace(method="POST", url=SimpleNamespace(path=path))
+
+def test_profile_reports_overlapping_requests(monkeypatch, tmp_path, caplog):
+    # Profile only the first request; the second starts while it is in flight
+    samples = iter([True, False])
+    monkeypatch.setattr(profiling, "_should_profile", lambda: next(samples))
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+
+    async def run():
+        release = asyncio.Event()
+
+        async def slow(request):
+            await release.wait()
+            return "slow"
+
+        async def fast(request):
+            release.set()
+            return "fast"
+
+        return await asyncio.gather(
+            profiling.profile_requests(_request("/predict"), slow),
+            profiling.profile_requests(_request("/generate_report"), fast),
+        )
+
+    with caplog.at_level(logging.INFO):
+        assert asyncio.run(run()) == ["slow", "fast"]
+
+    profiles = list(tmp_path.glob("*_POST_predict.prof"))
+    assert len(profiles) == 1
+    assert "1 other request(s) overlapped it" in caplog.text
+    assert profiling._active_requests == 0
+    assert profiling._overlapping is None
@@ -0,0 +1,292 @@
+import json
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import pytest
+from app.services import openai as openai_module
+from app.services.openai import ReportService
+from benchmarks.fakes import fake_llm_transport
+
+FEATURES = {"lesion_area_ratio": 0.1}
+
+def _completion(report):
+    return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": report}}]})
+
+def _scripted_transport(responses):
+    """MockTransport answering with `responses` in order, recording each request."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        response = responses[min(len(requests), len(responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    return httpx.MockTransport(handler), requests
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Record backoff delays instead of waiting them out
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(openai_module.asyncio, "sleep", fake_sleep)
+    return delays
+
+def _generate(service, history="history"):
+    async def run():
+        try:
+            return await service.generate(FEATURES, 0.1, history)
+        finally:
+            await service.aclose()
+    return asyncio.run(run())
+
+def test_cache_hit_skips_the_upstream_call():
+    transport, requests = _scripted_transport([_completion("Severity: low.")])
+    service = ReportService(base_url="http://llm.test", transport=transport)
+
+    assert _generate(service) == "Severity: low."
+    assert _generate(service) == "Severity: low."
+    assert len(requests) == 1
+
+    # A different patient history is a different report
+    _generate(service, history="other history")
+    assert len(requests) == 2
+
+def test_retries_honour_retry_after(sleeps):
+    transport, requests = _scripted_transport([
+        httpx.Response(429, headers={"retry-after": "2"}),
+        httpx.Response(503),
+        _completion("Severity: moderate."),
+    ])
+    service = ReportService(base_url="http://llm.test", transport=transport, max_retries=3)
+
+    assert _generate(service) == "Severity: moderate."
+    assert len(requests) == 3
+    assert sleeps[0] == 2.0
+    # Without Retry-After the second attempt backs off exponentially with jitter
+    assert 1.0 <= sleeps[1] <= 2.0
+
+def test_retry_after_is_capped(sleeps):
+    transport, _ = _scripted_transport([
+        httpx.Response(429, headers={"retry-after": "3600"}),
+        _completion("Severity: low."),
+    ])
+    service = ReportService(base_url="http://llm.test", transport=transport, max_retry_after=5)
+
+    assert _generate(service) == "Severity: low."
+    assert sleeps == [5]
+
+def test_gives_up_after_the_last_attempt(sleeps):
+    transport, requests = _scripted_transport([httpx.Response(503)])
+    service = ReportService(base_url="http://llm.test", transport=transport, max_retries=2)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        _generate(service)
+    assert len(requests) == 3
+    assert len(sleeps) == 2
+
+    transport, requests = _scripted_transport([httpx.ConnectError("connection refused")])
+    service = ReportService(base_url="http://llm.test", transport=transport, max_retries=1)
+    with pytest.raises(httpx.ConnectError):
+        _generate(service)
+    assert len(requests) == 2
+
+def test_client_errors_are_not_retried(sleeps):
+    transport, requests = _scripted_transport([httpx.Response(400, json={"error": "bad request"})])
+    service = ReportService(base_url="http://llm.test", transport=transport)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        _generate(service)
+    assert len(requests) == 1
+    assert sleeps == []
+
+def test_concurrency_is_limited():
+    active = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return _completion("Severity: low.")
+
+    service = ReportService(base_url="http://llm.test", transport=httpx.MockTransport(handler), max_concurrency=2)
+
+    async def run():
+        try:
+            return await asyncio.gather(*(
+                service.generate(FEATURES, 0.1, f"history {i}") for i in range(6)
+            ))
+        finally:
+            await service.aclose()
+
+    assert asyncio.run(run()) == ["Severity: low."] * 6
+    assert peak == 2
+
+def test_stream_yields_chunks_in_order_and_caches_the_report():
+    report = "Severity: low. No significant lesion detected."
+    service = ReportService(base_url="http://llm.test", transport=fake_llm_transport(report))
+
+    async def run():
+        try:
+            chunks = [chunk async for chunk in service.stream(FEATURES, 0.1, "history")]
+            # The completed stream is served from the cache, in one piece
+            cached = [chunk async for chunk in service.stream(FEATURES, 0.1, "history")]
+            return chunks, cached
+        finally:
+            await service.aclose()
+
+    chunks, cached = asyncio.run(run())
+    assert chunks == [word + " " for word in report.split()]
+    assert cached == [report]
+
+def test_stream_requests_server_sent_events():
+    transport, requests = _scripted_transport([httpx.Response(
+        200,
+        content=b'data: {"choices": [{"delta": {"content": "Severity"}}]}\n\n'
+                b'data: {"choices": [{"delta": {}}]}\n\n'
+                b'data: {"choices": [{"delta": {"content": ": high."}}]}\n\n'
+                b"data: [DONE]\n\n",
+        headers={"content-type": "text/event-stream"},
+    )])
+    service = ReportService(base_url="http://llm.test", transport=transport)
+
+    async def run():
+        try:
+            return [chunk async for chunk in service.stream(FEATURES, 0.1, "history")]
+        finally:
+            await service.aclose()
+
+    assert asyncio.run(run()) == ["Severity", ": high."]
+    assert json.loads(requests[0].content)["stream"] is True
+
+class StubLLMServer:
+    """
+    Chat completions server on an ephemeral localhost port, answering each request
+    with the next step of `script` (the last step repeats). Each step is a function
+    taking the request handler. Requests are recorded with their headers and the
+    client's port, to see which connection they came in on.
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.requests.append({
+                    "path": self.path,
+                    "headers": dict(self.headers),
+                    "payload": payload,
+                    "port": self.client_address[1],
+                })
+                step = server.script[min(len(server.requests), len(server.script)) - 1]
+                try:
+                    step(self)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+def _reply(status, body=b"", headers=None, delay=0.0):
+    def step(handler):
+        if delay:
+            threading.Event().wait(delay)
+        handler.send_response(status)
+        for name, value in {"Content-Type": "application/json", **(headers or {})}.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+    return step
+
+def _completion_reply(report):
+    return _reply(200, json.dumps({"choices": [{"message": {"role": "assistant", "content": report}}]}).encode())
+
+def _sse_reply(deltas, gate=None):
+    # Chunked server-sent events; with `gate`, wait after the first event until the client saw it
+    def step(handler):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        events = [f"data: {json.dumps({'choices': [{'delta': {'content': delta}}]})}\n\n" for delta in deltas]
+        for index, event in enumerate([*events, "data: [DONE]\n\n"]):
+            data = event.encode()
+            handler.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            handler.wfile.flush()
+            if index == 0 and gate is not None:
+                gate.wait(5)
+        handler.wfile.write(b"0\r\n\r\n")
+        handler.wfile.flush()
+    return step
+
+def test_retries_over_a_real_connection():
+    script = [
+        _reply(503, headers={"Retry-After": "0"}),
+        _reply(429, headers={"Retry-After": "0"}),
+        _completion_reply("Severity: moderate."),
+    ]
+    with StubLLMServer(script) as server:
+        service = ReportService(base_url=server.base_url, api_key="test-key", max_retries=3)
+        assert _generate(service) == "Severity: moderate."
+
+    assert [request["path"] for request in server.requests] == ["/chat/completions"] * 3
+    assert server.requests[0]["headers"]["Authorization"] == "Bearer test-key"
+    # The pooled connection is reused for the retries
+    assert len({request["port"] for request in server.requests}) == 1
+
+def test_timed_out_requests_are_retried_over_a_real_connection(sleeps):
+    script = [
+        _reply(200, b"{}", delay=1.0),
+        _completion_reply("Severity: low."),
+    ]
+    with StubLLMServer(script) as server:
+        service = ReportService(base_url=server.base_url, api_key="test-key", timeout=0.2, max_retries=1)
+        assert _generate(service) == "Severity: low."
+    assert len(server.requests) == 2
+    assert len(sleeps) == 1
+
+def test_stream_arrives_incrementally_over_a_real_connection():
+    gate = threading.Event()
+    deltas = ["Severity", ": low", ". No lesion."]
+    with StubLLMServer([_sse_reply(deltas, gate)]) as server:
+        service = ReportService(base_url=server.base_url, api_key="test-key")
+
+        async def run():
+            chunks = []
+            try:
+                async for chunk in service.stream(FEATURES, 0.1, "history"):
+                    # The first event is read while the server still holds back the rest
+                    chunks.append(chunk)
+                    gate.set()
+            finally:
+                await service.aclose()
+            return chunks
+
+        assert asyncio.run(run()) == deltas
+    assert server.requests[0]["payload"]["stream"] is True
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from app.services import firebase
+from app.utils.config import SEARCH_INDEX_MAX_PREFIX
+from app.utils.search_index import name_index_fields, prefix_search_token
+
+class RecordingQuery:
+    """Firestore collection/query that records its filters and returns no documents."""
+
+    def __init__(self):
+        self.filters = []
+
+    def where(self, field, op, value):
+        self.filters.append((field, op, value))
+        return self
+
+    def order_by(self, field):
+        return self
+
+    def limit(self, count):
+        return self
+
+    def stream(self):
+        return iter([])
+
+def test_prefix_tokens_match_the_indexed_prefixes():
+    fields = name_index_fields("Jane  Doe")
+    assert prefix_search_token("JANE d") in fields["name_prefixes"]
+    assert prefix_search_token("jane x") not in fields["name_prefixes"]
+
+def test_prefixes_longer_than_the_index_are_rejected(monkeypatch):
+    long_prefix = "a" * (SEARCH_INDEX_MAX_PREFIX + 1)
+    with pytest.raises(ValueError):
+        prefix_search_token(long_prefix)
+
+    query = RecordingQuery()
+    monkeypatch.setattr(firebase, "get_db", lambda: SimpleNamespace(collection=lambda name: query))
+    monkeypatch.setattr(firebase, "firestore", SimpleNamespace(FieldPath=SimpleNamespace(document_id=lambda: "__name__")))
+    with pytest.raises(HTTPException) as error:
+        firebase.list_patients("doctor-a", long_prefix)
+    assert error.value.status_code == 400
+
+    # Exact matches and prefixes up to the indexed length still query the index
+    assert firebase.list_patients("doctor-a", long_prefix, match="exact") == ([], False)
+    assert firebase.list_patients("doctor-a", long_prefix[:-1]) == ([], False)
+    assert query.filters[-1][:2] == ("name_prefixes", "array_contains")
@@ -0,0 +1,123 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import FastAPI
+from app.services import firebase
+from app.services.token_cache import TokenCache
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class FakeVerifier:
+    """Accepts "<uid>:<exp>" tokens and counts the verifications."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, token):
+        self.calls += 1
+        uid, _, exp = token.partition(":")
+        if not uid:
+            raise ValueError("invalid token")
+        return {"uid": uid, "exp": float(exp or 4 * 10 ** 9)}
+
+def test_hit_within_ttl_skips_verification():
+    clock, verifier = FakeClock(), FakeVerifier()
+    cache = TokenCache(verifier, max_ttl=300, clock=clock)
+
+    assert cache.verify("alice")["uid"] == "alice"
+    clock.now += 299
+    assert cache.verify("alice")["uid"] == "alice"
+    assert verifier.calls == 1
+
+    # Past max_ttl the token is verified again
+    clock.now += 2
+    cache.verify("alice")
+    assert verifier.calls == 2
+
+def test_ttl_is_clamped_to_token_expiry():
+    clock, verifier = FakeClock(), FakeVerifier()
+    cache = TokenCache(verifier, max_ttl=300, clock=clock)
+    token = f"alice:{clock.now + 10}"
+
+    cache.verify(token)
+    clock.now += 9
+    cache.verify(token)
+    assert verifier.calls == 1
+
+    clock.now += 2
+    cache.verify(token)
+    assert verifier.calls == 2
+
+def test_expired_tokens_and_failures_are_not_cached():
+    clock, verifier = FakeClock(), FakeVerifier()
+    cache = TokenCache(verifier, clock=clock)
+
+    cache.verify(f"alice:{clock.now - 1}")
+    with pytest.raises(ValueError):
+        cache.verify(":")
+    assert len(cache) == 0
+
+def test_least_recently_used_token_is_evicted():
+    verifier = FakeVerifier()
+    cache = TokenCache(verifier, max_entries=2, clock=FakeClock())
+
+    cache.verify("alice")
+    cache.verify("bob")
+    cache.verify("alice")  # alice is now the most recently used
+    cache.verify("carol")  # evicts bob
+    assert len(cache) == 2
+    assert verifier.calls == 3
+
+    cache.verify("alice")
+    assert verifier.calls == 3
+    cache.verify("bob")
+    assert verifier.calls == 4
+
+def test_invalidate_user_drops_only_their_tokens():
+    verifier = FakeVerifier()
+    cache = TokenCache(verifier, clock=FakeClock())
+    cache.verify("alice:2000000000")
+    cache.verify("alice:2000000001")
+    cache.verify("bob")
+
+    cache.invalidate_user("alice")
+    assert len(cache) == 1
+    cache.verify("bob")
+    assert verifier.calls == 3
+
+def test_logout_revokes_and_invalidates_cached_tokens(monkeypatch):
+    from app.routes import prediction
+
+    verifier = FakeVerifier()
+    # monkeypatch restores the real verifier after the test
+    monkeypatch.setattr(firebase.token_cache, "verifier", verifier)
+    firebase.token_cache.clear()
+    revoked = []
+    monkeypatch.setattr(firebase, "init_firebase", lambda: None)
+    monkeypatch.setattr(firebase.auth, "revoke_refresh_tokens", lambda uid, app=None: revoked.append(uid))
+
+    app = FastAPI()
+    app.include_router(prediction.router)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # Cache a token, then log out with it
+            assert firebase.verify_firebase_token("alice") == {"uid": "alice", "exp": 4 * 10 ** 9}
+            response = await client.post("/logout", data={"firebase_token": "alice"})
+            assert response.status_code == 200
+            # The next request must verify the token again
+            firebase.verify_firebase_token("alice")
+
+    try:
+        asyncio.run(run())
+    finally:
+        firebase.token_cache.clear()
+
+    assert revoked == ["alice"]
+    assert verifier.calls == 2
@@ -0,0 +1,53 @@
+import io
+import asyncio
+import zipfile
+import tempfile
+import pytest
+from fastapi import HTTPException, UploadFile
+from app.routes import prediction
+from app.utils.uploads import spool_upload
+
+def _upload(content, filename="slice.jpg"):
+    file = tempfile.SpooledTemporaryFile()
+    file.write(content)
+    file.seek(0)
+    return UploadFile(file=file, filename=filename)
+
+def test_spool_upload_hashes_and_rewinds():
+    upload = _upload(b"image bytes")
+    digest = asyncio.run(spool_upload(upload, max_bytes=1024))
+    assert len(digest) == 64
+    assert upload.file.read() == b"image bytes"
+
+def test_rejected_uploads_are_closed():
+    too_large = _upload(b"x" * 2048)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(spool_upload(too_large, max_bytes=1024))
+    assert error.value.status_code == 413
+    assert too_large.file.closed
+
+    empty = _upload(b"")
+    with pytest.raises(HTTPException):
+        asyncio.run(spool_upload(empty, max_bytes=1024))
+    assert empty.file.closed
+
+def test_failed_archive_extraction_closes_spooled_members(monkeypatch):
+    archive_file = io.BytesIO()
+    with zipfile.ZipFile(archive_file, "w") as archive:
+        for name in ("a.jpg", "b.jpg", "c.jpg"):
+            archive.writestr(name, b"slice " + name.encode())
+
+    spooled = []
+    spool_member = prediction._spool_archive_member
+
+    def failing_spool(archive, info):
+        if info.filename == "c.jpg":
+            raise OSError("disk full")
+        spooled.append(spool_member(archive, info)[0])
+        return spooled[-1], "digest"
+
+    monkeypatch.setattr(prediction, "_spool_archive_member", failing_spool)
+    with pytest.raises(OSError):
+        prediction._extract_archive(archive_file)
+    assert len(spooled) == 2
+    assert all(file.closed for file in spooled)